@@ -0,0 +1,80 @@
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+# (system id, component id, message name)
+CacheKey = Tuple[int, int, str]
+
+
+@dataclass
+class CachedMessage:
+    message: Dict[str, Any]
+    # time.monotonic() timestamp of when mavlink2rest received the message
+    received_at: float
+    # Number of times a message was stored for this key
+    counter: int = 1
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.received_at
+
+
+def received_at(message: Dict[str, Any]) -> float:
+    """Get the time.monotonic() timestamp of when mavlink2rest received the message, from its status.
+
+    Messages without a status are considered received now.
+    """
+    now = time.monotonic()
+    try:
+        last_update_str = message["status"]["time"]["last_update"]
+        # drop sub-microsecond precision as it is not supported by datetime.fromisoformat
+        last_update = datetime.fromisoformat(re.sub(r"(\.\d{6})\d+", r"\1", last_update_str))
+    except (KeyError, TypeError, ValueError):
+        return now
+    if last_update.tzinfo is None:
+        last_update = last_update.replace(tzinfo=timezone.utc)
+    age = (datetime.now(timezone.utc) - last_update).total_seconds()
+    return now - max(age, 0.0)
+
+
+class MavlinkMessageCache:
+    """Latest-value store of MAVLink messages, keyed by vehicle, component and message name.
+
+    The age of a message counts from when mavlink2rest received it, so a message that mavlink2rest keeps
+    serving after the vehicle stopped sending it gets old instead of looking fresh on every request.
+    """
+
+    def __init__(self) -> None:
+        self._messages: Dict[CacheKey, CachedMessage] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def store(self, vehicle: int, component: int, message_name: str, message: Dict[str, Any]) -> None:
+        key = (vehicle, component, message_name.upper())
+        cached = self._messages.get(key)
+        if cached is None:
+            self._messages[key] = CachedMessage(message=message, received_at=received_at(message))
+            return
+        # mavlink2rest keeps serving the last message it got, so an identical one is not a new reception
+        if cached.message == message:
+            return
+        cached.message = message
+        cached.received_at = received_at(message)
+        cached.counter += 1
+
+    def get(self, vehicle: int, component: int, message_name: str, max_age: float) -> Optional[Dict[str, Any]]:
+        """Return the latest message for the key if it was received at most `max_age` seconds ago."""
+        cached = self._messages.get((vehicle, component, message_name.upper()))
+        if cached is None or cached.age > max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cached.message
+
+    def entry(self, vehicle: int, component: int, message_name: str) -> Optional[CachedMessage]:
+        return self._messages.get((vehicle, component, message_name.upper()))
+
+    def clear(self) -> None:
+        self._messages.clear()
@@ -3,8 +3,11 @@ import json
 import os
 import re
 import time
-from datetime import datetime
-from typing import Any, Dict, Optional
+from contextlib import aclosing
+from datetime import datetime, timezone
+from functools import cache
+from types import TracebackType
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple, Type
 
 import aiohttp
 from loguru import logger
@@ -14,15 +17,108 @@ from commonwealth.mavlink_comm.exceptions import (
     MavlinkMessageReceiveFail,
     MavlinkMessageSendFail,
 )
-from commonwealth.mavlink_comm.typedefs import MavlinkVehicleType
+from commonwealth.mavlink_comm.MavlinkCache import MavlinkMessageCache
+from commonwealth.mavlink_comm.MavlinkStream import MavlinkMessageStream
+from commonwealth.mavlink_comm.typedefs import MavlinkVehicleType, RequestStatistics
+
+
+@cache
+def is_vehicle_type(mavtype: str) -> bool:
+    return MavlinkVehicleType[mavtype].is_actually_a_vehicle()
+
+
+def heartbeat_last_update(heartbeat: Dict[str, Any]) -> datetime:
+    last_update_str = heartbeat["status"]["time"]["last_update"]
+    # drop sub-microsecond precision as it is not supported by datetime.fromisoformat
+    last_update_str = re.sub(r"(\.\d{6})\d+Z?", r"\1", last_update_str)
+    return datetime.fromisoformat(last_update_str)
 
 
 class MavlinkMessenger:
+    # pylint: disable=too-many-instance-attributes
+    # Maximum number of simultaneous connections kept with mavlink2rest
+    CONNECTION_POOL_LIMIT = 8
+    # Time, in seconds, that an idle connection is kept alive for reuse
+    KEEPALIVE_TIMEOUT = 30.0
+    # Time, in seconds, to use REST polling before trying the websocket again after it fails
+    WEBSOCKET_RETRY_INTERVAL = 30.0
+    # Minimum time, in seconds, between two vehicle id detections
+    VEHICLE_DETECTION_INTERVAL = 5.0
+    # Time, in seconds, after which the component index is rebuilt from the full /mavlink tree
+    COMPONENT_INDEX_TTL = 60.0
+    # Maximum number of messages of a batch being sent at the same time
+    MAX_IN_FLIGHT_MESSAGES = 4
+
     def __init__(self) -> None:
         self.system_id = int(os.environ.get("MAV_SYSTEM_ID", 1))
         self.component_id = int(os.environ.get("MAV_COMPONENT_ID_ONBOARD_COMPUTER4", 194))
         self.sequence = 0
         self.m2r_address = "localhost:6040"
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.statistics: Dict[str, RequestStatistics] = {}
+        self._streams: Dict[str, MavlinkMessageStream] = {}
+        self.cache = MavlinkMessageCache()
+        self._websocket_unavailable_until = 0.0
+        # Index of known (system id, component id) pairs, telling if the component is a vehicle
+        self._component_index: Dict[Tuple[int, int], bool] = {}
+        self._component_index_time = float("-inf")
+        self._last_vehicle_detection = float("-inf")
+        self._detected_vehicle_id = 1
+
+    async def __aenter__(self) -> "MavlinkMessenger":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Return the HTTP session shared by all requests to mavlink2rest, creating it on first use.
+
+        The session is bound to the event loop where it was created, so a new one is created if the
+        previous session was closed or if the messenger is now being used from a different loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.CONNECTION_POOL_LIMIT, keepalive_timeout=self.KEEPALIVE_TIMEOUT)
+            if self._session_loop is not None and self._session_loop is not loop:
+                # Streams started from a previous event loop can't be reused
+                self._stop_streams()
+                self._release_session()
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    def _release_session(self) -> None:
+        """Release the session of a previous event loop, which can't be awaited from the current one."""
+        if self._session is None or self._session.closed:
+            return
+        if self._session_loop is not None and self._session_loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._session_loop)
+        else:
+            # The connections were bound to the stopped loop, only the session itself is left to release
+            self._session.detach()
+        self._session = None
+
+    def _stop_streams(self) -> None:
+        for stream in self._streams.values():
+            stream.stop()
+        self._streams = {}
+
+    async def close(self) -> None:
+        self._stop_streams()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    def _record_request(self, kind: str, start_time: float, succeeded: bool) -> None:
+        self.statistics.setdefault(kind, RequestStatistics()).record(time.perf_counter() - start_time, succeeded)
 
     def set_system_id(self, system_id: int) -> None:
         logger.info(f"system_id set to: {system_id}")
@@ -43,73 +139,227 @@ class MavlinkMessenger:
     def m2r_rest_url(self) -> str:
         return f"http://{self.m2r_address}/mavlink"
 
-    async def get_all_mavlink(self) -> Any:
+    @property
+    def m2r_ws_url(self) -> str:
+        return f"ws://{self.m2r_address}/ws/mavlink"
+
+    async def _get_json(self, url: str, kind: str) -> Any:
+        """GET the url from mavlink2rest, returning None if there is no data available for it."""
         request_timeout = 1.0
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(self.m2r_rest_url, timeout=request_timeout) as response:
-                    if not response.status == 200:
-                        raise MavlinkMessageReceiveFail(f"Received status code of {response.status}.")
-                    message = await response.json()
-            except asyncio.exceptions.TimeoutError as error:
-                raise MavlinkMessageReceiveFail(f"Request timed out after {request_timeout} second.") from error
+        session = await self.session()
+        start_time = time.perf_counter()
+        succeeded = False
+        try:
+            async with session.get(url, timeout=request_timeout) as response:
+                if not response.status == 200:
+                    raise MavlinkMessageReceiveFail(f"Received status code of {response.status}.")
+                if await response.text() == "None":
+                    succeeded = True
+                    return None
+                message = await response.json()
+                succeeded = True
+        except asyncio.exceptions.TimeoutError as error:
+            raise MavlinkMessageReceiveFail(f"Request timed out after {request_timeout} second.") from error
+        finally:
+            self._record_request(kind, start_time, succeeded)
         return message
 
+    async def get_all_mavlink(self) -> Any:
+        return await self._get_json(self.m2r_rest_url, "get_all_mavlink")
+
     async def get_mavlink_message(
-        self, message_name: Optional[str] = None, vehicle: Optional[int] = None, component: Optional[int] = 1
+        self,
+        message_name: Optional[str] = None,
+        vehicle: Optional[int] = None,
+        component: Optional[int] = 1,
+        max_age: Optional[float] = None,
     ) -> Any:
+        """Fetch the latest message from mavlink2rest, or all messages of the component if no name is given.
+
+        If `max_age` is set, a cached message received at most `max_age` seconds ago is returned instead
+        of going through the network. Cached messages are only guaranteed to have the "message" key.
+        """
+        if message_name and component is not None and max_age is not None:
+            cached = self.cache.get(vehicle or self.system_id, component, message_name, max_age)
+            if cached is not None:
+                return cached
+
         request_url = f"{self.m2r_rest_url}/vehicles/{vehicle or self.system_id}/components/{component}/messages"
         if message_name:
             request_url += f"/{message_name.upper()}"
 
-        request_timeout = 1.0
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(request_url, timeout=request_timeout) as response:
-                    if not response.status == 200:
-                        raise MavlinkMessageReceiveFail(f"Received status code of {response.status}.")
-                    # if message is "None", try re-detecting systemid
-                    if await response.text() == "None":
-                        self.set_system_id(await self.get_most_recent_vehicle_id())
-                        raise MavlinkMessageReceiveFail("Received empty response")
-                    message = await response.json()
-            except asyncio.exceptions.TimeoutError as error:
-                raise MavlinkMessageReceiveFail(f"Request timed out after {request_timeout} second.") from error
+        message = await self._get_json(request_url, "get_mavlink_message")
+        # if message is "None", try re-detecting systemid
+        if message is None:
+            self.set_system_id(await self.get_most_recent_vehicle_id())
+            raise MavlinkMessageReceiveFail("Received empty response")
 
+        if message_name and component is not None:
+            self.cache.store(vehicle or self.system_id, component, message_name, message)
         return message
 
-    async def get_most_recent_vehicle_id(self) -> int:
+    def _index_heartbeat(self, vehicle: int, component: int, heartbeat: Dict[str, Any]) -> bool:
+        is_vehicle = is_vehicle_type(heartbeat["message"]["mavtype"]["type"])
+        self._component_index[(vehicle, component)] = is_vehicle
+        return is_vehicle
+
+    async def _rebuild_component_index(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Index every component from the full /mavlink tree, returning the HEARTBEATs of vehicles."""
         json_data = await self.get_all_mavlink()
-        most_recent_timestamp = datetime.min
-        most_recent_vehicle_id = None
+        self._component_index = {}
+        self._component_index_time = time.monotonic()
+        vehicle_heartbeats = []
         for vehicle_id, vehicle in json_data["vehicles"].items():
+            for component_id, component in vehicle["components"].items():
+                heartbeat = component["messages"].get("HEARTBEAT")
+                if heartbeat and self._index_heartbeat(int(vehicle_id), int(component_id), heartbeat):
+                    vehicle_heartbeats.append((int(vehicle_id), heartbeat))
+        return vehicle_heartbeats
 
-            for component in vehicle["components"].values():
-                if "HEARTBEAT" in component["messages"]:
-                    message = component["messages"]["HEARTBEAT"]
-                    # we are looking for vehicles, not GCSs or other components
-                    if not MavlinkVehicleType[message["message"]["mavtype"]["type"]].is_actually_a_vehicle():
-                        continue
-                    last_update_str = message["status"]["time"]["last_update"]
-                    # drop sub-microsecond precision as it is not supported by datetime.fromisoformat
-                    last_update_str = re.sub(r"(\.\d{6})\d+Z?", r"\1", last_update_str)
-                    last_update = datetime.fromisoformat(last_update_str)
-
-                    if last_update > most_recent_timestamp:
-                        most_recent_timestamp = last_update
-                        most_recent_vehicle_id = vehicle_id
+    async def _fetch_vehicle_heartbeats(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Fetch only the HEARTBEAT of each indexed vehicle component, dropping the ones that went away."""
+        vehicle_components = [key for key, is_vehicle in self._component_index.items() if is_vehicle]
+        responses = await asyncio.gather(
+            *[
+                self._get_json(
+                    f"{self.m2r_rest_url}/vehicles/{vehicle}/components/{component}/messages/HEARTBEAT", "get_heartbeat"
+                )
+                for vehicle, component in vehicle_components
+            ],
+            return_exceptions=True,
+        )
+        vehicle_heartbeats = []
+        for (vehicle, component), heartbeat in zip(vehicle_components, responses):
+            if heartbeat is None or isinstance(heartbeat, BaseException):
+                del self._component_index[(vehicle, component)]
+                continue
+            vehicle_heartbeats.append((vehicle, heartbeat))
+        return vehicle_heartbeats
+
+    async def get_most_recent_vehicle_id(self) -> int:
+        """Detect the system id of the vehicle that sent the most recent HEARTBEAT.
+
+        The full /mavlink tree is only downloaded to (re)build the component index, the rest of the time only
+        the HEARTBEAT of known vehicles is fetched. Detections are rate limited, returning the last result.
+        """
+        now = time.monotonic()
+        if now - self._last_vehicle_detection < self.VEHICLE_DETECTION_INTERVAL:
+            return self._detected_vehicle_id
+        self._last_vehicle_detection = now
+
+        index_expired = now - self._component_index_time > self.COMPONENT_INDEX_TTL
+        if index_expired or not any(self._component_index.values()):
+            vehicle_heartbeats = await self._rebuild_component_index()
+        else:
+            vehicle_heartbeats = await self._fetch_vehicle_heartbeats()
+
+        most_recent_timestamp = datetime.min
+        most_recent_vehicle_id = None
+        for vehicle_id, heartbeat in vehicle_heartbeats:
+            last_update = heartbeat_last_update(heartbeat)
+            if last_update > most_recent_timestamp:
+                most_recent_timestamp = last_update
+                most_recent_vehicle_id = vehicle_id
         if most_recent_vehicle_id:
             logger.debug(f"{most_recent_vehicle_id} (detected)")
-            return int(most_recent_vehicle_id)
+            self._detected_vehicle_id = most_recent_vehicle_id
+            return most_recent_vehicle_id
         logger.debug("no vehicle ID detected - using default (1)")
+        self._detected_vehicle_id = 1
         return 1
 
-    async def get_updated_mavlink_message(
+    async def subscribe(
+        self, message_name: str, vehicle: Optional[int] = None, component: Optional[int] = 1
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield every new message with the given name, as pushed by mavlink2rest's websocket.
+
+        A single websocket is kept per message name, and it is shared by all subscribers of this messenger.
+        Each yielded item has the "message" and "status" keys of the REST API, plus the "header" of the
+        websocket frame. Use `component=None` to receive the message from any component of the vehicle.
+        """
+        message_name = message_name.upper()
+        stream = self._streams.get(message_name)
+        if stream is None:
+            stream = MavlinkMessageStream(self.session, self.m2r_ws_url, message_name, self._cache_frame)
+            self._streams[message_name] = stream
+        queue = stream.add_consumer()
+        try:
+            while True:
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise MavlinkMessageReceiveFail(f"Websocket stream of {message_name} failed: {item}") from item
+                header = item["header"]
+                if header["system_id"] != (vehicle or self.system_id):
+                    continue
+                if component is not None and header["component_id"] != component:
+                    continue
+                yield item
+        finally:
+            stream.remove_consumer(queue)
+
+    def _cache_frame(self, frame: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a websocket frame to the format of the REST API, and cache it."""
+        header = frame["header"]
+        key = (header["system_id"], header["component_id"], frame["message"]["type"])
+        entry = self.cache.entry(*key)
+        message = {
+            "header": header,
+            "message": frame["message"],
+            "status": {
+                "time": {
+                    "counter": entry.counter + 1 if entry is not None else 1,
+                    # Same format as mavlink2rest, which has nanosecond precision
+                    "last_update": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f000Z"),
+                }
+            },
+        }
+        self.cache.store(*key, message)
+        if frame["message"]["type"] == "HEARTBEAT":
+            self._index_heartbeat(header["system_id"], header["component_id"], message)
+        return message
+
+    async def wait_for_message(
+        self, message_name: str, vehicle: Optional[int] = None, component: Optional[int] = 1, timeout: float = 5.0
+    ) -> Dict[str, Any]:
+        """Wait for the next message with the given name, raising asyncio.TimeoutError if it doesn't arrive."""
+
+        async def next_message() -> Dict[str, Any]:
+            async with aclosing(self.subscribe(message_name, vehicle, component)) as messages:
+                async for message in messages:
+                    return message
+            raise MavlinkMessageReceiveFail(f"Stream of {message_name} ended unexpectedly.")
+
+        return await asyncio.wait_for(next_message(), timeout)
+
+    async def get_updated_mavlink_message(  # pylint: disable=too-many-arguments
         self,
         message_name: str,
         vehicle: Optional[int] = None,
         component: int = 1,
         timeout: float = 10.0,
+        max_age: Optional[float] = None,
+    ) -> Any:
+        """Wait for a message newer than the call, or accept a cached one received at most `max_age` seconds ago."""
+        if max_age is not None:
+            cached = self.cache.get(vehicle or self.system_id, component, message_name, max_age)
+            if cached is not None:
+                return cached
+
+        if time.monotonic() >= self._websocket_unavailable_until:
+            try:
+                return await self.wait_for_message(message_name, vehicle, component, timeout / 2)
+            except asyncio.TimeoutError as error:
+                logger.warning(f"no new messages after {timeout/2} seconds, triggering system-id detection")
+                self.set_system_id(await self.get_most_recent_vehicle_id())
+                raise FetchUpdatedMessageFail(f"Did not receive an updated {message_name} before timeout.") from error
+            except MavlinkMessageReceiveFail as error:
+                logger.warning(f"{error}. Falling back to REST polling.")
+                self._websocket_unavailable_until = time.monotonic() + self.WEBSOCKET_RETRY_INTERVAL
+
+        return await self._poll_updated_mavlink_message(message_name, vehicle, component, timeout)
+
+    async def _poll_updated_mavlink_message(
+        self, message_name: str, vehicle: Optional[int], component: int, timeout: float
     ) -> Any:
         first_message = await self.get_mavlink_message(message_name, vehicle or self.system_id, component)
         first_message_counter = first_message["status"]["time"]["counter"]
@@ -127,20 +377,50 @@ class MavlinkMessenger:
 
         return new_message
 
-    async def send_mavlink_message(self, message: Dict[str, Any]) -> None:
-        mavlink2rest_package = {
-            "header": {"system_id": self.system_id, "component_id": self.component_id, "sequence": self.sequence},
+    def _package(self, message: Dict[str, Any], sequence: int) -> Dict[str, Any]:
+        return {
+            "header": {"system_id": self.system_id, "component_id": self.component_id, "sequence": sequence},
             "message": message,
         }
 
+    async def send_mavlink_message(self, message: Dict[str, Any]) -> None:
+        await self._post_package(self._package(message, self.sequence), "send_mavlink_message")
+
+    async def send_mavlink_messages(
+        self, messages: List[Dict[str, Any]], max_in_flight: Optional[int] = None
+    ) -> List[Optional[Exception]]:
+        """Send a batch of messages concurrently over the shared connection pool.
+
+        Messages get consecutive sequence numbers, starting from the current one, and at most `max_in_flight`
+        requests are pending at any time. Returns, for each message, None if it was sent or the error otherwise.
+        """
+        in_flight = asyncio.Semaphore(max_in_flight or self.MAX_IN_FLIGHT_MESSAGES)
+        packages = []
+        for message in messages:
+            packages.append(self._package(message, self.sequence))
+            self.sequence = (self.sequence + 1) % 256
+
+        async def send(package: Dict[str, Any]) -> None:
+            async with in_flight:
+                await self._post_package(package, "send_mavlink_messages")
+
+        results = await asyncio.gather(*[send(package) for package in packages], return_exceptions=True)
+        return [result if isinstance(result, Exception) else None for result in results]
+
+    async def _post_package(self, mavlink2rest_package: Dict[str, Any], kind: str) -> None:
         request_timeout = 1.0
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    self.m2r_rest_url, data=json.dumps(mavlink2rest_package), timeout=request_timeout
-                ) as response:
-                    if not response.status == 200:
-                        logger.warning(await response.text())
-                        raise MavlinkMessageSendFail(f"Received status code of {response.status}.")
-            except asyncio.exceptions.TimeoutError as error:
-                raise MavlinkMessageSendFail(f"Request timed out after {request_timeout} second.") from error
+        session = await self.session()
+        start_time = time.perf_counter()
+        succeeded = False
+        try:
+            async with session.post(
+                self.m2r_rest_url, data=json.dumps(mavlink2rest_package), timeout=request_timeout
+            ) as response:
+                if not response.status == 200:
+                    logger.warning(await response.text())
+                    raise MavlinkMessageSendFail(f"Received status code of {response.status}.")
+                succeeded = True
+        except asyncio.exceptions.TimeoutError as error:
+            raise MavlinkMessageSendFail(f"Request timed out after {request_timeout} second.") from error
+        finally:
+            self._record_request(kind, start_time, succeeded)
@@ -0,0 +1,98 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Union
+
+import aiohttp
+from loguru import logger
+
+StreamItem = Union[Dict[str, Any], Exception]
+
+
+class MavlinkMessageStream:
+    """Single mavlink2rest websocket connection for one message name, shared by any number of consumers.
+
+    Every frame received is pushed to the queue of each consumer. If the websocket cannot be used, the
+    error is pushed instead, so consumers can decide to fall back to the REST API. The websocket is kept
+    open for a while after the last consumer leaves, so messages that are waited for one at a time don't
+    reconnect on every wait.
+    """
+
+    # Number of frames kept for a consumer that is not reading fast enough, older ones are dropped
+    QUEUE_SIZE = 16
+    # Time, in seconds, to wait before reconnecting after the websocket fails
+    RECONNECT_DELAY = 1.0
+    # Time, in seconds, that the websocket is kept open without consumers
+    LINGER_TIME = 10.0
+
+    def __init__(
+        self,
+        session: Callable[[], Awaitable[aiohttp.ClientSession]],
+        url: str,
+        message_name: str,
+        on_message: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        Args:
+            on_message: Called with every frame received, consumers receive the frame it returns.
+        """
+        self._session = session
+        self.url = url
+        self.message_name = message_name
+        self._on_message = on_message
+        self._queues: Set[asyncio.Queue[StreamItem]] = set()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._linger: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def consumers(self) -> int:
+        return len(self._queues)
+
+    def add_consumer(self) -> asyncio.Queue[StreamItem]:
+        queue: asyncio.Queue[StreamItem] = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._queues.add(queue)
+        self._cancel_linger()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def remove_consumer(self, queue: asyncio.Queue[StreamItem]) -> None:
+        self._queues.discard(queue)
+        if not self._queues and self._linger is None:
+            self._linger = asyncio.get_running_loop().call_later(self.LINGER_TIME, self.stop)
+
+    def _cancel_linger(self) -> None:
+        if self._linger is not None:
+            self._linger.cancel()
+            self._linger = None
+
+    def stop(self) -> None:
+        self._cancel_linger()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _publish(self, item: StreamItem) -> None:
+        for queue in self._queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(item)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                session = await self._session()
+                async with session.ws_connect(self.url, params={"filter": f"^{self.message_name}$"}) as websocket:
+                    logger.debug(f"Streaming {self.message_name} from {self.url}.")
+                    async for frame in websocket:
+                        if frame.type == aiohttp.WSMsgType.TEXT:
+                            message = json.loads(frame.data)
+                            if self._on_message is not None:
+                                message = self._on_message(message)
+                            self._publish(message)
+                        elif frame.type == aiohttp.WSMsgType.ERROR:
+                            raise websocket.exception() or aiohttp.ClientError("Websocket error.")
+                raise aiohttp.ClientError("Websocket closed by mavlink2rest.")
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as error:
+                logger.debug(f"Failed to stream {self.message_name}: {error}")
+                self._publish(error)
+            await asyncio.sleep(self.RECONNECT_DELAY)
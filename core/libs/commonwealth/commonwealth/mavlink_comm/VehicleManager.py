@@ -12,6 +12,9 @@ from commonwealth.mavlink_comm.typedefs import (
 )
 
 MAV_MODE_FLAG_SAFETY_ARMED = 128
+# Age, in seconds, up to which a cached message is still good enough to be reused
+HEARTBEAT_MAX_AGE = 1.5
+AUTOPILOT_VERSION_MAX_AGE = 10.0
 
 
 class VehicleManager:
@@ -53,12 +56,18 @@ class VehicleManager:
         await self.mavlink2rest.send_mavlink_message(message)
 
     async def get_firmware_info(self) -> FirmwareInfo:
-        request_message = self.command_long_message(
-            "MAV_CMD_REQUEST_MESSAGE", [MavlinkMessageId.AUTOPILOT_VERSION.value]
+        cached_version = self.mavlink2rest.cache.get(
+            self.mavlink2rest.system_id, 1, MavlinkMessageId.AUTOPILOT_VERSION.name, AUTOPILOT_VERSION_MAX_AGE
         )
-        await self.mavlink2rest.send_mavlink_message(request_message)
+        if cached_version is None:
+            request_message = self.command_long_message(
+                "MAV_CMD_REQUEST_MESSAGE", [MavlinkMessageId.AUTOPILOT_VERSION.value]
+            )
+            await self.mavlink2rest.send_mavlink_message(request_message)
         try:
-            autopilot_version = await self.mavlink2rest.get_mavlink_message(MavlinkMessageId.AUTOPILOT_VERSION.name)
+            autopilot_version = cached_version or await self.mavlink2rest.get_mavlink_message(
+                MavlinkMessageId.AUTOPILOT_VERSION.name
+            )
             flight_sw_version_raw = autopilot_version["message"]["flight_sw_version"]
             major, minor, patch, version_type_raw = flight_sw_version_raw.to_bytes(4, byteorder="big")
             firmware_version = f"{major}.{minor}.{patch}"
@@ -72,7 +81,7 @@ class VehicleManager:
             raise ValueError("Failed to get autopilot version.") from Exception
 
     async def get_vehicle_type(self) -> MavlinkVehicleType:
-        heartbeat_message = await self.mavlink2rest.get_updated_mavlink_message("HEARTBEAT")
+        heartbeat_message = await self.mavlink2rest.get_updated_mavlink_message("HEARTBEAT", max_age=HEARTBEAT_MAX_AGE)
         return MavlinkVehicleType[heartbeat_message["message"]["mavtype"]["type"]]  # type: ignore
 
     async def get_firmware_vehicle_type(self) -> str:
@@ -89,7 +98,7 @@ class VehicleManager:
 
     async def is_heart_beating(self) -> bool:
         try:
-            await self.mavlink2rest.get_updated_mavlink_message("HEARTBEAT")
+            await self.mavlink2rest.get_updated_mavlink_message("HEARTBEAT", max_age=HEARTBEAT_MAX_AGE)
             return True
         except Exception as error:
             logger.error(f"Failed to check heartbeat. {error}")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Compare serial and pipelined COMMAND_LONG throughput against a local mavlink2rest stub.
+
+Usage: python -m commonwealth.mavlink_comm.tests.benchmark_MavlinkComm [--messages N] [--latency SECONDS]
+"""
+import argparse
+import asyncio
+import time
+
+from ..MavlinkComm import MavlinkMessenger
+from .mavlink2rest_stub import start_stub
+
+
+async def benchmark(messages_count: int, latency: float, max_in_flight: int) -> None:
+    messages = [{"type": "COMMAND_LONG", "param1": index} for index in range(messages_count)]
+    async for stub in start_stub(latency=latency):
+        async with MavlinkMessenger() as messenger:
+            messenger.set_m2r_address(stub.address)
+
+            start_time = time.perf_counter()
+            for message in messages:
+                await messenger.send_mavlink_message(message)
+            serial_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            results = await messenger.send_mavlink_messages(messages, max_in_flight)
+            pipelined_time = time.perf_counter() - start_time
+
+        failures = len([result for result in results if result is not None])
+        print(f"{messages_count} messages, {latency * 1000:.1f} ms stub latency, {max_in_flight} in flight")
+        print(f"serial:    {serial_time:.3f} s ({messages_count / serial_time:.1f} msg/s)")
+        print(f"pipelined: {pipelined_time:.3f} s ({messages_count / pipelined_time:.1f} msg/s), {failures} failures")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200, help="Number of messages sent in each mode.")
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated mavlink2rest processing time.")
+    parser.add_argument("--in-flight", type=int, default=MavlinkMessenger.MAX_IN_FLIGHT_MESSAGES)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.messages, args.latency, args.in_flight))
@@ -0,0 +1,79 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncGenerator, Dict, List
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+HEARTBEAT = {
+    "message": {
+        "type": "HEARTBEAT",
+        "mavtype": {"type": "MAV_TYPE_SUBMARINE"},
+        "base_mode": {"bits": 128},
+    },
+    "status": {"time": {"counter": 1, "last_update": "2024-01-01T00:00:00.000000000Z"}},
+}
+
+
+def mavlink2rest_time(time: datetime) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+
+
+class Mavlink2RestStub:
+    """Minimal mavlink2rest imitation serving a single vehicle with a single HEARTBEAT."""
+
+    def __init__(self, websocket: bool = True, latency: float = 0.0) -> None:
+        self.address = ""
+        # Simulated processing time, in seconds, of each POST
+        self.latency = latency
+        self.received: List[Dict[str, Any]] = []
+        self.heartbeat = json.loads(json.dumps(HEARTBEAT))
+        self.websockets: List[web.WebSocketResponse] = []
+        self.app = web.Application()
+        self.app.router.add_get("/mavlink", self.get_all)
+        self.app.router.add_get("/mavlink/vehicles/{vehicle}/components/{component}/messages/{name}", self.get_message)
+        self.app.router.add_post("/mavlink", self.post_message)
+        if websocket:
+            self.app.router.add_get("/ws/mavlink", self.websocket)
+
+    def tree(self) -> Dict[str, Any]:
+        return {"vehicles": {"1": {"components": {"1": {"messages": {"HEARTBEAT": self.heartbeat}}}}}}
+
+    async def get_all(self, _request: web.Request) -> web.Response:
+        return web.json_response(self.tree())
+
+    async def get_message(self, request: web.Request) -> web.Response:
+        if request.match_info["name"] != "HEARTBEAT":
+            return web.Response(text="None")
+        self.heartbeat["status"]["time"]["counter"] += 1
+        self.heartbeat["status"]["time"]["last_update"] = mavlink2rest_time(datetime.now(timezone.utc))
+        return web.json_response(self.heartbeat)
+
+    async def post_message(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        self.received.append(await request.json())
+        return web.Response(text="Ok.")
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.websockets.append(websocket)
+        async for _ in websocket:
+            pass
+        return websocket
+
+    async def push_heartbeat(self) -> None:
+        frame = {"header": {"system_id": 1, "component_id": 1, "sequence": 0}, "message": self.heartbeat["message"]}
+        for websocket in self.websockets:
+            if not websocket.closed:
+                await websocket.send_json(frame)
+
+
+async def start_stub(websocket: bool = True, latency: float = 0.0) -> AsyncGenerator[Mavlink2RestStub, None]:
+    stub = Mavlink2RestStub(websocket, latency)
+    server = TestServer(stub.app)
+    await server.start_server()
+    stub.address = f"{server.host}:{server.port}"
+    yield stub
+    await server.close()
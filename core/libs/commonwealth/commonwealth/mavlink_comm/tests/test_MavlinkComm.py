@@ -0,0 +1,174 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator
+
+import pytest
+
+from ..MavlinkCache import MavlinkMessageCache
+from ..MavlinkComm import MavlinkMessenger
+from .mavlink2rest_stub import (
+    HEARTBEAT,
+    Mavlink2RestStub,
+    mavlink2rest_time,
+    start_stub,
+)
+
+
+@pytest.fixture(name="stub")
+async def fixture_stub() -> AsyncGenerator[Mavlink2RestStub, None]:
+    async for running_stub in start_stub():
+        yield running_stub
+
+
+@pytest.fixture(name="rest_only_stub")
+async def fixture_rest_only_stub() -> AsyncGenerator[Mavlink2RestStub, None]:
+    async for running_stub in start_stub(websocket=False):
+        yield running_stub
+
+
+@pytest.mark.asyncio
+async def test_session_is_reused(stub: Mavlink2RestStub) -> None:
+    async with MavlinkMessenger() as messenger:
+        messenger.set_m2r_address(stub.address)
+        session = await messenger.session()
+        for _ in range(5):
+            message = await messenger.get_mavlink_message("HEARTBEAT")
+            assert message["message"]["type"] == "HEARTBEAT"
+        await messenger.send_mavlink_message({"type": "COMMAND_LONG"})
+        assert await messenger.session() is session
+
+        statistics = messenger.statistics
+        assert statistics["get_mavlink_message"].count == 5
+        assert statistics["get_mavlink_message"].failures == 0
+        assert statistics["send_mavlink_message"].count == 1
+        assert statistics["send_mavlink_message"].average_latency > 0
+
+    assert session.closed
+    assert stub.received[0]["message"]["type"] == "COMMAND_LONG"
+
+
+def test_session_follows_event_loop() -> None:
+    messenger = MavlinkMessenger()
+    first_session = asyncio.run(messenger.session())
+    second_session = asyncio.run(messenger.session())
+    # The session of the finished loop is released instead of being left open
+    assert first_session.closed
+    assert second_session is not first_session
+    asyncio.run(messenger.close())
+
+
+@pytest.mark.asyncio
+async def test_waiters_share_websocket(stub: Mavlink2RestStub) -> None:
+    async with MavlinkMessenger() as messenger:
+        messenger.set_m2r_address(stub.address)
+        waiters = [asyncio.create_task(messenger.get_updated_mavlink_message("HEARTBEAT")) for _ in range(3)]
+        while not stub.websockets:
+            await asyncio.sleep(0.01)
+        await stub.push_heartbeat()
+        messages = await asyncio.gather(*waiters)
+
+        assert all(message["message"]["base_mode"]["bits"] == 128 for message in messages)
+        # Frames follow the format of the REST API
+        assert all(message["status"]["time"]["counter"] == 1 for message in messages)
+        assert len(stub.websockets) == 1
+        assert "get_mavlink_message" not in messenger.statistics
+
+
+@pytest.mark.asyncio
+async def test_websocket_lingers(stub: Mavlink2RestStub) -> None:
+    async with MavlinkMessenger() as messenger:
+        messenger.set_m2r_address(stub.address)
+        for counter in [1, 2]:
+            waiter = asyncio.create_task(messenger.wait_for_message("HEARTBEAT"))
+            while not stub.websockets:
+                await asyncio.sleep(0.01)
+            # Give the subscription time to register before the frame is pushed
+            await asyncio.sleep(0.05)
+            await stub.push_heartbeat()
+            message = await waiter
+            assert message["status"]["time"]["counter"] == counter
+
+        # Waiting for messages one at a time doesn't reconnect the websocket
+        assert len(stub.websockets) == 1
+        assert not stub.websockets[0].closed
+
+
+@pytest.mark.asyncio
+async def test_updated_message_falls_back_to_polling(rest_only_stub: Mavlink2RestStub) -> None:
+    async with MavlinkMessenger() as messenger:
+        messenger.set_m2r_address(rest_only_stub.address)
+        message = await messenger.get_updated_mavlink_message("HEARTBEAT", timeout=1.0)
+        assert message["status"]["time"]["counter"] > HEARTBEAT["status"]["time"]["counter"]  # type: ignore
+        assert messenger.statistics["get_mavlink_message"].count >= 2
+
+
+@pytest.mark.asyncio
+async def test_cached_reads(stub: Mavlink2RestStub) -> None:
+    async with MavlinkMessenger() as messenger:
+        messenger.set_m2r_address(stub.address)
+        first = await messenger.get_mavlink_message("HEARTBEAT", max_age=10.0)
+        second = await messenger.get_mavlink_message("HEARTBEAT", max_age=10.0)
+        assert first is second
+        assert messenger.statistics["get_mavlink_message"].count == 1
+        assert messenger.cache.hits == 1
+
+        # Without tolerance the message always comes from mavlink2rest
+        third = await messenger.get_mavlink_message("HEARTBEAT")
+        assert third["status"]["time"]["counter"] > first["status"]["time"]["counter"]
+        entry = messenger.cache.entry(1, 1, "HEARTBEAT")
+        assert entry is not None and entry.counter == 2
+        assert await messenger.get_updated_mavlink_message("HEARTBEAT", max_age=10.0) is third
+
+
+def test_cache_uses_reception_time() -> None:
+    cache = MavlinkMessageCache()
+    # Messages that mavlink2rest received long ago are not fresh, even if they were just requested
+    cache.store(1, 1, "HEARTBEAT", HEARTBEAT)
+    assert cache.get(1, 1, "HEARTBEAT", max_age=10.0) is None
+
+    recent = json.loads(json.dumps(HEARTBEAT))
+    recent["status"]["time"]["last_update"] = mavlink2rest_time(datetime.now(timezone.utc) - timedelta(seconds=2))
+    cache.store(1, 1, "HEARTBEAT", recent)
+    assert cache.get(1, 1, "HEARTBEAT", max_age=10.0) is recent
+    assert cache.get(1, 1, "HEARTBEAT", max_age=1.0) is None
+
+
+@pytest.mark.asyncio
+async def test_vehicle_detection_uses_index(stub: Mavlink2RestStub) -> None:
+    async with MavlinkMessenger() as messenger:
+        messenger.set_m2r_address(stub.address)
+        assert await messenger.get_most_recent_vehicle_id() == 1
+        # Detections are rate limited
+        assert await messenger.get_most_recent_vehicle_id() == 1
+        assert messenger.statistics["get_all_mavlink"].count == 1
+
+        # Once indexed, only the HEARTBEAT of known vehicles is fetched
+        messenger._last_vehicle_detection = float("-inf")
+        assert await messenger.get_most_recent_vehicle_id() == 1
+        assert messenger.statistics["get_all_mavlink"].count == 1
+        assert messenger.statistics["get_heartbeat"].count == 1
+
+
+@pytest.mark.asyncio
+async def test_send_batch(stub: Mavlink2RestStub) -> None:
+    async with MavlinkMessenger() as messenger:
+        messenger.set_m2r_address(stub.address)
+        messenger.set_sequence(254)
+        messages = [{"type": "COMMAND_LONG", "param1": index} for index in range(4)]
+        assert await messenger.send_mavlink_messages(messages, max_in_flight=2) == [None] * 4
+        assert messenger.sequence == 2
+
+    sequences = {package["message"]["param1"]: package["header"]["sequence"] for package in stub.received}
+    assert sequences == {0: 254, 1: 255, 2: 0, 3: 1}
+
+
+@pytest.mark.asyncio
+async def test_send_batch_reports_failures() -> None:
+    async with MavlinkMessenger() as messenger:
+        # Nothing should be listening on this port
+        messenger.set_m2r_address("127.0.0.1:1")
+        results = await messenger.send_mavlink_messages([{"type": "COMMAND_LONG"}] * 2)
+        assert len(results) == 2
+        assert all(isinstance(result, Exception) for result in results)
+        assert messenger.statistics["send_mavlink_messages"].failures == 2
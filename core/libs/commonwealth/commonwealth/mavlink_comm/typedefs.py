@@ -122,3 +122,23 @@ class FirmwareInfo(BaseModel):
 class MavlinkMessageId(Enum):
     HEARTBEAT = 0
     AUTOPILOT_VERSION = 148
+
+
+class RequestStatistics(BaseModel):
+    count: int = 0
+    failures: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_latency: float = 0.0
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.count if self.count else 0.0
+
+    def record(self, latency: float, succeeded: bool) -> None:
+        self.count += 1
+        if not succeeded:
+            self.failures += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.last_latency = latency
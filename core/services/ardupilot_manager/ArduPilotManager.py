@@ -4,12 +4,11 @@ import pathlib
 import subprocess
 import time
 from copy import deepcopy
-from typing import Any, List, Optional, Set
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set
 
 import psutil
 from commonwealth.mavlink_comm.VehicleManager import VehicleManager
 from commonwealth.utils.Singleton import Singleton
-from elftools.elf.elffile import ELFFile
 from loguru import logger
 
 from exceptions import (
@@ -18,12 +17,14 @@ from exceptions import (
     NoDefaultFirmwareAvailable,
     NoPreferredBoardSet,
 )
+from firmware.FirmwareInspection import read_elf_info
 from firmware.FirmwareManagement import FirmwareManager
 from flight_controller_detector.Detector import Detector as BoardDetector
 from mavlink_proxy.Endpoint import Endpoint
 from mavlink_proxy.Manager import Manager as MavlinkManager
 from settings import Settings
 from typedefs import (
+    DownloadProgress,
     EndpointType,
     Firmware,
     FlightController,
@@ -34,15 +35,47 @@ from typedefs import (
     Serial,
     SITLFrame,
     Vehicle,
+    WatchdogStatus,
 )
 
 
+def process_exit(process: "subprocess.Popen[Any]") -> "asyncio.Future[Any]":
+    """Returns a future that is done as soon as "process" exits, with its exit code."""
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(process.pid)
+    except (AttributeError, OSError):
+        # Without pidfd (Linux < 5.3), a thread waits for the process instead
+        return asyncio.ensure_future(loop.run_in_executor(None, process.wait))
+
+    future: "asyncio.Future[Any]" = loop.create_future()
+
+    def on_exit() -> None:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+        if not future.done():
+            future.set_result(process.wait())
+
+    loop.add_reader(pidfd, on_exit)
+    return future
+
+
 class ArduPilotManager(metaclass=Singleton):
     # pylint: disable=too-many-instance-attributes
+    # Time, in seconds, between checks of the state when the firmware is not running
+    WATCHDOG_INTERVAL = 5.0
+
     def __init__(self) -> None:
         self.settings = Settings()
         self.settings.create_app_folders()
         self._current_board: Optional[FlightController] = None
+        self.watchdog_status = WatchdogStatus(
+            running=False, restarts=0, last_exit_code=None, last_exit_time=None, last_downtime=None, total_downtime=0
+        )
+        # Exit of the running firmware, by process id
+        self._process_exits: Dict[int, "asyncio.Future[Any]"] = {}
+        # Time of the exit being handled by the watchdog, kept until the firmware starts again
+        self._down_since: Optional[float] = None
 
         # Load settings and do the initial configuration
         if self.settings.load():
@@ -63,7 +96,10 @@ class ArduPilotManager(metaclass=Singleton):
         self._load_endpoints()
         self.ardupilot_subprocess: Optional[Any] = None
         self.firmware_manager = FirmwareManager(
-            self.settings.firmware_folder, self.settings.defaults_folder, self.settings.user_firmware_folder
+            self.settings.firmware_folder,
+            self.settings.defaults_folder,
+            self.settings.user_firmware_folder,
+            self.settings.cache_folder,
         )
         self.vehicle_manager = VehicleManager()
 
@@ -89,27 +125,64 @@ class ArduPilotManager(metaclass=Singleton):
         except Exception as error:
             logger.warning(f"Failed to remove logs: {error}")
 
+    async def wait_ardupilot_exit(self, timeout: float) -> None:
+        """Waits for the firmware subprocess to exit, for up to "timeout" seconds."""
+        process = self.ardupilot_subprocess
+        if process is None or process.poll() is not None:
+            await asyncio.sleep(timeout)
+            return
+        if process.pid not in self._process_exits:
+            self._process_exits = {process.pid: process_exit(process)}
+        await asyncio.wait({self._process_exits[process.pid]}, timeout=timeout)
+
     async def auto_restart_ardupilot(self) -> None:
-        """Auto-restart Ardupilot when it's not running but was supposed to."""
+        """Auto-restart Ardupilot when it's not running but was supposed to.
+
+        The firmware subprocess is watched through its handle, so exits are handled as soon as they happen,
+        without going through the process table. It is only scanned once, to remove processes left behind
+        by a previous run.
+        """
+        try:
+            await self.prune_orphan_ardupilot_processes()
+        except Exception as error:
+            logger.warning(f"Could not prune orphan Ardupilot processes: {error}")
         while True:
-            process_not_running = (
-                self.ardupilot_subprocess is not None and self.ardupilot_subprocess.poll() is not None
-            ) or len(self.running_ardupilot_processes()) == 0
+            await self.wait_ardupilot_exit(self.WATCHDOG_INTERVAL)
+            process_not_running = self.ardupilot_subprocess is None or self.ardupilot_subprocess.poll() is not None
             needs_restart = self.should_be_running and (
                 self.current_board is None
                 or (self.current_board.type in [PlatformType.SITL, PlatformType.Linux] and process_not_running)
             )
             if needs_restart:
-                logger.debug("Restarting ardupilot...")
-                try:
-                    await self.kill_ardupilot()
-                except Exception as error:
-                    logger.warning(f"Could not kill Ardupilot: {error}")
-                try:
-                    await self.start_ardupilot()
-                except Exception as error:
-                    logger.warning(f"Could not start Ardupilot: {error}")
-            await asyncio.sleep(5.0)
+                await self.watchdog_restart()
+
+    def get_watchdog_status(self) -> WatchdogStatus:
+        process = getattr(self, "ardupilot_subprocess", None)
+        return self.watchdog_status.copy(update={"running": process is not None and process.poll() is None})
+
+    async def watchdog_restart(self) -> None:
+        status = self.watchdog_status
+        if self._down_since is None:
+            # Failed restarts are retried from the same exit, so the downtime includes them
+            self._down_since = time.time()
+            if self.ardupilot_subprocess is not None and self.ardupilot_subprocess.returncode is not None:
+                status.last_exit_code = self.ardupilot_subprocess.returncode
+                logger.warning(f"Ardupilot exited with code {status.last_exit_code}.")
+            status.last_exit_time = self._down_since
+        logger.debug("Restarting ardupilot...")
+        try:
+            await self.kill_ardupilot()
+        except Exception as error:
+            logger.warning(f"Could not kill Ardupilot: {error}")
+        try:
+            await self.start_ardupilot()
+            status.restarts += 1
+            status.last_downtime = time.time() - self._down_since
+            status.total_downtime += status.last_downtime
+            self._down_since = None
+            logger.info(f"Ardupilot restarted after {status.last_downtime:.1f} seconds (restart {status.restarts}).")
+        except Exception as error:
+            logger.warning(f"Could not start Ardupilot: {error}")
 
     async def start_mavlink_manager_watchdog(self) -> None:
         await self.mavlink_manager.auto_restart_router()
@@ -129,17 +202,7 @@ class ArduPilotManager(metaclass=Singleton):
 
     @staticmethod
     def firmware_has_debug_symbols(firmware_path: pathlib.Path) -> bool:
-        with open(firmware_path, "rb") as f:
-            elffile = ELFFile(f)
-
-            for section in elffile.iter_sections():
-                if section.name.startswith(".debug_line"):
-                    # 100k is Empirical data. non-debug binaries seem to have around 700 entries here,
-                    # while debug ones have 28 million entries
-                    if section.header.sh_size > 100000:
-                        return True
-                    return False
-        return False
+        return read_elf_info(firmware_path).has_debug_symbols
 
     def update_serials(self, serials: List[Serial]) -> None:
         self.configuration["serials"] = [vars(serial) for serial in serials]
@@ -297,7 +360,7 @@ class ArduPilotManager(metaclass=Singleton):
     async def start_sitl(self) -> None:
         self._current_board = BoardDetector.detect_sitl()
         if not self.firmware_manager.is_firmware_installed(self._current_board):
-            self.firmware_manager.install_firmware_from_params(Vehicle.Sub, self._current_board)
+            await self.firmware_manager.install_firmware_from_params(Vehicle.Sub, self._current_board)
         frame = self.settings.sitl_frame
         if frame == SITLFrame.UNDEFINED:
             frame = SITLFrame.VECTORED
@@ -441,6 +504,21 @@ class ArduPilotManager(metaclass=Singleton):
         real_boards.sort(key=lambda board: board.platform)
         return real_boards[0]
 
+    async def prune_orphan_ardupilot_processes(self) -> None:
+        """Kill Ardupilot processes that were not started by this manager."""
+        own_processes = set()
+        if self.ardupilot_subprocess is not None:
+            try:
+                own_process = psutil.Process(self.ardupilot_subprocess.pid)
+                # Firmwares started with gdbserver are its children
+                own_processes = {own_process.pid, *[child.pid for child in own_process.children(recursive=True)]}
+            except psutil.NoSuchProcess:
+                pass
+        orphans = [process for process in self.running_ardupilot_processes() if process.pid not in own_processes]
+        if orphans:
+            logger.warning(f"Found Ardupilot processes left behind: {[process.pid for process in orphans]}")
+            await self.prune_ardupilot_processes(orphans)
+
     def running_ardupilot_processes(self) -> List[psutil.Process]:
         """Return list of all Ardupilot process running on system."""
 
@@ -467,9 +545,9 @@ class ArduPilotManager(metaclass=Singleton):
             raise ArdupilotProcessKillFail("Could not terminate Ardupilot subprocess.")
         logger.warning("Ardupilot subprocess already not running.")
 
-    async def prune_ardupilot_processes(self) -> None:
-        """Kill all system processes using Ardupilot's firmware file."""
-        for process in self.running_ardupilot_processes():
+    async def prune_ardupilot_processes(self, processes: Optional[List[psutil.Process]] = None) -> None:
+        """Kill all system processes using Ardupilot's firmware file, or only the given ones."""
+        for process in self.running_ardupilot_processes() if processes is None else processes:
             try:
                 logger.debug(f"Killing Ardupilot process {process.name()}::{process.pid}.")
                 process.kill()
@@ -571,21 +649,21 @@ class ArduPilotManager(metaclass=Singleton):
         logger.info(f"Adding endpoints {[e.name for e in new_endpoints]} and updating settings file.")
         self.mavlink_manager.add_endpoints(new_endpoints)
         self._save_current_endpoints()
-        await self.mavlink_manager.restart()
+        await self.mavlink_manager.reconfigure()
 
     async def remove_endpoints(self, endpoints_to_remove: Set[Endpoint]) -> None:
         """Remove multiple endpoints from the mavlink manager and save them on the configuration file."""
         logger.info(f"Removing endpoints {[e.name for e in endpoints_to_remove]} and updating settings file.")
         self.mavlink_manager.remove_endpoints(endpoints_to_remove)
         self._save_current_endpoints()
-        await self.mavlink_manager.restart()
+        await self.mavlink_manager.reconfigure()
 
     async def update_endpoints(self, endpoints_to_update: Set[Endpoint]) -> None:
         """Update multiple endpoints from the mavlink manager and save them on the configuration file."""
         logger.info(f"Modifying endpoints {[e.name for e in endpoints_to_update]} and updating settings file.")
         self.mavlink_manager.update_endpoints(endpoints_to_update)
         self._save_current_endpoints()
-        await self.mavlink_manager.restart()
+        await self.mavlink_manager.reconfigure()
 
     def get_available_firmwares(self, vehicle: Vehicle, platform: Platform) -> List[Firmware]:
         return self.firmware_manager.get_available_firmwares(vehicle, platform)
@@ -595,14 +673,26 @@ class ArduPilotManager(metaclass=Singleton):
     ) -> None:
         self.firmware_manager.install_firmware_from_file(firmware_path, board, default_parameters)
 
-    def install_firmware_from_url(
+    def download_firmware(self, url: str) -> AsyncGenerator[DownloadProgress, None]:
+        return self.firmware_manager.download_firmware(url)
+
+    async def install_firmware_from_url(
         self,
         url: str,
         board: FlightController,
         make_default: bool = False,
         default_parameters: Optional[Parameters] = None,
     ) -> None:
-        self.firmware_manager.install_firmware_from_url(url, board, make_default, default_parameters)
+        await self.firmware_manager.install_firmware_from_url(url, board, make_default, default_parameters)
+
+    async def install_downloaded_firmware(
+        self,
+        download: DownloadProgress,
+        board: FlightController,
+        make_default: bool = False,
+        default_parameters: Optional[Parameters] = None,
+    ) -> None:
+        await self.firmware_manager.install_downloaded_firmware(download, board, make_default, default_parameters)
 
     def restore_default_firmware(self, board: FlightController) -> None:
         self.firmware_manager.restore_default_firmware(board)
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import re
+import ssl
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import AsyncGenerator, Dict, Optional, Tuple
+
+import aiohttp
+from loguru import logger
+
+from exceptions import FirmwareDownloadFail
+from typedefs import DownloadProgress
+
+
+@dataclass
+class CachedFile:
+    sha256: str
+    size: int
+    # Build of the file in the manifest, cached files of the same build are used without asking the server
+    revision: Optional[str]
+    etag: Optional[str]
+    last_used: float
+
+
+@dataclass
+class PartialDownload:
+    # ETag or Last-Modified of the response, used to check that a resumed download is still the same file
+    validator: Optional[str]
+    total: Optional[int]
+
+
+def content_range_total(content_range: Optional[str]) -> Optional[int]:
+    """Get the complete size from a Content-Range header, like "bytes 100-199/200"."""
+    match = re.fullmatch(r"bytes \d+-\d+/(\d+)", content_range or "")
+    return int(match.group(1)) if match else None
+
+
+class FirmwareCache:
+    """Content-addressed cache of downloaded firmware files.
+
+    Files are stored by their SHA256, with an index from each URL to its file. Downloads are written to a
+    partial file that is resumed with a Range request when the connection drops, even across restarts, and
+    are only added to the cache when their size matches the one announced by the server.
+    """
+
+    # Size, in bytes, of the blocks read from the network and from the disk
+    CHUNK_SIZE = 256 * 1024
+    # Time, in seconds, between progress reports
+    PROGRESS_INTERVAL = 0.5
+    # Times a dropped download is resumed before giving up
+    RETRIES = 5
+    # Time, in seconds, before resuming a dropped download, multiplied by the number of the attempt
+    RETRY_DELAY = 2.0
+    # Time, in seconds, without receiving data before the connection is considered dropped
+    READ_TIMEOUT = 60
+    # Files kept in the cache, the least recently used ones are removed first
+    MAX_FILES = 10
+
+    def __init__(self, folder: pathlib.Path) -> None:
+        self.folder = folder
+        self.index_path = pathlib.Path.joinpath(folder, "index.json")
+        self.partial_folder = pathlib.Path.joinpath(folder, "partial")
+        self.index: Dict[str, CachedFile] = {}
+        # Downloads of the same URL share the partial file, so they run one at a time
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as file:
+                self.index = {url: CachedFile(**entry) for url, entry in json.load(file).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, TypeError, ValueError) as error:
+            logger.warning(f"Ignoring invalid firmware cache index: {error}")
+
+    def _save_index(self) -> None:
+        temporary_path = self.index_path.with_name(f"{self.index_path.name}.tmp")
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({url: asdict(entry) for url, entry in self.index.items()}, file)
+        os.replace(temporary_path, self.index_path)
+
+    @staticmethod
+    def file_sha256(path: pathlib.Path) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(FirmwareCache.CHUNK_SIZE):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def file_path(self, sha256: str) -> pathlib.Path:
+        return pathlib.Path.joinpath(self.folder, sha256)
+
+    def _partial_paths(self, url: str) -> Tuple[pathlib.Path, pathlib.Path]:
+        name = hashlib.sha256(url.encode()).hexdigest()
+        return (
+            pathlib.Path.joinpath(self.partial_folder, name),
+            pathlib.Path.joinpath(self.partial_folder, f"{name}.json"),
+        )
+
+    def _cached_file(self, url: str) -> Optional[CachedFile]:
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        try:
+            if self.file_path(entry.sha256).stat().st_size == entry.size:
+                return entry
+        except FileNotFoundError:
+            pass
+        del self.index[url]
+        return None
+
+    def _use(self, url: str, entry: CachedFile) -> DownloadProgress:
+        entry.last_used = time.time()
+        self._save_index()
+        return DownloadProgress(
+            url=url, downloaded=entry.size, total=entry.size, path=str(self.file_path(entry.sha256)), cached=True
+        )
+
+    def _evict(self) -> None:
+        for url, _entry in sorted(self.index.items(), key=lambda item: item[1].last_used)[: -self.MAX_FILES]:
+            del self.index[url]
+        used_files = {entry.sha256 for entry in self.index.values()}
+        for path in self.folder.iterdir():
+            if path.is_file() and re.fullmatch(r"[0-9a-f]{64}", path.name) and path.name not in used_files:
+                logger.debug(f"Removing {path} from the firmware cache.")
+                path.unlink()
+
+    async def fetch(self, url: str, revision: Optional[str] = None) -> AsyncGenerator[DownloadProgress, None]:
+        """Download a file to the cache, reporting the progress. The last report has the path of the file.
+
+        Args:
+            url (str): Url to download the file.
+            revision (str, optional): Build of the file, when known. Files cached for the same build are used
+                without contacting the server, others are revalidated with their ETag. Cached files are also used
+                when the server can't be reached.
+        """
+        async with self._locks[url]:
+            entry = self._cached_file(url)
+            if entry is not None and revision is not None and entry.revision == revision:
+                yield self._use(url, entry)
+                return
+
+            self.partial_folder.mkdir(parents=True, exist_ok=True)
+            timeout = aiohttp.ClientTimeout(sock_connect=30, sock_read=self.READ_TIMEOUT)
+            # Follows the SSL verification of urllib, which FirmwareDownload may disable
+            https_context = ssl._create_default_https_context()
+            connector = aiohttp.TCPConnector(ssl=https_context)
+            async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+                attempt = 0
+                answered = False
+                while True:
+                    try:
+                        async for progress in self._download(session, url, revision):
+                            answered = True
+                            yield progress
+                        return
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                        attempt += 1
+                        entry = self._cached_file(url)
+                        if entry is not None and (not answered or attempt > self.RETRIES):
+                            # The server can't be reached, the cached copy of the url is used instead
+                            logger.warning(f"Could not download {url} ({error}), using the cached copy.")
+                            yield self._use(url, entry)
+                            return
+                        if attempt > self.RETRIES:
+                            raise FirmwareDownloadFail("Could not download firmware file.") from error
+                        logger.warning(
+                            f"Download of {url} failed ({error}), resuming in {attempt * self.RETRY_DELAY}s."
+                        )
+                        await asyncio.sleep(attempt * self.RETRY_DELAY)
+
+    def _request_headers(self, url: str, entry: Optional[CachedFile]) -> Tuple[Dict[str, str], int]:
+        """Get the headers to resume or revalidate the download, with the offset it is resumed from."""
+        partial_path, state_path = self._partial_paths(url)
+        state = PartialDownload(validator=None, total=None)
+        try:
+            state = PartialDownload(**json.loads(state_path.read_text(encoding="utf-8")))
+        except (OSError, TypeError, ValueError):
+            pass
+
+        # Compressed transfers would change the size and the offsets of the file
+        headers = {"Accept-Encoding": "identity"}
+        offset = partial_path.stat().st_size if partial_path.exists() and state.validator else 0
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            # The server sends the whole file if it changed since the partial download started
+            headers["If-Range"] = str(state.validator)
+        elif entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        return headers, offset
+
+    def _start_partial(self, url: str, response: aiohttp.ClientResponse, offset: int) -> Tuple[int, Optional[int]]:
+        """Check the response and save its state, returning the offset it starts from and the total size."""
+        partial_path, state_path = self._partial_paths(url)
+        if response.status == 416:
+            # The partial file is not part of the current file anymore
+            partial_path.unlink()
+            response.raise_for_status()
+        if response.status >= 500:
+            response.raise_for_status()
+        if response.status not in [200, 206]:
+            raise FirmwareDownloadFail(f"Could not download firmware file, server answered {response.status}.")
+
+        if response.status == 206:
+            logger.info(f"Resuming download of {url} from {offset} bytes.")
+            total = content_range_total(response.headers.get("Content-Range"))
+        else:
+            offset = 0
+            total = response.content_length
+        state = PartialDownload(
+            validator=response.headers.get("ETag") or response.headers.get("Last-Modified"), total=total
+        )
+        state_path.write_text(json.dumps(asdict(state)), encoding="utf-8")
+        return offset, total
+
+    async def _write_partial(
+        self, url: str, response: aiohttp.ClientResponse, offset: int, total: Optional[int]
+    ) -> AsyncGenerator[DownloadProgress, None]:
+        partial_path, _state_path = self._partial_paths(url)
+        downloaded = offset
+        last_report_time = time.monotonic()
+        yield DownloadProgress(url=url, downloaded=downloaded, total=total)
+        with open(partial_path, "ab" if offset else "wb") as file:
+            async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                file.write(chunk)
+                downloaded += len(chunk)
+                if time.monotonic() - last_report_time > self.PROGRESS_INTERVAL:
+                    last_report_time = time.monotonic()
+                    yield DownloadProgress(url=url, downloaded=downloaded, total=total)
+
+        if total is not None and downloaded != total:
+            raise aiohttp.ClientPayloadError(f"Connection closed after {downloaded} of {total} bytes.")
+
+    async def _add_to_cache(self, url: str, revision: Optional[str], etag: Optional[str]) -> DownloadProgress:
+        partial_path, state_path = self._partial_paths(url)
+        size = partial_path.stat().st_size
+        sha256 = await asyncio.get_running_loop().run_in_executor(None, self.file_sha256, partial_path)
+        os.replace(partial_path, self.file_path(sha256))
+        state_path.unlink()
+        self.index[url] = CachedFile(sha256=sha256, size=size, revision=revision, etag=etag, last_used=time.time())
+        self._evict()
+        self._save_index()
+        logger.info(f"Downloaded {url} ({size} bytes, sha256 {sha256}).")
+        return DownloadProgress(url=url, downloaded=size, total=size, path=str(self.file_path(sha256)))
+
+    async def _download(
+        self, session: aiohttp.ClientSession, url: str, revision: Optional[str]
+    ) -> AsyncGenerator[DownloadProgress, None]:
+        entry = self._cached_file(url)
+        headers, offset = self._request_headers(url, entry)
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and entry is not None:
+                entry.revision = revision
+                yield self._use(url, entry)
+                return
+            offset, total = self._start_partial(url, response, offset)
+            async for progress in self._write_partial(url, response, offset, total):
+                yield progress
+        yield await self._add_to_cache(url, revision, response.headers.get("ETag"))
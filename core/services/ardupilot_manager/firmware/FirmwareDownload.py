@@ -1,27 +1,21 @@
-import gzip
-import json
+import asyncio
 import os
 import pathlib
 import random
+import shutil
 import ssl
 import string
 import tempfile
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncGenerator, Dict, List, Optional
 from urllib.parse import urlparse
-from urllib.request import urlopen, urlretrieve
 
-from commonwealth.utils.decorators import temporary_cache
 from loguru import logger
 from packaging.version import Version
 
-from exceptions import (
-    FirmwareDownloadFail,
-    InvalidManifest,
-    ManifestUnavailable,
-    NoCandidate,
-    NoVersionAvailable,
-)
-from typedefs import FirmwareFormat, Platform, PlatformType, Vehicle
+from exceptions import FirmwareDownloadFail, NoCandidate, NoVersionAvailable
+from firmware.FirmwareCache import FirmwareCache
+from firmware.FirmwareManifest import Manifest, ManifestCache
+from typedefs import DownloadProgress, FirmwareFormat, Platform, PlatformType, Vehicle
 
 # TODO: This should be not necessary
 # Disable SSL verification
@@ -37,8 +31,12 @@ class FirmwareDownloader:
         PlatformType.Linux: FirmwareFormat.ELF,
     }
 
-    def __init__(self) -> None:
-        self._manifest: Dict[str, Any] = {}
+    def __init__(self, cache_folder: Optional[pathlib.Path] = None) -> None:
+        # Without a cache folder, the manifest is only kept in memory and the firmwares in the temporary folder
+        self._manifest_cache = ManifestCache(FirmwareDownloader._manifest_remote, cache_folder)
+        self._firmware_cache = FirmwareCache(
+            pathlib.Path.joinpath(cache_folder or pathlib.Path(tempfile.gettempdir()), "firmware")
+        )
 
     @staticmethod
     def _generate_random_filename(length: int = 16) -> pathlib.Path:
@@ -55,52 +53,75 @@ class FirmwareDownloader:
         folder = pathlib.Path(tempfile.gettempdir()).absolute()
         return pathlib.Path.joinpath(folder, filename)
 
-    @staticmethod
-    def _download(url: str) -> pathlib.Path:
-        """Download a specific file for a temporary location.
+    async def fetch(self, url: str) -> AsyncGenerator[DownloadProgress, None]:
+        """Download a specific file to the cache, reporting the progress.
+
+        Files of a manifest build that was already downloaded come straight from the cache.
 
         Args:
             url (str): Url to download the file.
 
         Returns:
-            pathlib.Path: File of the temporary file.
+            AsyncGenerator[DownloadProgress, None]: Progress of the download, the last one has the cached file path.
         """
-
-        # We append the url filename to the generated random name to avoid collisions and preserve extension
-        name = pathlib.Path(urlparse(url).path).name
-        filename = pathlib.Path(f"{FirmwareDownloader._generate_random_filename()}-{name}")
+        revision = None
         try:
-            logger.debug(f"Downloading: {url}")
-            urlretrieve(url, filename)
+            # The manifest may need to be revalidated with the server
+            manifest = await asyncio.get_running_loop().run_in_executor(None, self._manifest_cache.get)
+            item = manifest.find_url(url)
+            revision = item.get("git-sha") if item else None
         except Exception as error:
-            raise FirmwareDownloadFail("Could not download firmware file.") from error
-        return filename
+            logger.debug(f"Could not find {url} in the manifest: {error}")
 
-    def _manifest_is_valid(self) -> bool:
-        """Check if internal content is valid and update it if not.
+        logger.debug(f"Downloading: {url}")
+        async for progress in self._firmware_cache.fetch(url, revision):
+            yield progress
+
+    async def _download(self, url: str) -> pathlib.Path:
+        """Download a specific file for a temporary location.
+
+        Args:
+            url (str): Url to download the file.
 
         Returns:
-            bool: True if valid, False if was unable to validate.
+            pathlib.Path: File of the temporary file.
         """
-        return "format-version" in self._manifest or self.download_manifest()
+        cached_path: Optional[str] = None
+        async for progress in self.fetch(url):
+            cached_path = progress.path
+        if cached_path is None:
+            raise FirmwareDownloadFail("Could not download firmware file.")
+        return await self.copy_to_temporary_file(url, pathlib.Path(cached_path))
 
-    def download_manifest(self) -> bool:
-        """Download ArduPilot manifest file
+    async def copy_to_temporary_file(self, url: str, cached_path: pathlib.Path) -> pathlib.Path:
+        """Copy a file downloaded to the cache to a temporary location.
+
+        Args:
+            url (str): Url the file was downloaded from.
+            cached_path (pathlib.Path): Path of the file in the cache.
 
         Returns:
-            bool: True if file was downloaded and validated, False if not.
+            pathlib.Path: File of the temporary file.
         """
-        with urlopen(FirmwareDownloader._manifest_remote) as http_response:
-            manifest_gzip = http_response.read()
-            manifest = gzip.decompress(manifest_gzip)
-            self._manifest = json.loads(manifest)
+        # The temporary file may be changed by the install, so the cached one is copied
+        # We append the url filename to the generated random name to avoid collisions and preserve extension
+        name = pathlib.Path(urlparse(url).path).name
+        filename = pathlib.Path(f"{FirmwareDownloader._generate_random_filename()}-{name}")
+        await asyncio.get_running_loop().run_in_executor(None, shutil.copyfile, cached_path, filename)
+        return filename
 
-        if "format-version" not in self._manifest:
-            raise InvalidManifest("Invalid Manifest file. Does not contain 'format-version' key.")
+    @property
+    def _manifest(self) -> Manifest:
+        """Indexed manifest, downloaded or revalidated if older than ManifestCache.MAX_AGE."""
+        return self._manifest_cache.get()
 
-        if self._manifest["format-version"] != "1.0.0":
-            logger.warning("Firmware description file format changed, compatibility may be broken.")
+    def download_manifest(self) -> bool:
+        """Download ArduPilot manifest file if it changed since the last download.
 
+        Returns:
+            bool: True if file was downloaded and validated or is already up to date, False if not.
+        """
+        self._manifest_cache.refresh()
         return True
 
     def _find_version_item(self, **args: str) -> List[Dict[str, Any]]:
@@ -115,23 +136,8 @@ class FirmwareDownloader:
         Returns:
             List[Dict[str, Any]]: A list of firmware items that match the arguments.
         """
-        if not self._manifest and not self.download_manifest():
-            raise ManifestUnavailable("Manifest file is not available. Cannot use it to find firmware candidates.")
-
-        found_version_item = []
+        return self._manifest.find_items(**args)
 
-        # Make sure that the item matches all args value
-        for item in self._manifest["firmware"]:
-            for key, value in args.items():
-                real_key = key.replace("_", "-")
-                if real_key not in item or item[real_key] != value:
-                    break
-            else:
-                found_version_item.append(item)
-
-        return found_version_item
-
-    @temporary_cache(timeout_seconds=3600)
     def get_available_versions(self, vehicle: Vehicle, platform: Platform) -> List[str]:
         """Get available firmware versions for the specific plataform and vehicle
 
@@ -142,20 +148,9 @@ class FirmwareDownloader:
         Returns:
             List[str]: List of available versions that match the specific desired configuration.
         """
-        available_versions: List[str] = []
-
-        if not self._manifest_is_valid():
-            raise InvalidManifest("Manifest file is invalid. Cannot use it to find available versions.")
-
-        items = self._find_version_item(vehicletype=vehicle.value, platform=platform.value)
-
-        for item in items:
-            if item["format"] == FirmwareDownloader._supported_firmware_formats[platform.type]:
-                available_versions.append(item["mav-firmware-version-type"])
-
-        return available_versions
+        firmware_format = FirmwareDownloader._supported_firmware_formats[platform.type]
+        return self._manifest.versions(vehicle.value, platform.value, firmware_format.value)
 
-    @temporary_cache(timeout_seconds=3600)
     def get_download_url(self, vehicle: Vehicle, platform: Platform, version: str = "") -> str:
         """Find a specific firmware URL from manifest that matches the arguments.
 
@@ -197,12 +192,7 @@ class FirmwareDownloader:
             else:
                 version = "BETA"
 
-        items = self._find_version_item(
-            vehicletype=vehicle.value,
-            platform=platform.value,
-            mav_firmware_version_type=version,
-            format=firmware_format,
-        )
+        items = self._manifest.find(vehicle.value, platform.value, firmware_format.value, version)
 
         if len(items) == 0:
             raise NoCandidate(
@@ -216,7 +206,7 @@ class FirmwareDownloader:
         logger.debug(f"Downloading following firmware: {item}")
         return str(item["url"])
 
-    def download(self, vehicle: Vehicle, platform: Platform, version: str = "") -> pathlib.Path:
+    async def download(self, vehicle: Vehicle, platform: Platform, version: str = "") -> pathlib.Path:
         """Download a specific firmware that matches the arguments.
 
         Args:
@@ -229,4 +219,4 @@ class FirmwareDownloader:
             pathlib.Path: Temporary path for the firmware file.
         """
         url = self.get_download_url(vehicle, platform, version)
-        return FirmwareDownloader._download(url)
+        return await self._download(url)
@@ -0,0 +1,137 @@
+import functools
+import mmap
+import os
+import pathlib
+import struct
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Tuple, TypeVar
+
+from exceptions import InvalidFirmwareFile
+
+T = TypeVar("T")
+FileKey = Tuple[str, int, int, int]
+
+ELF_MAGIC = b"\x7fELF"
+ELF_CLASS_32 = 1
+ELF_CLASS_64 = 2
+ELF_LITTLE_ENDIAN = 1
+# Header fields after e_ident: type, machine, version, entry, phoff, shoff, flags, ehsize,
+# phentsize, phnum, shentsize, shnum, shstrndx
+ELF_HEADER_FORMATS = {ELF_CLASS_32: "16xHHIIIIIHHHHHH", ELF_CLASS_64: "16xHHIQQQIHHHHHH"}
+# Section header fields: name, type, flags, addr, offset, size, link, info, addralign, entsize
+SECTION_HEADER_FORMATS = {ELF_CLASS_32: "IIIIIIIIII", ELF_CLASS_64: "IIQQQQIIQQ"}
+# Section number meaning that the real value is in the first section header
+SHN_XINDEX = 0xFFFF
+# e_machine values, with the same names used by pyelftools
+ELF_MACHINES = {3: "x86", 40: "ARM", 62: "x64", 183: "AArch64"}
+# 100k is Empirical data. non-debug binaries seem to have around 700 entries here,
+# while debug ones have 28 million entries
+DEBUG_LINE_MIN_SIZE = 100000
+
+
+def file_key(path: pathlib.Path) -> FileKey:
+    stat = os.stat(path)
+    return (str(path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def cached_by_file(function: Callable[[pathlib.Path], T]) -> Callable[[pathlib.Path], T]:
+    """Memoizes the result of "function" for a file until the file changes.
+
+    Files are identified by path, size, modification time and inode, so a firmware replaced by a new install
+    is inspected again. Only the last result of each path is kept.
+    """
+    cache: Dict[str, Tuple[FileKey, T]] = {}
+
+    @functools.wraps(function)
+    def wrapper(path: pathlib.Path) -> T:
+        key = file_key(path)
+        cached = cache.get(key[0])
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        result = function(path)
+        cache[key[0]] = (key, result)
+        return result
+
+    return wrapper
+
+
+@dataclass(frozen=True)
+class ElfInfo:
+    arch: str
+    has_debug_symbols: bool
+
+
+@dataclass(frozen=True)
+class ElfHeader:
+    machine: int
+    # Struct format of the section headers, with the byte order of the file
+    section_format: str
+    section_offset: int
+    section_size: int
+    section_count: int
+    # Section with the names of the sections
+    names_index: int
+
+    def section(self, data: mmap.mmap, index: int) -> Tuple[int, ...]:
+        return struct.unpack_from(self.section_format, data, self.section_offset + index * self.section_size)
+
+
+def read_elf_header(data: mmap.mmap) -> ElfHeader:
+    elf_class, encoding = data[4], data[5]
+    if data[:4] != ELF_MAGIC or elf_class not in ELF_HEADER_FORMATS:
+        raise InvalidFirmwareFile("Given file is not a valid ELF.")
+    endianness = "<" if encoding == ELF_LITTLE_ENDIAN else ">"
+    fields = struct.unpack_from(endianness + ELF_HEADER_FORMATS[elf_class], data)
+    header = ElfHeader(
+        machine=fields[1],
+        section_format=endianness + SECTION_HEADER_FORMATS[elf_class],
+        section_offset=fields[5],
+        section_size=fields[10],
+        section_count=fields[11],
+        names_index=fields[12],
+    )
+    if header.section_offset and (header.section_count == 0 or header.names_index == SHN_XINDEX):
+        # Too many sections for the ELF header, the real values are in the first section header
+        first_section = header.section(data, 0)
+        header = replace(
+            header,
+            section_count=header.section_count or first_section[5],
+            names_index=first_section[6] if header.names_index == SHN_XINDEX else header.names_index,
+        )
+    return header
+
+
+def has_debug_symbols(data: mmap.mmap, header: ElfHeader) -> bool:
+    if not header.section_offset or not header.section_count:
+        return False
+    names_offset = header.section(data, header.names_index)[4]
+    for index in range(header.section_count):
+        name_offset, _type, _flags, _addr, _offset, size = header.section(data, index)[:6]
+        name_start = names_offset + name_offset
+        name = data[name_start : data.find(b"\0", name_start)]
+        if name.startswith(b".debug_line"):
+            return size > DEBUG_LINE_MIN_SIZE
+    return False
+
+
+@cached_by_file
+def read_elf_info(firmware_path: pathlib.Path) -> ElfInfo:
+    """Reads the architecture and the debug symbols of an ELF from its headers.
+
+    The file is mapped in memory, so only the pages of the ELF header, the section header table and the
+    section names are read, no matter the size of the firmware.
+    """
+    with open(firmware_path, "rb") as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as error:
+            raise InvalidFirmwareFile("Given file is not a valid ELF.") from error
+    with data:
+        try:
+            header = read_elf_header(data)
+            return ElfInfo(
+                arch=ELF_MACHINES.get(header.machine, f"<unknown: {header.machine}>"),
+                has_debug_symbols=has_debug_symbols(data, header),
+            )
+        except (struct.error, IndexError) as error:
+            raise InvalidFirmwareFile("Given file is not a valid ELF.") from error
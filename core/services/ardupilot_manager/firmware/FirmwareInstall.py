@@ -4,13 +4,13 @@ import pathlib
 import platform as system_platform
 import shutil
 import stat
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 
 from ardupilot_fw_decoder import BoardSubType, BoardType, Decoder
-from elftools.elf.elffile import ELFFile
 
 from exceptions import FirmwareInstallFail, InvalidFirmwareFile, UnsupportedPlatform
 from firmware.FirmwareDownload import FirmwareDownloader
+from firmware.FirmwareInspection import cached_by_file, read_elf_info
 from firmware.FirmwareUpload import FirmwareUploader
 from typedefs import FirmwareFormat, FlightController, Platform, PlatformType
 
@@ -47,6 +47,19 @@ def get_correspondent_decoder_platform(current_platform: Platform) -> Union[Boar
     return correspondent_decoder_platform.get(current_platform, BoardType.EMPTY)
 
 
+@cached_by_file
+def read_apj_board_id(firmware_path: pathlib.Path) -> int:
+    with open(firmware_path, "r", encoding="utf-8") as firmware_file:
+        return int(json.load(firmware_file).get("board_id", -1))
+
+
+@cached_by_file
+def read_elf_board(firmware_path: pathlib.Path) -> Tuple[BoardType, BoardSubType]:
+    firm_decoder = Decoder()
+    firm_decoder.process(firmware_path)
+    return BoardType(firm_decoder.fwversion.board_type), BoardSubType(firm_decoder.fwversion.board_subtype)
+
+
 class FirmwareInstaller:
     """Abstracts the install procedures for different supported boards.
 
@@ -62,9 +75,7 @@ class FirmwareInstaller:
     @staticmethod
     def _validate_apj(firmware_path: pathlib.Path, platform: Platform) -> None:
         try:
-            with open(firmware_path, "r", encoding="utf-8") as firmware_file:
-                firmware_data = firmware_file.read()
-                firm_board_id = int(json.loads(firmware_data).get("board_id", -1))
+            firm_board_id = read_apj_board_id(firmware_path)
             expected_board_id = get_board_id(platform)
             if expected_board_id == -1:
                 raise UnsupportedPlatform("Firmware validation is not implemented for this board yet.")
@@ -79,12 +90,10 @@ class FirmwareInstaller:
     @staticmethod
     def _validate_elf(firmware_path: pathlib.Path, platform: Platform) -> None:
         # Check if firmware's architecture matches system's architecture
-        with open(firmware_path, "rb") as file:
-            try:
-                elf_file = ELFFile(file)
-                firm_arch = elf_file.get_machine_arch()
-            except Exception as error:
-                raise InvalidFirmwareFile("Given file is not a valid ELF.") from error
+        try:
+            firm_arch = read_elf_info(firmware_path).arch
+        except Exception as error:
+            raise InvalidFirmwareFile("Given file is not a valid ELF.") from error
         if not is_valid_elf_type(firm_arch):
             raise InvalidFirmwareFile(
                 f"Firmware's architecture ({firm_arch}) does not match system's ({system_platform.machine()})."
@@ -92,10 +101,7 @@ class FirmwareInstaller:
 
         # Check if firmware's platform matches system platform
         try:
-            firm_decoder = Decoder()
-            firm_decoder.process(firmware_path)
-            firm_board = BoardType(firm_decoder.fwversion.board_type)
-            firm_sub_board = BoardSubType(firm_decoder.fwversion.board_subtype)
+            firm_board, firm_sub_board = read_elf_board(firmware_path)
             current_decoder_platform = get_correspondent_decoder_platform(platform)
             if current_decoder_platform not in [firm_board, firm_sub_board]:
                 raise InvalidFirmwareFile(
@@ -3,11 +3,12 @@ import shutil
 import subprocess
 import tempfile
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncGenerator, List, Optional
 
 from loguru import logger
 
 from exceptions import (
+    FirmwareDownloadFail,
     FirmwareInstallFail,
     NoDefaultFirmwareAvailable,
     NoVersionAvailable,
@@ -16,6 +17,7 @@ from exceptions import (
 from firmware.FirmwareDownload import FirmwareDownloader
 from firmware.FirmwareInstall import FirmwareInstaller
 from typedefs import (
+    DownloadProgress,
     Firmware,
     FirmwareFormat,
     FlightController,
@@ -28,12 +30,16 @@ from typedefs import (
 
 class FirmwareManager:
     def __init__(
-        self, firmware_folder: pathlib.Path, defaults_folder: pathlib.Path, user_defaults_folder: pathlib.Path
+        self,
+        firmware_folder: pathlib.Path,
+        defaults_folder: pathlib.Path,
+        user_defaults_folder: pathlib.Path,
+        cache_folder: Optional[pathlib.Path] = None,
     ) -> None:
         self.firmware_folder = firmware_folder
         self.defaults_folder = defaults_folder
         self.user_defaults_folder = user_defaults_folder
-        self.firmware_download = FirmwareDownloader()
+        self.firmware_download = FirmwareDownloader(cache_folder)
         self.firmware_installer = FirmwareInstaller()
 
     @staticmethod
@@ -141,14 +147,34 @@ class FirmwareManager:
             if self.default_user_params_path(platform).is_file():
                 self.default_user_params_path(platform).unlink()
 
-    def install_firmware_from_url(
+    def download_firmware(self, url: str) -> AsyncGenerator[DownloadProgress, None]:
+        return self.firmware_download.fetch(url.strip())
+
+    async def install_firmware_from_url(
         self,
         url: str,
         board: FlightController,
         makeDefault: bool = False,
         default_parameters: Optional[Parameters] = None,
     ) -> None:
-        temporary_file = self.firmware_download._download(url.strip())
+        download: Optional[DownloadProgress] = None
+        async for download in self.download_firmware(url):
+            pass
+        if download is None:
+            raise FirmwareDownloadFail("Could not download firmware file.")
+        await self.install_downloaded_firmware(download, board, makeDefault, default_parameters)
+
+    async def install_downloaded_firmware(
+        self,
+        download: DownloadProgress,
+        board: FlightController,
+        makeDefault: bool = False,
+        default_parameters: Optional[Parameters] = None,
+    ) -> None:
+        """Install a firmware from the cache, given the last progress of its download."""
+        if download.path is None:
+            raise FirmwareDownloadFail("Could not download firmware file.")
+        temporary_file = await self.firmware_download.copy_to_temporary_file(download.url, Path(download.path))
         if default_parameters is not None:
             if board.platform.type == PlatformType.Serial:
                 self.embed_params_into_apj(temporary_file, default_parameters)
@@ -158,9 +184,9 @@ class FirmwareManager:
             shutil.copy(temporary_file, self.default_user_firmware_path(board.platform))
         self.install_firmware_from_file(temporary_file, board, default_parameters)
 
-    def install_firmware_from_params(self, vehicle: Vehicle, board: FlightController, version: str = "") -> None:
+    async def install_firmware_from_params(self, vehicle: Vehicle, board: FlightController, version: str = "") -> None:
         url = self.firmware_download.get_download_url(vehicle, board.platform, version)
-        self.install_firmware_from_url(url, board)
+        await self.install_firmware_from_url(url, board)
 
     def restore_default_firmware(self, board: FlightController) -> None:
         if not self.is_default_firmware_available(board.platform):
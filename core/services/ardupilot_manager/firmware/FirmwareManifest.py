@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+import pathlib
+import time
+from collections import defaultdict
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from loguru import logger
+
+from exceptions import InvalidManifest, ManifestUnavailable
+
+# Fields of the firmware items used to index them, in the order of the index keys
+KEY_FIELDS = ("vehicletype", "platform", "format", "mav-firmware-version-type")
+ManifestKey = Tuple[Any, ...]
+
+
+class Manifest:
+    """Firmware items of the ArduPilot manifest, indexed once by the fields used to look them up."""
+
+    def __init__(self, content: Dict[str, Any]) -> None:
+        if "format-version" not in content:
+            raise InvalidManifest("Invalid Manifest file. Does not contain 'format-version' key.")
+
+        if content["format-version"] != "1.0.0":
+            logger.warning("Firmware description file format changed, compatibility may be broken.")
+
+        self.items: List[Dict[str, Any]] = content.get("firmware", [])
+        self._by_key: Dict[ManifestKey, List[Dict[str, Any]]] = defaultdict(list)
+        self._by_target: Dict[ManifestKey, List[Dict[str, Any]]] = defaultdict(list)
+        self._by_url: Dict[str, Dict[str, Any]] = {}
+        # Version types of each vehicle, platform and format, without repetitions and in manifest order
+        self._versions: Dict[ManifestKey, Dict[Any, None]] = defaultdict(dict)
+        for item in self.items:
+            key = tuple(item.get(field) for field in KEY_FIELDS)
+            self._by_key[key].append(item)
+            self._by_target[key[:2]].append(item)
+            self._versions[key[:3]][key[3]] = None
+            self._by_url.setdefault(item.get("url", ""), item)
+
+    def find(self, vehicle_type: str, platform: str, firmware_format: str, version_type: str) -> List[Dict[str, Any]]:
+        return self._by_key.get((vehicle_type, platform, firmware_format, version_type), [])
+
+    def versions(self, vehicle_type: str, platform: str, firmware_format: str) -> List[str]:
+        return list(self._versions.get((vehicle_type, platform, firmware_format), {}))
+
+    def find_url(self, url: str) -> Optional[Dict[str, Any]]:
+        return self._by_url.get(url)
+
+    def find_items(self, **fields: Any) -> List[Dict[str, Any]]:
+        """Find the items whose fields have the given values, using the narrowest index available.
+
+        Names follow the keys of the manifest items, with `-` replaced by `_`.
+        """
+        expected = {
+            name.replace("_", "-"): value.value if isinstance(value, Enum) else value for name, value in fields.items()
+        }
+        if all(field in expected for field in KEY_FIELDS):
+            candidates = self._by_key.get(tuple(expected[field] for field in KEY_FIELDS), [])
+        elif all(field in expected for field in KEY_FIELDS[:2]):
+            candidates = self._by_target.get(tuple(expected[field] for field in KEY_FIELDS[:2]), [])
+        else:
+            candidates = self.items
+
+        return [
+            item
+            for item in candidates
+            if all(field in item and item[field] == value for field, value in expected.items())
+        ]
+
+
+class ManifestCache:
+    """Last good copy of the ArduPilot manifest, kept on disk and revalidated with the server.
+
+    The compressed manifest is saved as received, with the ETag and Last-Modified headers of the response,
+    so revalidations that find no changes are answered by the server with an empty 304. When the server
+    can't be reached, the last good copy is used, which also lets the service start offline.
+    """
+
+    # Time, in seconds, before the manifest is revalidated with the server
+    MAX_AGE = 3600
+    # Time, in seconds, before trying the server again after a failure
+    RETRY_INTERVAL = 60
+    # Time, in seconds, to wait for the server
+    TIMEOUT = 10
+
+    def __init__(self, url: str, folder: Optional[pathlib.Path] = None) -> None:
+        self.url = url
+        self.path = pathlib.Path.joinpath(folder, "manifest.json.gz") if folder else None
+        self.headers_path = pathlib.Path.joinpath(folder, "manifest.json.gz.headers") if folder else None
+        self.manifest: Optional[Manifest] = None
+        self.validators: Dict[str, str] = {}
+        self.next_check_time = float("-inf")
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None or self.headers_path is None:
+            return
+        try:
+            self.manifest = Manifest(json.loads(gzip.decompress(self.path.read_bytes())))
+            self.validators = json.loads(self.headers_path.read_text(encoding="utf-8"))
+            logger.info(f"Loaded firmware manifest from {self.path}.")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as error:
+            logger.warning(f"Ignoring invalid firmware manifest at {self.path}: {error}")
+            self.validators = {}
+
+    def _save(self, manifest_gzip: bytes) -> None:
+        if self.path is None or self.headers_path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The manifest goes first, a crash before the headers are saved only causes a full download
+        for path, content in [(self.path, manifest_gzip), (self.headers_path, json.dumps(self.validators).encode())]:
+            temporary_path = path.with_name(f"{path.name}.tmp")
+            temporary_path.write_bytes(content)
+            os.replace(temporary_path, path)
+
+    def refresh(self) -> bool:
+        """Download the manifest if it changed in the server.
+
+        Returns:
+            bool: True if a new manifest was downloaded, False if the current one is up to date.
+        """
+        request = Request(self.url)
+        if self.manifest is not None:
+            if "etag" in self.validators:
+                request.add_header("If-None-Match", self.validators["etag"])
+            if "last-modified" in self.validators:
+                request.add_header("If-Modified-Since", self.validators["last-modified"])
+
+        try:
+            with urlopen(request, timeout=self.TIMEOUT) as http_response:
+                manifest_gzip = http_response.read()
+                validators = {
+                    name: http_response.headers[name]
+                    for name in ["etag", "last-modified"]
+                    if http_response.headers[name]
+                }
+        except HTTPError as error:
+            if error.code == 304 and self.manifest is not None:
+                logger.debug("Firmware manifest is up to date.")
+                self.next_check_time = time.monotonic() + self.MAX_AGE
+                return False
+            raise
+
+        # Parsed and indexed before replacing anything, an invalid download keeps the last good copy
+        self.manifest = Manifest(json.loads(gzip.decompress(manifest_gzip)))
+        self.validators = validators
+        self.next_check_time = time.monotonic() + self.MAX_AGE
+        try:
+            self._save(manifest_gzip)
+        except OSError as error:
+            logger.warning(f"Failed to save firmware manifest: {error}")
+        logger.info(f"Downloaded firmware manifest with {len(self.manifest.items)} items.")
+        return True
+
+    def get(self) -> Manifest:
+        """Get the manifest, revalidating it when it is older than MAX_AGE."""
+        if time.monotonic() >= self.next_check_time:
+            try:
+                self.refresh()
+            except Exception as error:
+                if self.manifest is None:
+                    raise ManifestUnavailable(
+                        "Manifest file is not available. Cannot use it to find firmware candidates."
+                    ) from error
+                logger.warning(f"Failed to update firmware manifest, using the last good copy: {error}")
+                self.next_check_time = time.monotonic() + self.RETRY_INTERVAL
+
+        assert self.manifest is not None
+        return self.manifest
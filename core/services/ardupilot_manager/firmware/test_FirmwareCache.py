@@ -0,0 +1,136 @@
+import hashlib
+import os
+import pathlib
+from typing import AsyncGenerator, List, Optional
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from exceptions import FirmwareDownloadFail
+from firmware.FirmwareCache import FirmwareCache
+from typedefs import DownloadProgress
+
+
+class FirmwareServer:
+    """Serves a single firmware file, with support for ranges and conditional requests."""
+
+    def __init__(self) -> None:
+        self.url = ""
+        self.content = os.urandom(3 * FirmwareCache.CHUNK_SIZE)
+        self.etag = '"1"'
+        # Bytes sent before dropping the connection, for the next request
+        self.drop_after: Optional[int] = None
+        # Requests are dropped without an answer while offline
+        self.offline = False
+        self.responses: List[int] = []
+        self.app = web.Application()
+        self.app.router.add_get("/firmware.apj", self.get_firmware)
+
+    async def get_firmware(self, request: web.Request) -> web.StreamResponse:
+        if self.offline:
+            assert request.transport is not None
+            request.transport.close()
+            return web.Response()
+
+        if request.headers.get("If-None-Match") == self.etag:
+            self.responses.append(304)
+            return web.Response(status=304)
+
+        start = 0
+        range_header = request.headers.get("Range")
+        if range_header and request.headers.get("If-Range") == self.etag:
+            start = int(range_header.removeprefix("bytes=").removesuffix("-"))
+        response = web.StreamResponse(status=206 if start else 200, headers={"ETag": self.etag})
+        if start:
+            response.headers["Content-Range"] = f"bytes {start}-{len(self.content) - 1}/{len(self.content)}"
+        response.content_length = len(self.content) - start
+        self.responses.append(response.status)
+        await response.prepare(request)
+
+        if self.drop_after is not None:
+            await response.write(self.content[start : start + self.drop_after])
+            self.drop_after = None
+            assert request.transport is not None
+            request.transport.close()
+            return response
+
+        await response.write(self.content[start:])
+        await response.write_eof()
+        return response
+
+
+@pytest.fixture(name="server")
+async def fixture_server() -> AsyncGenerator[FirmwareServer, None]:
+    firmware_server = FirmwareServer()
+    test_server = TestServer(firmware_server.app)
+    await test_server.start_server()
+    firmware_server.url = f"http://{test_server.host}:{test_server.port}/firmware.apj"
+    yield firmware_server
+    await test_server.close()
+
+
+async def fetch(cache: FirmwareCache, url: str, revision: Optional[str] = None) -> List[DownloadProgress]:
+    return [progress async for progress in cache.fetch(url, revision)]
+
+
+@pytest.mark.asyncio
+async def test_firmware_cache(server: FirmwareServer, tmp_path: pathlib.Path) -> None:
+    cache = FirmwareCache(tmp_path)
+    progress = await fetch(cache, server.url, "abc")
+    assert server.responses == [200]
+    assert progress[-1].path is not None and not progress[-1].cached
+    cached_path = pathlib.Path(progress[-1].path)
+    assert cached_path.read_bytes() == server.content
+    assert cached_path.name == hashlib.sha256(server.content).hexdigest()
+
+    # Files of the same build are used without contacting the server, even after a restart
+    progress = await fetch(FirmwareCache(tmp_path), server.url, "abc")
+    assert progress[-1].cached and progress[-1].path == str(cached_path)
+    assert server.responses == [200]
+
+    # Others are revalidated
+    progress = await fetch(cache, server.url)
+    assert progress[-1].cached and progress[-1].path == str(cached_path)
+    assert server.responses == [200, 304]
+
+    server.content = os.urandom(FirmwareCache.CHUNK_SIZE)
+    server.etag = '"2"'
+    progress = await fetch(cache, server.url, "def")
+    assert server.responses == [200, 304, 200]
+    assert pathlib.Path(str(progress[-1].path)).read_bytes() == server.content
+
+
+@pytest.mark.asyncio
+async def test_firmware_cache_resume(server: FirmwareServer, tmp_path: pathlib.Path) -> None:
+    cache = FirmwareCache(tmp_path)
+    cache.RETRY_DELAY = 0
+    server.drop_after = FirmwareCache.CHUNK_SIZE
+
+    progress = await fetch(cache, server.url)
+    assert server.responses == [200, 206]
+    assert progress[-1].downloaded == len(server.content)
+    assert pathlib.Path(str(progress[-1].path)).read_bytes() == server.content
+
+
+@pytest.mark.asyncio
+async def test_firmware_cache_failure(server: FirmwareServer, tmp_path: pathlib.Path) -> None:
+    cache = FirmwareCache(tmp_path)
+    with pytest.raises(FirmwareDownloadFail):
+        await fetch(cache, server.url.replace("firmware.apj", "missing.apj"))
+
+
+@pytest.mark.asyncio
+async def test_firmware_cache_offline(server: FirmwareServer, tmp_path: pathlib.Path) -> None:
+    cache = FirmwareCache(tmp_path)
+    cache.RETRY_DELAY = 0
+    cached_path = (await fetch(cache, server.url))[-1].path
+
+    # Files without a known build are used from the cache when the server can't be reached
+    server.offline = True
+    progress = await fetch(FirmwareCache(tmp_path), server.url)
+    assert progress[-1].cached and progress[-1].path == cached_path
+    assert server.responses == [200]
+
+    with pytest.raises(FirmwareDownloadFail):
+        await fetch(cache, server.url.replace("firmware.apj", "other.apj"))
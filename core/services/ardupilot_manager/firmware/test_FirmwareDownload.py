@@ -7,8 +7,9 @@ from firmware.FirmwareDownload import FirmwareDownloader
 from typedefs import Platform, Vehicle
 
 
-def test_static() -> None:
-    downloaded_file = FirmwareDownloader._download(FirmwareDownloader._manifest_remote)
+@pytest.mark.asyncio
+async def test_static() -> None:
+    downloaded_file = await FirmwareDownloader()._download(FirmwareDownloader._manifest_remote)
     assert downloaded_file, "Failed to download file."
     assert downloaded_file.exists(), "Download file does not exist."
 
@@ -16,7 +17,8 @@ def test_static() -> None:
     assert downloaded_file.stat().st_size > smaller_valid_size_bytes, "Download file size is not big enough."
 
 
-def test_firmware_download() -> None:
+@pytest.mark.asyncio
+async def test_firmware_download() -> None:
     firmware_download = FirmwareDownloader()
     assert firmware_download.download_manifest(), "Failed to download/validate manifest file."
 
@@ -39,22 +41,26 @@ def test_firmware_download() -> None:
         set(test_available_versions)
     ), "Available versions are missing know versions."
 
-    assert firmware_download.download(
+    assert await firmware_download.download(
         Vehicle.Sub, Platform.Pixhawk1, "STABLE-4.0.1"
     ), "Failed to download a valid firmware file."
 
-    assert firmware_download.download(Vehicle.Sub, Platform.Pixhawk1), "Failed to download latest valid firmware file."
+    assert await firmware_download.download(
+        Vehicle.Sub, Platform.Pixhawk1
+    ), "Failed to download latest valid firmware file."
 
-    assert firmware_download.download(Vehicle.Sub, Platform.Pixhawk4), "Failed to download latest valid firmware file."
+    assert await firmware_download.download(
+        Vehicle.Sub, Platform.Pixhawk4
+    ), "Failed to download latest valid firmware file."
 
-    assert firmware_download.download(Vehicle.Sub, Platform.SITL), "Failed to download SITL."
+    assert await firmware_download.download(Vehicle.Sub, Platform.SITL), "Failed to download SITL."
 
     # skipt these tests for MacOS
     if platform.system() == "Darwin":
         pytest.skip("Skipping test for MacOS")
     # It'll fail if running in an arch different of ARM
     if "x86" in os.uname().machine:
-        assert firmware_download.download(Vehicle.Sub, Platform.Navigator), "Failed to download navigator binary."
+        assert await firmware_download.download(Vehicle.Sub, Platform.Navigator), "Failed to download navigator binary."
     else:
         with pytest.raises(Exception):
-            firmware_download.download(Vehicle.Sub, Platform.Navigator)
+            await firmware_download.download(Vehicle.Sub, Platform.Navigator)
@@ -0,0 +1,36 @@
+import os
+import pathlib
+import shutil
+import sys
+
+import pytest
+from elftools.elf.elffile import ELFFile
+
+from exceptions import InvalidFirmwareFile
+from firmware.FirmwareInspection import read_elf_info
+
+
+def test_elf_info(tmp_path: pathlib.Path) -> None:
+    # The python interpreter is an ELF built for the system's architecture
+    firmware_path = tmp_path / "firmware"
+    shutil.copy(os.path.realpath(sys.executable), firmware_path)
+    with open(firmware_path, "rb") as file:
+        elf_file = ELFFile(file)
+        expected_arch = elf_file.get_machine_arch()
+        debug_line = next((section for section in elf_file.iter_sections() if section.name == ".debug_line"), None)
+        expected_debug_symbols = debug_line is not None and debug_line.header.sh_size > 100000
+
+    info = read_elf_info(firmware_path)
+    assert info.arch == expected_arch
+    assert info.has_debug_symbols == expected_debug_symbols
+    # Unchanged files are not read again
+    assert read_elf_info(firmware_path) is info
+
+    # Replaced files are
+    firmware_path.write_bytes(b"not an elf")
+    with pytest.raises(InvalidFirmwareFile):
+        read_elf_info(firmware_path)
+
+    firmware_path.write_bytes(b"")
+    with pytest.raises(InvalidFirmwareFile):
+        read_elf_info(firmware_path)
@@ -0,0 +1,138 @@
+import gzip
+import json
+import pathlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Generator, List
+
+import pytest
+
+from exceptions import ManifestUnavailable
+from firmware.FirmwareManifest import ManifestCache
+
+MANIFEST = {
+    "format-version": "1.0.0",
+    "firmware": [
+        {
+            "vehicletype": "Sub",
+            "platform": "Pixhawk1",
+            "format": "apj",
+            "mav-firmware-version-type": "STABLE-4.0.1",
+            "url": "https://firmware.ardupilot.org/Sub/stable-4.0.1/Pixhawk1/ardusub.apj",
+        },
+        {
+            "vehicletype": "Sub",
+            "platform": "Pixhawk1",
+            "format": "hex",
+            "mav-firmware-version-type": "STABLE-4.0.1",
+            "url": "https://firmware.ardupilot.org/Sub/stable-4.0.1/Pixhawk1/ardusub_with_bl.hex",
+        },
+        {
+            "vehicletype": "Sub",
+            "platform": "Pixhawk1",
+            "format": "apj",
+            "mav-firmware-version-type": "BETA",
+            "url": "https://firmware.ardupilot.org/Sub/beta/Pixhawk1/ardusub.apj",
+        },
+    ],
+}
+
+
+class ManifestServer(ThreadingHTTPServer):
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), ManifestHandler)
+        self.content = gzip.compress(json.dumps(MANIFEST).encode())
+        self.etag = '"1"'
+        self.responses: List[int] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/manifest.json.gz"
+
+
+class ManifestHandler(BaseHTTPRequestHandler):
+    server: ManifestServer
+
+    def do_GET(self) -> None:
+        if self.headers["If-None-Match"] == self.server.etag:
+            self.server.responses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.server.responses.append(200)
+        self.send_response(200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(self.server.content)))
+        self.end_headers()
+        self.wfile.write(self.server.content)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture(name="server")
+def fixture_server() -> Generator[ManifestServer, None, None]:
+    server = ManifestServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_manifest_index(server: ManifestServer) -> None:
+    manifest = ManifestCache(server.url).get()
+    assert manifest.versions("Sub", "Pixhawk1", "apj") == ["STABLE-4.0.1", "BETA"]
+    assert not manifest.versions("Sub", "Navigator", "elf")
+
+    items = manifest.find("Sub", "Pixhawk1", "apj", "STABLE-4.0.1")
+    assert [item["url"] for item in items] == [MANIFEST["firmware"][0]["url"]]  # type: ignore
+
+    assert (
+        len(manifest.find_items(vehicletype="Sub", platform="Pixhawk1", mav_firmware_version_type="STABLE-4.0.1")) == 2
+    )
+    assert len(manifest.find_items(format="apj")) == 2
+    assert not manifest.find_items(
+        vehicletype="Sub", platform="Pixhawk1", format="apj", mav_firmware_version_type="DEV"
+    )
+
+
+def test_manifest_cache(server: ManifestServer, tmp_path: pathlib.Path) -> None:
+    cache = ManifestCache(server.url, tmp_path)
+    first_manifest = cache.get()
+    assert server.responses == [200]
+
+    # Fresh manifests are not revalidated
+    assert cache.get() is first_manifest
+    assert server.responses == [200]
+
+    # Unchanged manifests are revalidated without downloading them again
+    assert not cache.refresh()
+    assert cache.get() is first_manifest
+    assert server.responses == [200, 304]
+
+    # The last good copy is kept between runs and revalidated with its ETag
+    assert not ManifestCache(server.url, tmp_path).refresh()
+    assert server.responses == [200, 304, 304]
+
+    server.etag = '"2"'
+    assert ManifestCache(server.url, tmp_path).refresh()
+    assert server.responses == [200, 304, 304, 200]
+
+
+def test_manifest_offline(server: ManifestServer, tmp_path: pathlib.Path) -> None:
+    ManifestCache(server.url, tmp_path).get()
+    offline_url = server.url
+    server.shutdown()
+    server.server_close()
+
+    manifest = ManifestCache(offline_url, tmp_path).get()
+    assert manifest.versions("Sub", "Pixhawk1", "apj") == ["STABLE-4.0.1", "BETA"]
+
+    with pytest.raises(ManifestUnavailable):
+        ManifestCache(offline_url, tmp_path / "empty").get()
+
+    invalid_manifest: Dict[str, Any] = {"firmware": []}
+    (tmp_path / "manifest.json.gz").write_bytes(gzip.compress(json.dumps(invalid_manifest).encode()))
+    with pytest.raises(ManifestUnavailable):
+        ManifestCache(offline_url, tmp_path).get()
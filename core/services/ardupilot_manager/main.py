@@ -5,7 +5,7 @@ import logging
 import os
 import shutil
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set
 
 from commonwealth.mavlink_comm.exceptions import FetchUpdatedMessageFail
 from commonwealth.mavlink_comm.typedefs import FirmwareInfo, MavlinkVehicleType
@@ -17,18 +17,28 @@ from commonwealth.utils.apis import (
 from commonwealth.utils.decorators import single_threaded
 from commonwealth.utils.general import is_running_as_root
 from commonwealth.utils.logs import InterceptHandler, init_logger
+from commonwealth.utils.streaming import streamer
 from fastapi import Body, FastAPI, File, HTTPException, UploadFile, status
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi_versioning import VersionedFastAPI, version
 from loguru import logger
 from uvicorn import Config, Server
 
 from ArduPilotManager import ArduPilotManager
-from exceptions import InvalidFirmwareFile
+from exceptions import FirmwareDownloadFail, InvalidFirmwareFile
 from flight_controller_detector.Detector import Detector as BoardDetector
 from mavlink_proxy.Endpoint import Endpoint
 from settings import SERVICE_NAME
-from typedefs import Firmware, FlightController, Parameters, Serial, SITLFrame, Vehicle
+from typedefs import (
+    DownloadProgress,
+    Firmware,
+    FlightController,
+    Parameters,
+    Serial,
+    SITLFrame,
+    Vehicle,
+    WatchdogStatus,
+)
 
 FRONTEND_FOLDER = Path.joinpath(Path(__file__).parent.absolute(), "frontend")
 
@@ -168,6 +178,16 @@ async def get_available_firmwares(vehicle: Vehicle, board_name: Optional[str] =
     return autopilot.get_available_firmwares(vehicle, (await target_board(board_name)).platform)
 
 
+@app.post("/download_firmware", summary="Download firmware for given URL to the cache, streaming the progress.")
+@version(1, 0)
+async def download_firmware(url: str) -> StreamingResponse:
+    async def progress() -> AsyncGenerator[str, None]:
+        async for download_progress in autopilot.download_firmware(url):
+            yield download_progress.json()
+
+    return StreamingResponse(streamer(progress()))
+
+
 @app.post("/install_firmware_from_url", summary="Install firmware for given URL.")
 @version(1, 0)
 @single_threaded(callback=raise_lock)
@@ -177,9 +197,15 @@ async def install_firmware_from_url(
     make_default: bool = False,
     parameters: Optional[Parameters] = None,
 ) -> Any:
+    # Downloaded while the vehicle is still running, the install then uses the cached file
+    download: Optional[DownloadProgress] = None
+    async for download in autopilot.download_firmware(url):
+        pass
+    if download is None:
+        raise FirmwareDownloadFail("Could not download firmware file.")
     try:
         await autopilot.kill_ardupilot()
-        autopilot.install_firmware_from_url(url, await target_board(board_name), make_default, parameters)
+        await autopilot.install_downloaded_firmware(download, await target_board(board_name), make_default, parameters)
     finally:
         await autopilot.start_ardupilot()
 
@@ -230,6 +256,12 @@ async def restart() -> Any:
     logger.debug("Ardupilot successfully restarted.")
 
 
+@app.get("/watchdog", response_model=WatchdogStatus, summary="Retrieve the state of the autopilot watchdog.")
+@version(1, 0)
+def get_watchdog_status() -> Any:
+    return autopilot.get_watchdog_status()
+
+
 @app.post("/start", summary="Start the autopilot.")
 @version(1, 0)
 async def start() -> Any:
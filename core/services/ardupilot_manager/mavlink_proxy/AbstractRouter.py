@@ -3,9 +3,12 @@ import asyncio
 import pathlib
 import shlex
 import shutil
+import socket
 import tempfile
-from typing import Any, List, Optional, Set, Type
+import time
+from typing import Any, List, Optional, Set, Tuple, Type
 
+import psutil
 from loguru import logger
 
 from exceptions import (
@@ -16,13 +19,30 @@ from exceptions import (
     NoMasterMavlinkEndpoint,
 )
 from mavlink_proxy.Endpoint import Endpoint
+from typedefs import EndpointType
+
+# Serial port or server socket that only one router can use at a time
+Resource = Tuple[str, str]
 
 
 class AbstractRouter(metaclass=abc.ABCMeta):
+    # pylint: disable=too-many-instance-attributes
+    # Time, in seconds, to wait for the router to open its server sockets after starting
+    START_TIMEOUT = 3.0
+    # Time, in seconds, that a router without server sockets must keep running to be considered started
+    START_GRACE = 0.3
+    # Time, in seconds, to wait for the router to exit before killing it
+    EXIT_TIMEOUT = 3.0
+    # Time, in seconds, between checks of the router process
+    POLL_INTERVAL = 0.05
+
     def __init__(self) -> None:
         self._endpoints: Set[Endpoint] = set()
         self._master_endpoint: Optional[Endpoint] = None
         self._subprocess: Optional[asyncio.subprocess.Process] = None
+        # Command line and exclusive resources of the running router
+        self._command: Optional[str] = None
+        self._resources: Set[Resource] = set()
 
         # Since this methods can fail we need to have the other variables defined
         # to avoid any problem in __del__
@@ -93,68 +113,144 @@ class AbstractRouter(metaclass=abc.ABCMeta):
     def master_endpoint(self) -> Optional[Endpoint]:
         return self._master_endpoint
 
+    def exclusive_resources(self, master_endpoint: Endpoint) -> Set[Resource]:
+        """Serial ports and server sockets used by a router with the current endpoints, master included."""
+        resources: Set[Resource] = set()
+        for endpoint in [master_endpoint, *Endpoint.filter_enabled(self.endpoints())]:
+            if endpoint.connection_type == EndpointType.Serial:
+                resources.add(("serial", endpoint.place))
+            elif endpoint.connection_type == EndpointType.UDPServer:
+                resources.add(("udp", str(endpoint.argument)))
+            elif endpoint.connection_type == EndpointType.TCPServer:
+                resources.add(("tcp", str(endpoint.argument)))
+        return resources
+
+    @staticmethod
+    def _bound_sockets(process: asyncio.subprocess.Process) -> Set[Resource]:
+        try:
+            connections = psutil.Process(process.pid).connections(kind="inet")
+        except psutil.Error:
+            return set()
+        return {
+            ("tcp" if connection.type == socket.SOCK_STREAM else "udp", str(connection.laddr.port))
+            for connection in connections
+            if connection.laddr
+        }
+
+    async def _wait_started(self, process: asyncio.subprocess.Process, sockets: Set[Resource]) -> None:
+        """Wait until the router opened its server sockets, or START_GRACE without any.
+
+        Fails if the router exits, or if it did not open its server sockets in START_TIMEOUT seconds.
+        """
+        start_time = time.monotonic()
+        while process.returncode is None:
+            elapsed = time.monotonic() - start_time
+            if elapsed > self.START_TIMEOUT:
+                raise MavlinkRouterStartFail(
+                    f"Mavlink router did not open {sockets - self._bound_sockets(process)} in {self.START_TIMEOUT} seconds."
+                )
+            if (sockets and sockets <= self._bound_sockets(process)) or (not sockets and elapsed > self.START_GRACE):
+                logger.debug(f"Router started in {elapsed:.2f} seconds.")
+                return
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+        _stdout, _strerr = await process.communicate()
+        stdout = _stdout.decode("utf-8") if _stdout else "No stdout."
+        stderr = _strerr.decode("utf-8") if _strerr else "No stderr."
+        output = f"message: stdout: '{stdout}', stderr: '{stderr}'"
+        raise MavlinkRouterStartFail(f"Failed to initialize Mavlink router, code: {process.returncode}, {output}")
+
     async def start(self, master_endpoint: Endpoint) -> None:
         self._master_endpoint = master_endpoint
         command = self.assemble_command(self._master_endpoint)
+        resources = self.exclusive_resources(self._master_endpoint)
         logger.debug(f"Calling router using following command: '{command}'.")
 
         self._subprocess = await asyncio.create_subprocess_exec(
             *shlex.split(command), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
         )
 
-        await asyncio.sleep(3)  # Non-blocking sleep
-        if not await self.is_running():
-            _stdout, _strerr = await self._subprocess.communicate()
-            stdout = _stdout.decode("utf-8") if _stdout else "No stdout."
-            stderr = _strerr.decode("utf-8") if _strerr else "No stderr."
-            output = f"message: stdout: '{stdout}', stderr: '{stderr}'"
-            returncode = self._subprocess.returncode
-            raise MavlinkRouterStartFail(f"Failed to initialize Mavlink router, code: {returncode}, {output}")
+        try:
+            await self._wait_started(self._subprocess, {resource for resource in resources if resource[0] != "serial"})
+        except MavlinkRouterStartFail:
+            if self._subprocess.returncode is None:
+                await self._stop_process(self._subprocess)
+            raise
+        self._command = command
+        self._resources = resources
         await self.start_house_keepers()
 
+    async def _stop_process(self, process: asyncio.subprocess.Process) -> None:
+        logger.debug(f"Terminating router process {process.pid}.")
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=self.EXIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Router process {process.pid} is still running, going to kill it.")
+            process.kill()
+            await process.wait()
+
     async def exit(self) -> None:
         if await self.is_running():
             if self._subprocess is not None:
-                logger.warning("Terminating process")
-                self._subprocess.terminate()
-                logger.warning("Termination done")
-                await asyncio.sleep(3)  # Non-blocking sleep
-                logger.warning("Checking if it's still running..")
-                if await self.is_running():
-                    logger.warning("Still running, going to kill it")
-                    self._subprocess.kill()
-                    logger.warning("Killing done")
-                    await asyncio.sleep(3)
-                await self._subprocess.wait()  # Wait for the subprocess to terminate
+                await self._stop_process(self._subprocess)
         else:
             logger.debug("Tried to stop router, but it was already not running.")
 
+    async def reconfigure(self) -> None:
+        """Apply the current endpoints to the router with as little disruption of the links as possible.
+
+        Nothing is restarted if the command line did not change. Otherwise, the new router is started before
+        the current one is stopped, which is only possible when they don't need any of the same serial ports or
+        server sockets. The master endpoint is used by both, so this handover only happens with a master that is
+        not exclusive, like the TCP or UDP client of SITL, and when no server endpoint is kept. A serial master
+        always goes through a restart, as does a new router that fails to start next to the current one.
+        """
+        if self._master_endpoint is None:
+            raise NoMasterMavlinkEndpoint("Mavlink master endpoint was not set. Cannot reconfigure router.")
+        if not await self.is_running() or self._subprocess is None:
+            await self.start(self._master_endpoint)
+            return
+        if self.assemble_command(self._master_endpoint) == self._command:
+            logger.debug("Router is already running with the current endpoints.")
+            return
+
+        current_process = self._subprocess
+        current_command, current_resources = self._command, self._resources
+        if not current_resources & self.exclusive_resources(self._master_endpoint):
+            try:
+                await self.start(self._master_endpoint)
+                await self._stop_process(current_process)
+                logger.debug("Router reconfigured without stopping the links.")
+                return
+            except MavlinkRouterStartFail as error:
+                logger.warning(f"New router could not run alongside the current one, restarting it. {error}")
+                self._subprocess = current_process
+                self._command, self._resources = current_command, current_resources
+
+        await self.restart()
+
     async def start_house_keepers(self) -> None:
         if self._subprocess is None:
             return
         # Ensure that the logging tasks are awaited and executed
-        asyncio.create_task(self._log_stdout())
-        asyncio.create_task(self._log_stderr())
-
-    async def _log_stdout(self) -> None:
-        while self._subprocess is not None:
-            if self._subprocess.stdout:
-                stdout_line = await self._subprocess.stdout.readline()
-                if stdout_line:
-                    logger.debug(f"Router: {stdout_line.decode().strip()}")
-                else:
-                    break  # EOF reached
-            await asyncio.sleep(0.01)
-
-    async def _log_stderr(self) -> None:
-        while self._subprocess is not None:
-            if self._subprocess.stderr:
-                stderr_line = await self._subprocess.stderr.readline()
-                if stderr_line:
-                    logger.debug(f"Router: {stderr_line.decode().strip()}")
-                else:
-                    break  # EOF reached
-            await asyncio.sleep(0.01)
+        asyncio.create_task(self._log_stdout(self._subprocess))
+        asyncio.create_task(self._log_stderr(self._subprocess))
+
+    async def _log_stdout(self, process: asyncio.subprocess.Process) -> None:
+        # Each task follows its own process, routers being replaced are still logged until they exit
+        while process.stdout:
+            stdout_line = await process.stdout.readline()
+            if not stdout_line:
+                break  # EOF reached
+            logger.debug(f"Router: {stdout_line.decode().strip()}")
+
+    async def _log_stderr(self, process: asyncio.subprocess.Process) -> None:
+        while process.stderr:
+            stderr_line = await process.stderr.readline()
+            if not stderr_line:
+                break  # EOF reached
+            logger.debug(f"Router: {stderr_line.decode().strip()}")
 
     async def restart(self) -> None:
         if self._master_endpoint is None:
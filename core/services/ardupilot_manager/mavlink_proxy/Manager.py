@@ -143,6 +143,15 @@ class Manager:
         self._last_valid_endpoints = self.endpoints()
         self.should_be_running = True
 
+    async def reconfigure(self) -> None:
+        # The router may be briefly stopped while being replaced, which is not a failure to recover from
+        self.should_be_running = False
+        try:
+            await self.tool.reconfigure()
+            self._last_valid_endpoints = self.endpoints()
+        finally:
+            self.should_be_running = True
+
     def command_line(self) -> str:
         if self.master_endpoint is None:
             raise NoMasterMavlinkEndpoint("Mavlink master endpoint was not set. Cannot build command line.")
@@ -3,15 +3,19 @@ import os
 import pathlib
 import pty
 import re
+import shlex
+import socket
 import sys
+import time
 import warnings
-from typing import List, Set
+from typing import Dict, List, Optional, Set
 
 import pytest
 
 # import local library
 sys.path.append(str(pathlib.Path(__file__).absolute().parent.parent))
 
+from exceptions import MavlinkRouterStartFail
 from mavlink_proxy.AbstractRouter import AbstractRouter
 from mavlink_proxy.Endpoint import Endpoint
 from mavlink_proxy.MAVLinkRouter import MAVLinkRouter
@@ -22,6 +26,57 @@ from typedefs import EndpointType
 _, slave_port = pty.openpty()
 serial_port_name = os.ttyname(slave_port)
 
+# Router imitation that opens the server sockets of its arguments and runs until terminated
+FAKE_ROUTER_SCRIPT = """
+import signal, socket, sys
+sockets = []
+for argument in sys.argv[1:]:
+    kind, port = argument.split(":")
+    if kind in ["udps", "tcps"]:
+        server = socket.socket(type=socket.SOCK_DGRAM if kind == "udps" else socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", int(port)))
+        if kind == "tcps":
+            server.listen()
+        sockets.append(server)
+signal.pause()
+"""
+
+
+class FakeRouter(AbstractRouter):
+    def _get_version(self) -> Optional[str]:
+        return "1.0.0"
+
+    def assemble_command(self, master_endpoint: Endpoint) -> str:
+        kinds: Dict[str, str] = {EndpointType.UDPServer.value: "udps", EndpointType.TCPServer.value: "tcps"}
+        arguments = [
+            f"{kinds.get(endpoint.connection_type, 'client')}:{endpoint.argument}"
+            for endpoint in [master_endpoint, *sorted(self.endpoints(), key=str)]
+        ]
+        return shlex.join([sys.executable, "-c", FAKE_ROUTER_SCRIPT, *arguments])
+
+    @staticmethod
+    def name() -> str:
+        return "FakeRouter"
+
+    @staticmethod
+    def binary_name() -> str:
+        return "python3"
+
+    @staticmethod
+    def _validate_endpoint(endpoint: Endpoint) -> None:
+        pass
+
+    @staticmethod
+    def is_ok() -> bool:
+        # Never offered as an available router
+        return False
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return int(probe.getsockname()[1])
+
 
 @pytest.fixture
 def valid_output_endpoints() -> Set[Endpoint]:
@@ -303,3 +358,77 @@ async def run_common_routing_tests(
     # Test endpoint combinationsin two orders: regular and reversed
     await test_endpoint_combinations(allowed_master_endpoints, sorted_endpoints)
     await test_endpoint_combinations(allowed_master_endpoints, sorted_endpoints[::-1])
+
+
+@pytest.mark.timeout(30)
+@pytest.mark.asyncio
+async def test_router_reconfiguration() -> None:
+    def endpoint(name: str, connection_type: EndpointType, port: int) -> Endpoint:
+        return Endpoint(name=name, owner="pytest", connection_type=connection_type, place="127.0.0.1", argument=port)
+
+    router = FakeRouter()
+    server_endpoint = endpoint("Server", EndpointType.TCPServer, free_port())
+    router.add_endpoint(server_endpoint)
+    start_time = time.monotonic()
+    master_endpoint = endpoint("Master", EndpointType.TCPClient, free_port())
+    await router.start(master_endpoint)
+    assert time.monotonic() - start_time < 2, "Router took the whole start timeout."
+    assert router.exclusive_resources(master_endpoint) <= router._bound_sockets(router.process())
+
+    # Nothing changed
+    process = router.process()
+    await router.reconfigure()
+    assert router.process() is process
+
+    # A new client endpoint can be served by a new router running alongside the current one
+    router.remove_endpoint(server_endpoint)
+    router.add_endpoint(endpoint("Client", EndpointType.UDPClient, free_port()))
+    await router.reconfigure()
+    assert router.process() is not process and process.returncode is not None
+    assert await router.is_running()
+
+    # Server sockets can't be shared, so the current router is stopped first
+    process = router.process()
+    router.add_endpoint(endpoint("Server", EndpointType.UDPServer, free_port()))
+    await router.reconfigure()
+    process = router.process()
+    router.add_endpoint(endpoint("Other client", EndpointType.UDPClient, free_port()))
+    start_time = time.monotonic()
+    await router.reconfigure()
+    assert router.process() is not process and process.returncode is not None
+    assert await router.is_running()
+    assert time.monotonic() - start_time < 2, "Router took too long to restart."
+
+    start_time = time.monotonic()
+    await router.exit()
+    assert not await router.is_running()
+    assert time.monotonic() - start_time < 2, "Router took too long to exit."
+
+
+class SilentRouter(FakeRouter):
+    START_TIMEOUT = 0.5
+
+    def assemble_command(self, master_endpoint: Endpoint) -> str:
+        return shlex.join([sys.executable, "-c", "import signal; signal.pause()"])
+
+
+@pytest.mark.timeout(30)
+@pytest.mark.asyncio
+async def test_router_start_timeout() -> None:
+    router = SilentRouter()
+    router.add_endpoint(
+        Endpoint(
+            name="Server", owner="pytest", connection_type=EndpointType.UDPServer, place="0.0.0.0", argument=free_port()
+        )
+    )
+    with pytest.raises(MavlinkRouterStartFail):
+        await router.start(
+            Endpoint(
+                name="Master",
+                owner="pytest",
+                connection_type=EndpointType.TCPClient,
+                place="127.0.0.1",
+                argument=free_port(),
+            )
+        )
+    assert not await router.is_running()
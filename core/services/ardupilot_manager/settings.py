@@ -18,7 +18,8 @@ class Settings:
     firmware_folder = Path.joinpath(settings_path, "firmware")
     user_firmware_folder = Path("/usr/blueos/userdata/firmware")
     log_path = Path.joinpath(settings_path, "logs")
-    app_folders = [settings_path, firmware_folder, log_path, user_firmware_folder]
+    cache_folder = Path.joinpath(settings_path, "cache")
+    app_folders = [settings_path, firmware_folder, log_path, user_firmware_folder, cache_folder]
 
     blueos_files_folder = Path.joinpath(Path.home(), "blueos-files")
     defaults_folder = Path.joinpath(blueos_files_folder, "ardupilot-manager/default")
@@ -211,3 +211,25 @@ class Serial(BaseModel):
 
     def __hash__(self) -> int:  # make hashable BaseModel subclass
         return hash(self.port + self.endpoint)
+
+
+class WatchdogStatus(BaseModel):
+    running: bool
+    restarts: int
+    last_exit_code: Optional[int]
+    last_exit_time: Optional[float]
+    # Time, in seconds, between the last exit and the firmware running again
+    last_downtime: Optional[float]
+    total_downtime: float
+
+
+class DownloadProgress(BaseModel):
+    url: str
+    # Bytes already in the disk, including the ones of previous attempts
+    downloaded: int
+    # Size of the file, None while it is unknown
+    total: Optional[int]
+    # Path of the cached file, only set when the download is done
+    path: Optional[str] = None
+    # If the file was already in the cache
+    cached: bool = False
@@ -1,23 +1,27 @@
 #! /usr/bin/env python3
+import asyncio
 import json
 import logging
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 import appdirs
-import dpath
-import uvicorn
 from commonwealth.utils.apis import GenericErrorHandlingRoute
 from commonwealth.utils.logs import InterceptHandler, init_logger
-from fastapi import Body, FastAPI, HTTPException
+from commonwealth.utils.streaming import streamer
+from fastapi import Body, FastAPI, Header, HTTPException
 from fastapi import Path as FastPath
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi_versioning import VersionedFastAPI, version
 from loguru import logger
 from pydantic import BaseModel
+from uvicorn import Config, Server
+
+from store import Store
 
 SERVICE_NAME = "bag-of-holding"
 FILE_PATH = Path(appdirs.user_config_dir(SERVICE_NAME, "db.json"))
+JOURNAL_PATH = FILE_PATH.with_name(f"{FILE_PATH.name}.journal")
 
 logging.basicConfig(handlers=[InterceptHandler()], level=0)
 init_logger(SERVICE_NAME)
@@ -31,6 +35,7 @@ app = FastAPI(
 )
 app.router.route_class = GenericErrorHandlingRoute
 logger.info(f"Starting Bag of Holding: {FILE_PATH}")
+store = Store(FILE_PATH, JOURNAL_PATH)
 
 app = FastAPI()
 
@@ -40,23 +45,20 @@ class KeyValue(BaseModel):
     value: Any
 
 
-def read_db() -> Any:
-    try:
-        with open(FILE_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+class ManyValues(BaseModel):
+    values: Dict[str, Any]
+    missing: List[str]
 
 
-def write_db(data: Dict[str, Any]) -> None:
-    with open(FILE_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f)
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
 
 @app.post("/overwrite")
 async def overwrite_data(payload: dict[str, Any] = Body(...)) -> JSONResponse:
     logger.debug(f"Overwrite: {json.dumps(payload)}")
-    write_db(payload)
+    store.overwrite(payload)
     return JSONResponse(content={"status": "success"})
 
 
@@ -64,26 +66,54 @@ async def overwrite_data(payload: dict[str, Any] = Body(...)) -> JSONResponse:
 @version(1, 0)
 async def write_data(path: str = FastPath(..., regex=r"^.*$"), payload: Any = Body(...)) -> JSONResponse:
     logger.debug(f"Write path: {path}, {json.dumps(payload)}")
-    current_data = read_db()
-    dpath.new(current_data, path, payload)
-    write_db(current_data)
+    store.set(path, payload)
+    return JSONResponse(content={"status": "success"})
+
+
+@app.post("/set_many")
+@version(1, 0)
+async def write_many(payload: Dict[str, Any] = Body(...)) -> JSONResponse:
+    """Writes the values of all paths at once, "payload" maps each path to its value."""
+    logger.debug(f"Write paths: {list(payload.keys())}")
+    store.set_many(payload)
     return JSONResponse(content={"status": "success"})
 
 
 @app.get("/get/{path:path}")
 @version(1, 0)
-async def read_data(path: str) -> JSONResponse:
+async def read_data(path: str, if_none_match: Optional[str] = Header(None)) -> Response:
+    """Reads the value at "path". Clients sending the ETag of their last read get a 304 if it didn't change."""
     logger.debug(f"Get path: {path}")
-    current_data = read_db()
+    headers = {"ETag": store.etag(path)}
 
     if path == "*":
-        return JSONResponse(current_data)
+        result = store.data
+    else:
+        try:
+            result = store.get(path)
+        except KeyError:
+            raise HTTPException(status_code=400, detail="Invalid path") from KeyError
+
+    if if_none_match is not None and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(result, headers=headers)
 
-    try:
-        result = dpath.get(current_data, path)
-        return JSONResponse(result)
-    except KeyError:
-        raise HTTPException(status_code=400, detail="Invalid path") from KeyError
+
+@app.get("/watch/{path:path}")
+@version(1, 0)
+async def watch_data(path: str) -> StreamingResponse:
+    """Streams the current value of "path" and every change to it, each one with the path changed and its revision."""
+    logger.debug(f"Watch path: {path}")
+    return StreamingResponse(streamer(store.watch(path)))
+
+
+@app.post("/get_many", response_model=ManyValues)
+@version(1, 0)
+async def read_many(paths: List[str] = Body(...)) -> Any:
+    """Reads many paths at once, paths that don't exist are listed as missing instead of failing the request."""
+    logger.debug(f"Get paths: {paths}")
+    values, missing = store.get_many(paths)
+    return ManyValues(values=values, missing=missing)
 
 
 app = VersionedFastAPI(app, version="1.0.0", prefix_format="/v{major}.{minor}", enable_latest=True)
@@ -102,5 +132,13 @@ async def root() -> HTMLResponse:
 
 
 if __name__ == "__main__":
+    loop = asyncio.new_event_loop()
+
     # Running uvicorn with log disabled so loguru can handle it
-    uvicorn.run(app, host="0.0.0.0", port=9101, log_config=None)
+    config = Config(app=app, loop=loop, host="0.0.0.0", port=9101, log_config=None)
+    server = Server(config)
+
+    loop.create_task(store.run())
+    loop.run_until_complete(server.serve())
+    # Writes made since the last sync are not lost when the service is stopped
+    loop.run_until_complete(store.close())
@@ -0,0 +1,295 @@
+import asyncio
+import glob
+import json
+import os
+import shutil
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, List, Optional, TextIO, Tuple
+from uuid import uuid4
+
+import dpath
+from loguru import logger
+
+SEPARATOR = "/"
+
+
+@dataclass
+class Change:
+    path: str
+    value: Any
+    revision: int
+
+
+def split_path(path: str) -> List[str]:
+    return [segment for segment in path.split(SEPARATOR) if segment]
+
+
+def literal_prefix(path: str) -> Tuple[str, ...]:
+    """Returns the segments of "path" before the first glob."""
+    segments: List[str] = []
+    for segment in split_path(path):
+        if glob.has_magic(segment):
+            break
+        segments.append(segment)
+    return tuple(segments)
+
+
+def is_related(path: Tuple[str, ...], other_path: Tuple[str, ...]) -> bool:
+    """True when one of the paths contains the other, so changing one of them changes the other."""
+    length = min(len(path), len(other_path))
+    return path[:length] == other_path[:length]
+
+
+def child(node: Any, segment: str) -> Any:
+    """Returns the child of a dict or list, raising KeyError when it does not exist."""
+    if isinstance(node, dict):
+        return node[segment]
+    if isinstance(node, list) and segment.isdigit() and int(segment) < len(node):
+        return node[int(segment)]
+    raise KeyError(segment)
+
+
+class Store:
+    # pylint: disable=too-many-instance-attributes
+    """In-memory JSON document, persisted with a snapshot and an append-only journal.
+
+    Reads never touch the disk. Writes change the document in memory and are appended to the journal,
+    which is flushed and synced in batches every FLUSH_INTERVAL seconds instead of once per write.
+    When the journal grows past COMPACTION_SIZE, the whole document is written as a new snapshot
+    and atomically renamed over the previous one, after which the journal starts again.
+    """
+
+    # Time, in seconds, between syncs of the journal to the disk
+    FLUSH_INTERVAL = 1.0
+    # Journal size, in bytes, that triggers a new snapshot
+    COMPACTION_SIZE = 1024 * 1024
+    # Changes kept for each watcher that is not reading them
+    WATCH_QUEUE_SIZE = 1000
+
+    def __init__(self, snapshot_path: Path, journal_path: Path) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        # Journal being compacted, writes made in the meantime go to a new journal
+        self.compacting_journal_path = journal_path.with_name(f"{journal_path.name}.compacting")
+        self.data: Dict[str, Any] = {}
+        self._journal: Optional[TextIO] = None
+        self._pending_writes = 0
+        self._lock = asyncio.Lock()
+        # Revisions are counted from the start of the service, the epoch tells apart ETags of different runs
+        self.epoch = uuid4().hex[:8]
+        self.revision = 0
+        # Last revision that changed anything inside each path
+        self._subtree_revisions: Dict[Tuple[str, ...], int] = {}
+        # Last revision that replaced the value of each path
+        self._set_revisions: Dict[Tuple[str, ...], int] = {}
+        # Watchers, with the path they are watching
+        self._watchers: Dict["asyncio.Queue[Optional[str]]", Tuple[str, ...]] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+
+        # Operations are replayed in order, so the ones already in the snapshot end with the same result
+        replayed = 0
+        for journal_path in [self.compacting_journal_path, self.journal_path]:
+            try:
+                replayed += self._replay(journal_path)
+            except FileNotFoundError:
+                pass
+        logger.info(f"Loaded {self.snapshot_path} and {replayed} journal entries.")
+
+    def _replay(self, journal_path: Path) -> int:
+        replayed = 0
+        with open(journal_path, "r+", encoding="utf-8") as f:
+            lines = f.readlines()
+            if lines and not lines[-1].endswith("\n"):
+                # Written while the service was stopping, removed so the next entries start on a new line
+                logger.warning(f"Dropping incomplete entry at the end of {journal_path}.")
+                incomplete_line = lines.pop()
+                f.truncate(f.tell() - len(incomplete_line.encode("utf-8")))
+        for line in lines:
+            try:
+                self._apply(json.loads(line))
+                replayed += 1
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError) as error:
+                logger.warning(f"Ignoring invalid journal entry: {error}")
+        return replayed
+
+    def _apply(self, entry: Dict[str, Any]) -> None:
+        if entry["op"] == "overwrite":
+            self.data = entry["value"]
+        elif entry["op"] == "set":
+            dpath.new(self.data, entry["path"], entry["value"])
+        else:
+            raise KeyError(f"Unknown operation {entry['op']}")
+
+    def _write(self, entries: List[Dict[str, Any]]) -> None:
+        # Serialized before changing anything, so values that are not JSON leave the store untouched
+        lines = [json.dumps(entry) + "\n" for entry in entries]
+        applied_lines: List[str] = []
+        try:
+            for entry, line in zip(entries, lines):
+                self._apply(entry)
+                applied_lines.append(line)
+                self._record_change(entry)
+        finally:
+            # Entries applied before a failure are in memory, so they must be in the journal as well
+            if applied_lines:
+                if self._journal is None:
+                    self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+                    # pylint: disable-next=consider-using-with
+                    self._journal = open(self.journal_path, "a", encoding="utf-8")
+                self._journal.write("".join(applied_lines))
+                self._pending_writes += len(applied_lines)
+
+    def _record_change(self, entry: Dict[str, Any]) -> None:
+        self.revision += 1
+        segments = tuple(split_path(entry.get("path", "")))
+        if entry["op"] == "overwrite":
+            self._subtree_revisions.clear()
+            self._set_revisions.clear()
+        self._set_revisions[segments] = self.revision
+        for length in range(len(segments) + 1):
+            self._subtree_revisions[segments[:length]] = self.revision
+        self._publish(segments, Change(path=SEPARATOR.join(segments), value=entry["value"], revision=self.revision))
+
+    def _publish(self, segments: Tuple[str, ...], change: Change) -> None:
+        watchers = [queue for queue, watched_path in self._watchers.items() if is_related(watched_path, segments)]
+        if not watchers:
+            return
+        # Serialized once for all watchers, and before later writes can change the value
+        message = json.dumps(asdict(change))
+        for queue in watchers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Ends the watch instead of silently missing changes, the client has to read the value again
+                logger.warning("Stopping watcher that is not reading the changes.")
+                del self._watchers[queue]
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def path_revision(self, path: str) -> int:
+        """Returns the last revision that changed the value of "path", globs use the path before the first glob."""
+        segments = literal_prefix(path)
+        revisions = [self._set_revisions.get(segments[:length], 0) for length in range(len(segments) + 1)]
+        return max(self._subtree_revisions.get(segments, 0), *revisions)
+
+    def etag(self, path: str) -> str:
+        return f'"{self.epoch}-{self.path_revision(path)}"'
+
+    async def watch(self, path: str) -> AsyncGenerator[str, None]:
+        """Yields the current value of "path" and then every change to it, or to anything inside or above it.
+        Globs watch the path before the first glob."""
+        segments = literal_prefix(path)
+        queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=self.WATCH_QUEUE_SIZE)
+        self._watchers[queue] = segments
+        try:
+            try:
+                watched_path = SEPARATOR.join(segments)
+                current = Change(path=watched_path, value=self.get(watched_path), revision=self.path_revision(path))
+                yield json.dumps(asdict(current))
+            except KeyError:
+                pass
+            while True:
+                message = await queue.get()
+                if message is None:
+                    raise RuntimeError("Too many changes to follow.")
+                yield message
+        finally:
+            self._watchers.pop(queue, None)
+
+    def get(self, path: str) -> Any:
+        """Returns the value at "path", which may be a dpath glob. Raises KeyError if nothing matches.
+
+        The nested dicts are the prefix index: the literal part of the path is followed directly, and only
+        the part after the first glob is searched by dpath.
+        """
+        segments = split_path(path)
+        node: Any = self.data
+        for index, segment in enumerate(segments):
+            if glob.has_magic(segment):
+                return dpath.get(node, SEPARATOR.join(segments[index:]))
+            node = child(node, segment)
+        return node
+
+    def get_many(self, paths: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """Returns the values found, and the paths that were not."""
+        found: Dict[str, Any] = {}
+        missing: List[str] = []
+        for path in paths:
+            try:
+                found[path] = self.get(path)
+            except (KeyError, ValueError):
+                missing.append(path)
+        return found, missing
+
+    def set(self, path: str, value: Any) -> None:
+        self._write([{"op": "set", "path": path, "value": value}])
+
+    def set_many(self, values: Dict[str, Any]) -> None:
+        self._write([{"op": "set", "path": path, "value": value} for path, value in values.items()])
+
+    def overwrite(self, data: Dict[str, Any]) -> None:
+        self._write([{"op": "overwrite", "value": data}])
+
+    def _write_snapshot(self, content: str) -> None:
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.snapshot_path.with_name(f"{self.snapshot_path.name}.tmp")
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.snapshot_path)
+        # Only removed after the snapshot is in place, a crash in between replays what is already there
+        os.remove(self.compacting_journal_path)
+
+    def _set_journal_aside(self) -> None:
+        if not self.compacting_journal_path.exists():
+            os.replace(self.journal_path, self.compacting_journal_path)
+            return
+        # Left by a compaction that failed, its entries are not in the snapshot yet
+        with open(self.journal_path, "r", encoding="utf-8") as journal, open(
+            self.compacting_journal_path, "a", encoding="utf-8"
+        ) as compacting_journal:
+            shutil.copyfileobj(journal, compacting_journal)
+        os.remove(self.journal_path)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending_writes or self._journal is None:
+                return
+            loop = asyncio.get_running_loop()
+            pending_writes, self._pending_writes = self._pending_writes, 0
+            # Writes only reach the buffer of the file, they are handed to the OS here, on the loop
+            self._journal.flush()
+            if self._journal.tell() > self.COMPACTION_SIZE:
+                # The document is serialized and the journal set aside on the loop, so no write is lost in between
+                content = json.dumps(self.data)
+                self._journal.close()
+                self._journal = None
+                self._set_journal_aside()
+                await loop.run_in_executor(None, self._write_snapshot, content)
+                logger.debug(f"Compacted journal into {self.snapshot_path}.")
+            else:
+                await loop.run_in_executor(None, os.fsync, self._journal.fileno())
+            logger.debug(f"Synced {pending_writes} writes.")
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as error:
+                logger.exception(f"Failed to sync the database: {error}")
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
@@ -0,0 +1,160 @@
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+import main
+from store import Store
+
+
+def open_store(folder: Path) -> Store:
+    return Store(folder / "db.json", folder / "db.journal")
+
+
+def crash_on_remove(path: Any) -> None:
+    raise OSError(f"Stopped before removing {path}")
+
+
+@pytest.mark.asyncio
+async def test_truncated_journal(tmp_path: Path) -> None:
+    store = open_store(tmp_path)
+    store.set("a", 1)
+    store.set("b", {"c": 2})
+    await store.close()
+    with open(store.journal_path, "a", encoding="utf-8") as journal:
+        journal.write('{"op": "set", "path": "d", "val')
+
+    store = open_store(tmp_path)
+    assert store.data == {"a": 1, "b": {"c": 2}}
+
+    # New entries start on their own line instead of continuing the incomplete one
+    store.set("d", 3)
+    await store.close()
+    assert open_store(tmp_path).data == {"a": 1, "b": {"c": 2}, "d": 3}
+
+
+@pytest.mark.asyncio
+async def test_crash_during_compaction(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    store = open_store(tmp_path)
+    store.COMPACTION_SIZE = 0
+    store.set("a", {"b": 1})
+    store.set("a/c", 2)
+    store.set("a", {"d": 3})
+    store.set("a/e", 4)
+    data = store.data
+
+    monkeypatch.setattr(os, "remove", crash_on_remove)
+    with pytest.raises(OSError):
+        await store.flush()
+    monkeypatch.undo()
+
+    # The snapshot already has the entries of the compacting journal, replaying them again changes nothing
+    assert store.snapshot_path.exists() and store.compacting_journal_path.exists()
+    assert open_store(tmp_path).data == data
+
+
+@pytest.mark.asyncio
+async def test_failed_compaction(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    store = open_store(tmp_path)
+    store.COMPACTION_SIZE = 0
+    store.set("a", 1)
+    await store.flush()
+
+    def fail_snapshot(_content: str) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(store, "_write_snapshot", fail_snapshot)
+    store.set("b", 2)
+    with pytest.raises(OSError):
+        await store.flush()
+    assert open_store(tmp_path).data == {"a": 1, "b": 2}
+
+    # A second failure keeps the entries set aside by the first one
+    store.set("c", 3)
+    with pytest.raises(OSError):
+        await store.flush()
+    assert open_store(tmp_path).data == {"a": 1, "b": 2, "c": 3}
+
+    monkeypatch.undo()
+    store.set("d", 4)
+    await store.close()
+    assert not store.compacting_journal_path.exists()
+    assert open_store(tmp_path).data == {"a": 1, "b": 2, "c": 3, "d": 4}
+
+
+def test_etag(tmp_path: Path) -> None:
+    store = open_store(tmp_path)
+    store.set("vehicle", {"name": "BlueBoat", "mode": "manual"})
+    name_etag = store.etag("vehicle/name")
+    vehicle_etag = store.etag("vehicle")
+
+    # Writes to siblings don't change the value
+    store.set("vehicle/mode", "auto")
+    store.set("other", 1)
+    assert store.etag("vehicle/name") == name_etag
+    assert store.etag("vehicle") != vehicle_etag
+
+    # Writes to parents may
+    store.set("vehicle", {"name": "BlueBoat"})
+    assert store.etag("vehicle/name") != name_etag
+    name_etag = store.etag("vehicle/name")
+    store.overwrite({"vehicle": {"name": "BlueBoat"}})
+    assert store.etag("vehicle/name") != name_etag
+
+    # Globs use the path before the first glob
+    assert store.etag("vehicle/*") == store.etag("vehicle")
+    glob_etag = store.etag("vehicle/*/name")
+    store.set("vehicle/mode", "manual")
+    assert store.etag("vehicle/*/name") != glob_etag
+
+
+@pytest.mark.asyncio
+async def test_read_not_modified(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    store = open_store(tmp_path)
+    store.set("vehicle/name", "BlueBoat")
+    monkeypatch.setattr(main, "store", store)
+
+    response = await main.read_data("vehicle/name", if_none_match=None)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response = await main.read_data("vehicle/name", if_none_match=f'"other", W/{etag}')
+    assert response.status_code == 304 and response.headers["ETag"] == etag
+
+    store.set("vehicle/name", "BlueROV")
+    response = await main.read_data("vehicle/name", if_none_match=etag)
+    assert response.status_code == 200 and json.loads(response.body) == "BlueROV"
+
+
+@pytest.mark.asyncio
+async def test_watch(tmp_path: Path) -> None:
+    store = open_store(tmp_path)
+    store.set("vehicle/name", "BlueBoat")
+    watch = store.watch("vehicle/*")
+    assert json.loads(await anext(watch)) == {"path": "vehicle", "value": {"name": "BlueBoat"}, "revision": 1}
+
+    store.set("other", 1)
+    store.set("vehicle/name", "BlueROV")
+    store.overwrite({"vehicle": {}})
+    assert json.loads(await anext(watch)) == {"path": "vehicle/name", "value": "BlueROV", "revision": 3}
+    assert json.loads(await anext(watch)) == {"path": "", "value": {"vehicle": {}}, "revision": 4}
+    await watch.aclose()
+
+
+@pytest.mark.asyncio
+async def test_watch_overflow(tmp_path: Path) -> None:
+    store = open_store(tmp_path)
+    store.WATCH_QUEUE_SIZE = 2
+    store.set("vehicle/index", 0)
+    watch = store.watch("vehicle")
+    assert json.loads(await anext(watch))["value"] == {"index": 0}
+    for index in range(1, 4):
+        store.set("vehicle/index", index)
+
+    # The changes that didn't fit are not silently skipped, the watch ends instead
+    changes = []
+    with pytest.raises(RuntimeError):
+        async for change in watch:
+            changes.append(json.loads(change)["value"])
+    assert changes == [2]
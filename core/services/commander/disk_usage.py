@@ -0,0 +1,162 @@
+import asyncio
+import heapq
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from loguru import logger
+from pydantic import BaseModel
+
+
+class FileUsage(BaseModel):
+    path: str
+    size: int
+
+
+class DiskUsage(BaseModel):
+    # Total size, in bytes
+    total: int
+    files: int
+    # Size, in bytes, of each folder in the root, files directly in the root are under "."
+    services: Dict[str, int]
+    largest_files: List[FileUsage]
+    updated_at: float
+
+
+@dataclass
+class ScannedDirectory:
+    mtime_ns: int
+    # Size and modification time of each file
+    files: Dict[str, Tuple[int, float]] = field(default_factory=dict)
+    subdirectories: List[str] = field(default_factory=list)
+
+
+def scan_directory(path: str, mtime_ns: int) -> ScannedDirectory:
+    scanned = ScannedDirectory(mtime_ns)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    scanned.subdirectories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    scanned.files[entry.name] = (stat.st_size, stat.st_mtime)
+            except FileNotFoundError:
+                # Deleted while being scanned
+                continue
+    return scanned
+
+
+class DiskUsageTracker:
+    """Keeps the disk usage of a folder tree up to date in the background, so it can be read at any time.
+
+    Directories are only listed again when their modification time changes, which happens when files are
+    created, deleted or renamed. Files that grow without changing their directory, like logs being written,
+    are only checked again while they were modified recently; older files are settled and only checked by
+    the periodic full rescan.
+    """
+
+    # Time, in seconds, between refreshes
+    REFRESH_INTERVAL = 10.0
+    # Time, in seconds, since the last modification for a file to be considered still being written
+    ACTIVE_FILE_AGE = 600.0
+    # Time, in seconds, between rescans of every file
+    FULL_RESCAN_INTERVAL = 3600.0
+    # Largest files kept in the usage
+    TOP_FILES = 20
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.directories: Dict[str, ScannedDirectory] = {}
+        self.usage = DiskUsage(total=0, files=0, services={}, largest_files=[], updated_at=0.0)
+        self.ready = asyncio.Event()
+        self.last_full_scan_time = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def _update_active_files(self, path: str, scanned: ScannedDirectory, now: float) -> None:
+        for name, (_size, mtime) in list(scanned.files.items()):
+            if now - mtime > self.ACTIVE_FILE_AGE:
+                continue
+            try:
+                stat = os.stat(os.path.join(path, name), follow_symlinks=False)
+                scanned.files[name] = (stat.st_size, stat.st_mtime)
+            except FileNotFoundError:
+                del scanned.files[name]
+
+    def _scan(self, full: bool) -> DiskUsage:
+        now = time.time()
+        directories: Dict[str, ScannedDirectory] = {}
+        pending = [str(self.root)]
+        while pending:
+            path = pending.pop()
+            try:
+                mtime_ns = os.stat(path, follow_symlinks=False).st_mtime_ns
+                previous = self.directories.get(path)
+                if full or previous is None or previous.mtime_ns != mtime_ns:
+                    scanned = scan_directory(path, mtime_ns)
+                else:
+                    scanned = previous
+                    self._update_active_files(path, scanned, now)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            except OSError as error:
+                logger.warning(f"Failed to scan {path}: {error}")
+                continue
+            directories[path] = scanned
+            pending.extend(scanned.subdirectories)
+        self.directories = directories
+        return self._summarize(now)
+
+    def _summarize(self, now: float) -> DiskUsage:
+        services: Dict[str, int] = {}
+        total = 0
+        files = 0
+        for path, scanned in self.directories.items():
+            size = sum(file_size for file_size, _mtime in scanned.files.values())
+            relative_parts = Path(path).relative_to(self.root).parts
+            service = relative_parts[0] if relative_parts else "."
+            services[service] = services.get(service, 0) + size
+            total += size
+            files += len(scanned.files)
+        largest_files = heapq.nlargest(
+            self.TOP_FILES,
+            (
+                (file_size, os.path.join(path, name))
+                for path, scanned in self.directories.items()
+                for name, (file_size, _mtime) in scanned.files.items()
+            ),
+        )
+        return DiskUsage(
+            total=total,
+            files=files,
+            services=services,
+            largest_files=[FileUsage(path=path, size=size) for size, path in largest_files],
+            updated_at=now,
+        )
+
+    async def refresh(self, full: bool = False) -> None:
+        async with self._lock:
+            start_time = time.monotonic()
+            loop = asyncio.get_running_loop()
+            try:
+                self.usage = await loop.run_in_executor(None, self._scan, full)
+                if full:
+                    self.last_full_scan_time = start_time
+                logger.debug(f"Scanned {self.root} in {time.monotonic() - start_time:.3f} seconds.")
+            finally:
+                # Requests waiting for the first scan are answered even if it failed
+                self.ready.set()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh(full=time.monotonic() - self.last_full_scan_time > self.FULL_RESCAN_INTERVAL)
+            except Exception as error:
+                logger.exception(f"Failed to refresh the disk usage of {self.root}: {error}")
+            await asyncio.sleep(self.REFRESH_INTERVAL)
+
+    async def get(self) -> DiskUsage:
+        await self.ready.wait()
+        return self.usage
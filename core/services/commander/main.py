@@ -1,4 +1,5 @@
 #! /usr/bin/env python3
+import asyncio
 import logging
 import os
 import shutil
@@ -9,15 +10,17 @@ from pathlib import Path
 from typing import Any
 
 import appdirs
-import uvicorn
 from commonwealth.utils.apis import GenericErrorHandlingRoute
 from commonwealth.utils.commands import run_command
 from commonwealth.utils.general import delete_everything
 from commonwealth.utils.logs import InterceptHandler, init_logger
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Query, status
 from fastapi.responses import HTMLResponse
 from fastapi_versioning import VersionedFastAPI, version
 from loguru import logger
+from uvicorn import Config, Server
+
+from disk_usage import DiskUsage, DiskUsageTracker
 
 SERVICE_NAME = "commander"
 LOG_FOLDER_PATH = os.environ.get("BLUEOS_LOG_FOLDER_PATH", "/var/logs/blueos")
@@ -31,6 +34,7 @@ app = FastAPI(
 )
 app.router.route_class = GenericErrorHandlingRoute
 logger.info("Starting Commander!")
+log_folder_usage = DiskUsageTracker(Path(LOG_FOLDER_PATH))
 
 
 class ShutdownType(str, Enum):
@@ -174,14 +178,24 @@ async def reset_settings(i_know_what_i_am_doing: bool = False) -> Any:
 async def remove_log_services(i_know_what_i_am_doing: bool = False) -> Any:
     check_what_i_am_doing(i_know_what_i_am_doing)
     delete_everything(Path(LOG_FOLDER_PATH))
+    await log_folder_usage.refresh()
 
 
 @app.get("/services/check_log_folder_size", status_code=status.HTTP_200_OK)
 @version(1, 0)
 async def check_log_folder_size() -> Any:
-    log_path = Path(LOG_FOLDER_PATH)
     # Return the total size in bytes
-    return sum(file.stat().st_size for file in log_path.glob("**/*") if file.is_file())
+    return (await log_folder_usage.get()).total
+
+
+@app.get("/services/log_folder_usage", status_code=status.HTTP_200_OK, response_model=DiskUsage)
+@version(1, 0)
+async def get_log_folder_usage(
+    top: int = Query(DiskUsageTracker.TOP_FILES, ge=0, le=DiskUsageTracker.TOP_FILES)
+) -> Any:
+    """Size of the log folder, split by service, with the "top" largest files."""
+    usage = await log_folder_usage.get()
+    return usage.copy(update={"largest_files": usage.largest_files[:top]})
 
 
 @app.get("/environment_variables", status_code=status.HTTP_200_OK)
@@ -243,5 +257,11 @@ if __name__ == "__main__":
     # Register ssh client and remove message from the following commands
     run_command("ls")
 
+    loop = asyncio.new_event_loop()
+
     # Running uvicorn with log disabled so loguru can handle it
-    uvicorn.run(app, host="0.0.0.0", port=9100, log_config=None)
+    config = Config(app=app, loop=loop, host="0.0.0.0", port=9100, log_config=None)
+    server = Server(config)
+
+    loop.create_task(log_folder_usage.run())
+    loop.run_until_complete(server.serve())
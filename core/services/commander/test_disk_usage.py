@@ -0,0 +1,76 @@
+import os
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+import disk_usage
+from disk_usage import DiskUsageTracker
+
+
+@pytest.fixture(name="scanned_paths")
+def fixture_scanned_paths(monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    scanned_paths: List[str] = []
+    scan_directory = disk_usage.scan_directory
+
+    def counting_scan_directory(path: str, mtime_ns: int) -> disk_usage.ScannedDirectory:
+        scanned_paths.append(path)
+        return scan_directory(path, mtime_ns)
+
+    monkeypatch.setattr(disk_usage, "scan_directory", counting_scan_directory)
+    return scanned_paths
+
+
+@pytest.mark.asyncio
+async def test_rescan_changed_directories(tmp_path: Path, scanned_paths: List[str]) -> None:
+    for service in ["ardupilot", "commander"]:
+        (tmp_path / service).mkdir()
+        (tmp_path / service / "first.log").write_bytes(b"0" * 100)
+    tracker = DiskUsageTracker(tmp_path)
+    await tracker.refresh()
+    assert sorted(scanned_paths) == sorted(
+        str(path) for path in [tmp_path, tmp_path / "ardupilot", tmp_path / "commander"]
+    )
+    assert (await tracker.get()).services == {".": 0, "ardupilot": 100, "commander": 100}
+
+    # Unchanged directories are not listed again
+    scanned_paths.clear()
+    await tracker.refresh()
+    assert not scanned_paths
+
+    # Only the directory where a file was created is
+    (tmp_path / "ardupilot" / "second.log").write_bytes(b"0" * 50)
+    await tracker.refresh()
+    assert scanned_paths == [str(tmp_path / "ardupilot")]
+    usage = await tracker.get()
+    assert usage.services["ardupilot"] == 150 and usage.files == 3
+
+    scanned_paths.clear()
+    await tracker.refresh(full=True)
+    assert len(scanned_paths) == 3
+
+
+@pytest.mark.asyncio
+async def test_restat_active_files(tmp_path: Path, scanned_paths: List[str]) -> None:
+    active_log = tmp_path / "active.log"
+    settled_log = tmp_path / "settled.log"
+    active_log.write_bytes(b"0" * 100)
+    settled_log.write_bytes(b"0" * 100)
+    settled_time = time.time() - 2 * DiskUsageTracker.ACTIVE_FILE_AGE
+    os.utime(settled_log, (settled_time, settled_time))
+    tracker = DiskUsageTracker(tmp_path)
+    await tracker.refresh()
+
+    # Files that grow don't change their directory, only the recently modified ones are checked again
+    scanned_paths.clear()
+    for log in [active_log, settled_log]:
+        with open(log, "ab") as f:
+            f.write(b"0" * 50)
+    await tracker.refresh()
+    assert not scanned_paths
+    sizes = {file.path: file.size for file in (await tracker.get()).largest_files}
+    assert sizes == {str(active_log): 150, str(settled_log): 100}
+
+    await tracker.refresh(full=True)
+    assert (await tracker.get()).total == 300
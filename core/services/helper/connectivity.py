@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List
+
+import aiohttp
+from loguru import logger
+
+from typedefs import ConnectivityState, LatencySample, Website, WebsiteStatus
+
+
+class CircuitBreaker:
+    """Skips the checks of a site that keeps failing, waiting exponentially longer between attempts."""
+
+    # Consecutive failures before checks start to be skipped
+    FAILURE_THRESHOLD = 2
+    BASE_DELAY = 10.0
+    MAX_DELAY = 300.0
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.open_until = 0.0
+
+    @property
+    def delay(self) -> float:
+        exponent = max(0, self.failures - self.FAILURE_THRESHOLD)
+        return float(min(self.BASE_DELAY * 2**exponent, self.MAX_DELAY))
+
+    def allows_check(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def succeeded(self) -> None:
+        self.failures = 0
+        self.open_until = 0.0
+
+    def failed(self) -> None:
+        self.failures += 1
+        if self.failures >= self.FAILURE_THRESHOLD:
+            self.open_until = time.monotonic() + self.delay
+
+
+class ConnectivityChecker:
+    """Checks the access to the internet by reaching a set of websites concurrently.
+
+    Each check resolves the site and opens a TCP connection with a short timeout before doing the
+    HTTP request, so an offline vehicle answers quickly. Sites that keep failing are skipped by a
+    circuit breaker, and the last result is kept as the connectivity state that can be read at any time.
+    """
+
+    # Time, in seconds, to resolve a site and connect to it
+    CONNECT_TIMEOUT = 2.0
+    REQUEST_TIMEOUT = 5.0
+    # Latency samples kept for each site
+    HISTORY_SIZE = 120
+
+    def __init__(self, sites: List[Website]) -> None:
+        self.sites = sites
+        self.breakers = {site: CircuitBreaker() for site in sites}
+        self.statuses: Dict[Website, WebsiteStatus] = {site: WebsiteStatus(site=site, online=False) for site in sites}
+        self.history: Dict[Website, Deque[LatencySample]] = {site: deque(maxlen=self.HISTORY_SIZE) for site in sites}
+        self.last_check_time = float("-inf")
+        self.state = ConnectivityState(online=False, checked_at=None, sites={})
+        self._check_lock = asyncio.Lock()
+
+    async def check_site(self, site: Website) -> WebsiteStatus:
+        hostname = str(site.value["hostname"])
+        port = int(str(site.value["port"]))
+        path = str(site.value["path"])
+        log_msg = f"Running check_website for '{hostname}:{port}'"
+
+        breaker = self.breakers[site]
+        if not breaker.allows_check():
+            status = self.statuses[site].copy()
+            status.error = f"Not checked, failed {breaker.failures} times in a row."
+            return status
+
+        status = WebsiteStatus(site=site, online=False)
+        start_time = time.monotonic()
+        try:
+            # Fast path, fails quickly if DNS or the route to the site are not available
+            _reader, writer = await asyncio.wait_for(asyncio.open_connection(hostname, port), self.CONNECT_TIMEOUT)
+            writer.close()
+
+            scheme = "https" if port == 443 else "http"
+            timeout = aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT, connect=self.CONNECT_TIMEOUT)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(f"{scheme}://{hostname}:{port}{path}", allow_redirects=False):
+                    pass
+            status.online = True
+            status.latency = (time.monotonic() - start_time) * 1000
+            logger.debug(f"{log_msg}: Online.")
+            breaker.succeeded()
+        except asyncio.TimeoutError:
+            status.error = f"Timed out after {time.monotonic() - start_time:.1f} seconds."
+        except (OSError, aiohttp.ClientError) as error:
+            status.error = str(error) or type(error).__name__
+        except Exception as error:
+            logger.exception(error)
+            status.error = str(error)
+
+        if not status.online:
+            logger.warning(f"{log_msg}: Offline: {status.error}.")
+            breaker.failed()
+        self.statuses[site] = status
+        self.history[site].append(LatencySample(timestamp=time.time(), latency=status.latency))
+        return status
+
+    async def check(self, max_age: float = 0.0) -> ConnectivityState:
+        """Checks all sites at once, unless the last check is not older than "max_age" seconds.
+        Concurrent calls wait for the check in progress instead of starting another one."""
+        async with self._check_lock:
+            if time.monotonic() - self.last_check_time > max_age:
+                statuses = await asyncio.gather(*(self.check_site(site) for site in self.sites))
+                self.last_check_time = time.monotonic()
+                self.state = ConnectivityState(
+                    online=any(status.online for status in statuses),
+                    checked_at=time.time(),
+                    sites={status.site.name: status for status in statuses},
+                )
+        return self.state
+
+    def latency_history(self) -> Dict[str, List[LatencySample]]:
+        return {site.name: list(samples) for site, samples in self.history.items()}
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from bs4 import BeautifulSoup
+from loguru import logger
+
+from typedefs import ServiceInfo, ServiceMetadata
+
+
+@dataclass
+class ProbeResponse:
+    status: Optional[int] = None
+    decoded_data: Optional[str] = None
+    as_json: Any = None
+    etag: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+
+class ServiceDiscovery:
+    """Detects the web services running on local TCP ports.
+
+    Requests go through a single session that keeps connections alive between probes, and the number of
+    connections open at the same time is capped, so probing many ports at once doesn't swamp the system.
+    Results are cached with a fingerprint of the service's /register_service answer, so a service that
+    didn't change is revalidated with a single request.
+    """
+
+    DOCS_CANDIDATE_URLS = ["/docs", "/v1.0/ui/"]
+    API_CANDIDATE_URLS = ["/docs.json", "/openapi.json", "/swagger.json"]
+    # Maximum number of requests running at the same time, for all ports together
+    MAX_CONCURRENT_REQUESTS = 8
+    REQUEST_TIMEOUT = 1.0
+    MAX_REDIRECTS = 10
+    KEEPALIVE_TIMEOUT = 30.0
+
+    def __init__(self, host: str = "127.0.0.1") -> None:
+        self.host = host
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Detected services by port, with the fingerprint of their answer when they were detected
+        self.cache: Dict[int, Tuple[str, ServiceInfo]] = {}
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.MAX_CONCURRENT_REQUESTS, keepalive_timeout=self.KEEPALIVE_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT),
+                headers={"User-Agent": "python"},
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, port: int, path: str, try_json: bool = False) -> ProbeResponse:
+        """Makes a GET request to the service at "port", never raising."""
+        probe_response = ProbeResponse()
+        headers = {"Accept": "application/json" if try_json else "*/*"}
+        try:
+            session = await self.session()
+            async with session.get(
+                f"http://{self.host}:{port}{path}", headers=headers, max_redirects=self.MAX_REDIRECTS
+            ) as response:
+                probe_response.status = response.status
+                probe_response.etag = response.headers.get("ETag")
+                if response.status != 200:
+                    return probe_response
+                data = await response.read()
+                probe_response.decoded_data = data.decode(response.charset or "utf-8")
+                if try_json:
+                    probe_response.as_json = json.loads(probe_response.decoded_data)
+        except asyncio.TimeoutError:
+            probe_response.error = f"Timed out requesting {path}"
+        except (aiohttp.ClientError, UnicodeDecodeError, json.JSONDecodeError) as error:
+            probe_response.error = str(error)
+        except Exception as error:
+            logger.exception(error)
+            probe_response.error = str(error)
+        return probe_response
+
+    @staticmethod
+    def fingerprint(response: ProbeResponse) -> str:
+        if response.etag is not None:
+            return f"{response.status}:{response.etag}"
+        content = (response.decoded_data or "").encode("utf-8")
+        return f"{response.status}:{hashlib.sha1(content).hexdigest()}"
+
+    async def detect_service(self, port: int, path: Optional[str] = None) -> ServiceInfo:
+        register_response = await self.request(port, "/register_service", try_json=True)
+        fingerprint = self.fingerprint(register_response)
+        cached = self.cache.get(port)
+        if cached is not None and cached[0] == fingerprint:
+            logger.debug(f"Service at port {port} did not change.")
+            return cached[1]
+
+        info = await self.probe(port, path, register_response)
+        # Services that didn't answer may be starting up, so they are probed again next time
+        if register_response.status is not None:
+            self.cache[port] = (fingerprint, info)
+        return info
+
+    async def detect_services(self, ports: Dict[int, Optional[str]]) -> List[ServiceInfo]:
+        """Detects the services on all ports concurrently, "ports" maps each port to its nginx path."""
+        return list(await asyncio.gather(*(self.detect_service(port, path) for port, path in ports.items())))
+
+    async def probe(self, port: int, path: Optional[str], register_response: ProbeResponse) -> ServiceInfo:
+        info = ServiceInfo(valid=False, title="Unknown", documentation_url="", versions=[], port=port, path=path)
+
+        response = await self.request(port, "/")
+        log_msg = f"Detecting service at port {port}"
+        if not response.ok:
+            # If not valid web server, documentation will not be available
+            logger.debug(f"{log_msg}: Invalid")
+            return info
+
+        info.valid = True
+        try:
+            soup = BeautifulSoup(response.decoded_data, features="html.parser")
+            title_element = soup.find("title")
+            info.title = title_element.text if title_element else "Unknown"
+        except Exception as e:
+            logger.warning(f"Failed parsing the service title: {e}")
+
+        response_as_json = register_response.as_json
+        if register_response.ok and isinstance(response_as_json, dict):
+            try:
+                info.metadata = ServiceMetadata.parse_obj(response_as_json)
+                info.metadata.sanitized_name = re.sub(r"[^a-z0-9]", "", info.metadata.name.lower())
+            except Exception as e:
+                logger.warning(f"Failed parsing the received JSON as ServiceMetadata object: {e}")
+        else:
+            logger.debug(f"No metadata received from {info.title} (port {port})")
+
+        # All documentation candidates are requested at once, the first valid one is used
+        documentation_responses = await asyncio.gather(
+            *(self.request(port, documentation_path) for documentation_path in self.DOCS_CANDIDATE_URLS)
+        )
+        for documentation_path, response in zip(self.DOCS_CANDIDATE_URLS, documentation_responses):
+            if response.ok:
+                info.documentation_url = documentation_path
+                info.versions = await self.detect_versions(port)
+                break
+
+        logger.debug(f"{log_msg}: Valid.")
+        return info
+
+    async def detect_versions(self, port: int) -> List[str]:
+        # Get main openapi json description files. The expected data is like:
+        # {
+        #     "paths": {
+        #         "v1.0.0": ...,
+        #         "v2.0.0": ...,
+        #     }
+        # }
+        api_responses = await asyncio.gather(
+            *(self.request(port, api_path, try_json=True) for api_path in self.API_CANDIDATE_URLS)
+        )
+        version_paths = [
+            str(version_path)
+            for response in api_responses
+            if response.ok and isinstance(response.as_json, dict)
+            for version_path in response.as_json.get("paths", {}).keys()
+        ]
+
+        # Check all available versions for the ones that provide a swagger-ui
+        version_responses = await asyncio.gather(*(self.request(port, path) for path in version_paths))
+        return [
+            version_path
+            for version_path, response in zip(version_paths, version_responses)
+            if response.ok and response.decoded_data is not None and "swagger-ui" in response.decoded_data
+        ]
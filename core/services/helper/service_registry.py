@@ -0,0 +1,137 @@
+import asyncio
+from typing import AsyncGenerator, Dict, List, Optional, Set
+
+from loguru import logger
+
+from service_discovery import ServiceDiscovery
+from typedefs import ServiceEvent, ServiceEventType, ServiceInfo
+
+PROC_NET_TCP_FILES = ["/proc/net/tcp", "/proc/net/tcp6"]
+TCP_LISTEN_STATE = "0A"
+# 0.0.0.0 and ::, the addresses that can be accessed by external users
+ANY_ADDRESSES = {"0" * 8, "0" * 32}
+
+
+def listening_sockets(files: Optional[List[str]] = None) -> Dict[int, int]:
+    """Returns the TCP ports listening on all addresses, mapped to the inode of their socket.
+    A service that restarts gets a new socket, so its inode changes even if the port stays the same."""
+    sockets: Dict[int, int] = {}
+    for path in files or PROC_NET_TCP_FILES:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()[1:]
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            # sl local_address rem_address st tx_queue:rx_queue tr:tm->when retrnsmt uid timeout inode ...
+            fields = line.split()
+            address, port = fields[1].split(":")
+            if fields[3] == TCP_LISTEN_STATE and address in ANY_ADDRESSES:
+                sockets[int(port, 16)] = int(fields[9])
+    return sockets
+
+
+class ServiceRegistry:
+    # pylint: disable=too-many-instance-attributes
+    """Keeps the web services running on local ports up to date, and notifies subscribers about changes.
+
+    The listening sockets are checked every REFRESH_INTERVAL seconds, and only ports with a new socket
+    are probed again, so reads are served from memory without scanning anything.
+    """
+
+    # Time, in seconds, between checks of the listening sockets
+    REFRESH_INTERVAL = 1.0
+    # Events kept for each subscriber that is not reading them
+    EVENT_QUEUE_SIZE = 100
+
+    def __init__(
+        self,
+        discovery: ServiceDiscovery,
+        path_map: Dict[int, str],
+        skip_ports: Set[int],
+        kept_ports: Set[int],
+    ) -> None:
+        self.discovery = discovery
+        self.path_map = path_map
+        self.skip_ports = skip_ports
+        # Services that are kept even when their port is not listening anymore
+        self.kept_ports = kept_ports
+        self.services: Dict[int, ServiceInfo] = {}
+        # Valid services, rebuilt on every change
+        self.snapshot: List[ServiceInfo] = []
+        self.sockets: Dict[int, int] = {}
+        self.ready = asyncio.Event()
+        self._subscribers: Set["asyncio.Queue[ServiceEvent]"] = set()
+        self._update_lock = asyncio.Lock()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as error:
+                logger.exception(f"Failed to refresh the services: {error}")
+            await asyncio.sleep(self.REFRESH_INTERVAL)
+
+    async def refresh(self) -> None:
+        sockets = listening_sockets()
+        if sockets == self.sockets and self.ready.is_set():
+            return
+        changed = {port for port, inode in sockets.items() if self.sockets.get(port) != inode} - self.skip_ports
+        lost = set(self.sockets) - set(sockets) - self.kept_ports
+        # A new socket means a new process, which may serve a different service
+        for port in changed:
+            self.discovery.cache.pop(port, None)
+        await self.update(changed, lost)
+        # Only after the update succeeds, so a failed one is retried on the next refresh
+        self.sockets = sockets
+
+    async def revalidate(self, ports: Set[int], force: bool = False) -> None:
+        """Probe known services again, unless "force" is set services that didn't change are kept."""
+        ports = ports & set(self.services)
+        if force:
+            for port in ports:
+                self.discovery.cache.pop(port, None)
+        await self.update(ports, set())
+
+    async def update(self, ports: Set[int], lost: Set[int]) -> None:
+        async with self._update_lock:
+            services = await self.discovery.detect_services({port: self.path_map.get(port) for port in ports})
+            for service in services:
+                self._set_service(service.port, service)
+            for port in lost:
+                self._set_service(port, None)
+            self.snapshot = [service for service in self.services.values() if service.valid]
+        self.ready.set()
+
+    def _set_service(self, port: int, service: Optional[ServiceInfo]) -> None:
+        previous = self.services.pop(port, None)
+        if service is not None:
+            self.services[port] = service
+        was_valid = previous is not None and previous.valid
+        is_valid = service is not None and service.valid
+        if previous is not None and was_valid and not is_valid:
+            self._publish(ServiceEvent(type=ServiceEventType.Removed, service=previous))
+        elif service is not None and is_valid and not was_valid:
+            self._publish(ServiceEvent(type=ServiceEventType.Added, service=service))
+        elif service is not None and previous is not None and is_valid and service.dict() != previous.dict():
+            self._publish(ServiceEvent(type=ServiceEventType.Changed, service=service))
+
+    def _publish(self, event: ServiceEvent) -> None:
+        logger.info(f"Service {event.type.value}: {event.service.title} (port {event.service.port})")
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Dropping service event for a subscriber that is not reading them.")
+
+    async def events(self) -> AsyncGenerator[ServiceEvent, None]:
+        """Yields the current services as added events, followed by every change."""
+        queue: "asyncio.Queue[ServiceEvent]" = asyncio.Queue(maxsize=self.EVENT_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            for service in self.snapshot:
+                yield ServiceEvent(type=ServiceEventType.Added, service=service)
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.discard(queue)
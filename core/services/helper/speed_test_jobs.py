@@ -0,0 +1,185 @@
+import asyncio
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, List, Optional
+from uuid import uuid4
+
+from loguru import logger
+from pydantic import ValidationError
+from speedtest import Speedtest
+
+from typedefs import SpeedTestJob, SpeedTestJobState, SpeedTestResult, SpeedTestStep
+
+
+class SpeedTestJobs:
+    """Runs speed tests as background jobs, one at a time.
+
+    Speedtest is blocking, so the steps run in an executor while the job state is updated on the event loop.
+    Requests for steps that the latest job already runs get that job instead of starting another test,
+    other requests are queued after it.
+    """
+
+    # Finished jobs kept in the history
+    HISTORY_SIZE = 50
+
+    def __init__(self, history_path: Path) -> None:
+        self.history_path = history_path
+        self.speed_test: Optional[Speedtest] = None
+        # Set to stop the running steps, Speedtest checks it between its requests
+        self.shutdown_event = threading.Event()
+        # Queued and running jobs, in the order they were started
+        self.jobs: Dict[str, SpeedTestJob] = {}
+        self._tasks: Dict[str, "asyncio.Task[None]"] = {}
+        self._updated = asyncio.Event()
+        self.history: List[SpeedTestJob] = self._load_history()
+
+    def _load_history(self) -> List[SpeedTestJob]:
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as history_file:
+                return [SpeedTestJob.parse_obj(job) for job in json.load(history_file)]
+        except FileNotFoundError:
+            return []
+        except (json.JSONDecodeError, ValidationError, TypeError) as error:
+            logger.warning(f"Ignoring invalid speed test history: {error}")
+            return []
+
+    def _save_history(self, history: List[Dict[str, Any]]) -> None:
+        try:
+            self.history_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = self.history_path.with_suffix(".tmp")
+            with open(temporary_path, "w", encoding="utf-8") as history_file:
+                json.dump(history, history_file)
+            temporary_path.replace(self.history_path)
+        except OSError as error:
+            logger.warning(f"Failed to save speed test history: {error}")
+
+    def _notify(self) -> None:
+        # Waiters hold the previous event, so replacing it wakes all of them only once
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    @property
+    def current(self) -> Optional[SpeedTestJob]:
+        """The latest job that is queued or running."""
+        return next(reversed(self.jobs.values()), None)
+
+    def start(self, steps: List[SpeedTestStep]) -> SpeedTestJob:
+        latest = self.current
+        if latest is not None and set(steps) <= set(latest.steps):
+            logger.info(f"Speed test {latest.id} already runs {[step.value for step in steps]}.")
+            return latest
+        job = SpeedTestJob(
+            id=uuid4().hex,
+            steps=steps,
+            state=SpeedTestJobState.Running if latest is None else SpeedTestJobState.Queued,
+            started_at=time.time(),
+        )
+        self.jobs[job.id] = job
+        previous_task = self._tasks.get(latest.id) if latest is not None else None
+        self._tasks[job.id] = asyncio.create_task(self._run(job, previous_task))
+        return job
+
+    def get(self, job_id: str) -> SpeedTestJob:
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        for job in self.history:
+            if job.id == job_id:
+                return job
+        raise KeyError(f"Speed test job {job_id} does not exist.")
+
+    def cancel(self, job_id: str) -> SpeedTestJob:
+        job = self.get(job_id)
+        if job.state == SpeedTestJobState.Queued:
+            logger.info(f"Cancelling queued speed test {job_id}.")
+            job.state = SpeedTestJobState.Cancelled
+            self._notify()
+        elif job.state == SpeedTestJobState.Running:
+            logger.info(f"Cancelling speed test {job_id}.")
+            self.shutdown_event.set()
+        return job
+
+    async def wait(self, job: SpeedTestJob) -> SpeedTestJob:
+        task = self._tasks.get(job.id)
+        if task is not None:
+            # Shielded, so a client that gives up doesn't cancel the test for everybody else
+            await asyncio.shield(task)
+        return job
+
+    async def progress(self, job_id: str) -> AsyncGenerator[str, None]:
+        """Yields the job every time it changes, until it is not queued or running anymore."""
+        job = self.get(job_id)
+        while True:
+            updated = self._updated
+            yield job.json()
+            if job.state not in [SpeedTestJobState.Queued, SpeedTestJobState.Running]:
+                return
+            await updated.wait()
+
+    def last_result(self) -> Optional[SpeedTestResult]:
+        if self.speed_test is None:
+            return None
+        try:
+            return SpeedTestResult.parse_obj(self.speed_test.results.dict())
+        except ValidationError:
+            # There are no results before a server is found
+            return None
+
+    def _set_progress(self, job: SpeedTestJob, progress: float) -> None:
+        job.progress = progress
+        self._notify()
+
+    def _run_step(self, step: SpeedTestStep, job: SpeedTestJob, loop: asyncio.AbstractEventLoop) -> None:
+        finished_requests = 0
+
+        def callback(_index: int, request_count: int, end: bool = False, **_flags: bool) -> None:
+            nonlocal finished_requests
+            if end:
+                finished_requests += 1
+                loop.call_soon_threadsafe(self._set_progress, job, finished_requests / request_count)
+
+        if step == SpeedTestStep.BestServer or self.speed_test is None:
+            # Since we are finding a new server, clear previous results
+            self.speed_test = Speedtest(secure=True, shutdown_event=self.shutdown_event)
+            self.speed_test.get_best_server()
+        if step == SpeedTestStep.Download:
+            self.speed_test.download(callback=callback)
+        elif step == SpeedTestStep.Upload:
+            self.speed_test.upload(callback=callback, pre_allocate=False)
+
+    async def _run(self, job: SpeedTestJob, previous_task: Optional["asyncio.Task[None]"]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            if previous_task is not None:
+                # Speedtest is shared by the jobs, so they run one after the other
+                await asyncio.wait([previous_task])
+            if job.state == SpeedTestJobState.Cancelled:
+                return
+            job.state = SpeedTestJobState.Running
+            self.shutdown_event.clear()
+            for step in job.steps:
+                job.step = step
+                job.progress = 0.0
+                self._notify()
+                await loop.run_in_executor(None, self._run_step, step, job, loop)
+                if self.shutdown_event.is_set():
+                    job.state = SpeedTestJobState.Cancelled
+                    break
+                job.progress = 1.0
+                job.result = self.last_result()
+            else:
+                job.state = SpeedTestJobState.Finished
+        except Exception as error:
+            logger.warning(f"Speed test {job.id} failed: {error}")
+            job.state = SpeedTestJobState.Failed
+            job.error = str(error)
+        finally:
+            job.finished_at = time.time()
+            self.history = [*self.history, job][-self.HISTORY_SIZE :]
+            self.jobs.pop(job.id, None)
+            self._tasks.pop(job.id, None)
+            self._notify()
+            await loop.run_in_executor(
+                None, self._save_history, [json.loads(finished_job.json()) for finished_job in self.history]
+            )
@@ -0,0 +1,170 @@
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional
+
+from commonwealth.utils.general import (
+    blueos_version,
+    local_hardware_identifier,
+    local_unique_identifier,
+)
+from pydantic import BaseModel
+
+
+class ServiceMetadata(BaseModel):
+    name: str
+    description: str
+    icon: str
+    company: str
+    version: str
+    webpage: str
+    route: Optional[str]
+    new_page: Optional[bool]
+    extra_query: Optional[str]
+    avoid_iframes: Optional[bool]
+    api: str
+    sanitized_name: Optional[str]
+
+
+class ServiceInfo(BaseModel):
+    valid: bool
+    title: str
+    documentation_url: str
+    versions: List[str]
+    port: int
+    path: Optional[str]
+    metadata: Optional[ServiceMetadata]
+
+    def __hash__(self) -> int:
+        return hash(self.port)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ServiceInfo):
+            return self.port == other.port
+        return False
+
+
+class ServiceEventType(str, Enum):
+    Added = "added"
+    Removed = "removed"
+    Changed = "changed"
+
+
+class ServiceEvent(BaseModel):
+    type: ServiceEventType
+    service: ServiceInfo
+
+
+class Website(Enum):
+    ArduPilot = {
+        "hostname": "firmware.ardupilot.org",
+        "path": "/",
+        "port": 80,
+    }
+    AWS = {
+        "hostname": "amazon.com",
+        "path": "/",
+        "port": 80,
+    }
+    BlueOS = {
+        "hostname": "telemetry.blueos.cloud",
+        "path": "/ping/?"
+        + f"&blueos_id={local_unique_identifier()}"
+        + f"&hardware_id={local_hardware_identifier()}"
+        + f"&version={blueos_version()}",
+        "port": 443,
+    }
+    Cloudflare = {
+        "hostname": "1.1.1.1",
+        "path": "/",
+        "port": 80,
+    }
+    GitHub = {
+        "hostname": "github.com",
+        "path": "/",
+        "port": 80,
+    }
+
+
+class WebsiteStatus(BaseModel):
+    site: Website
+    online: bool
+    error: Optional[str] = None
+    # Time, in milliseconds, to connect and get an answer from the site
+    latency: Optional[float] = None
+
+
+class LatencySample(BaseModel):
+    timestamp: float
+    latency: Optional[float]
+
+
+class ConnectivityState(BaseModel):
+    online: bool
+    checked_at: Optional[float]
+    sites: Dict[str, WebsiteStatus]
+
+
+class SpeedtestServer(BaseModel):
+    url: str
+    lat: str
+    lon: str
+    name: str
+    country: str
+    cc: str
+    sponsor: str
+    id: str
+    host: str
+    d: float
+    latency: float
+
+
+class SpeedtestClient(BaseModel):
+    ip: str
+    lat: str
+    lon: str
+    isp: str
+    isprating: str
+    rating: str
+    ispdlavg: str
+    ispulavg: str
+    loggedin: str
+    country: str
+
+
+class SpeedTestResult(BaseModel):
+    download: float
+    upload: float
+    ping: float
+    server: SpeedtestServer
+    timestamp: datetime
+    bytes_sent: int
+    bytes_received: int
+    share: Optional[str] = None
+    client: SpeedtestClient
+
+
+class SpeedTestStep(str, Enum):
+    BestServer = "best_server"
+    Download = "download"
+    Upload = "upload"
+
+
+class SpeedTestJobState(str, Enum):
+    Queued = "queued"
+    Running = "running"
+    Finished = "finished"
+    Failed = "failed"
+    Cancelled = "cancelled"
+
+
+class SpeedTestJob(BaseModel):
+    id: str
+    steps: List[SpeedTestStep]
+    state: SpeedTestJobState = SpeedTestJobState.Running
+    step: Optional[SpeedTestStep] = None
+    # Progress of the current step, from 0 to 1
+    progress: float = 0.0
+    started_at: float
+    finished_at: Optional[float] = None
+    result: Optional[SpeedTestResult] = None
+    error: Optional[str] = None
@@ -0,0 +1,168 @@
+import os
+import pathlib
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from commonwealth.utils.general import delete_everything
+from loguru import logger
+
+ARCHIVE_EXTENSION = "tar.gz"
+# Size of the blocks read from the logs, the whole file is never loaded in memory
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ArchiveVerificationError(Exception):
+    """Archive content does not match the files that were added to it."""
+
+
+@dataclass
+class ArchiveStats:
+    folder: str
+    archive: str
+    files: int
+    bytes_in: int
+    bytes_out: int
+    duration: float
+
+
+@dataclass
+class RunStats:
+    archives: List[ArchiveStats] = field(default_factory=list)
+    failures: int = 0
+    duration: float = 0.0
+
+    @property
+    def bytes_in(self) -> int:
+        return sum(archive.bytes_in for archive in self.archives)
+
+    @property
+    def bytes_out(self) -> int:
+        return sum(archive.bytes_out for archive in self.archives)
+
+    @property
+    def throughput_mbps(self) -> float:
+        return self.bytes_in / 2**20 / self.duration if self.duration else 0.0
+
+    def __str__(self) -> str:
+        ratio = self.bytes_out / self.bytes_in if self.bytes_in else 0.0
+        return (
+            f"{len(self.archives)} archives ({self.failures} failed), "
+            f"{self.bytes_in / 2**20:.1f} MB in, {self.bytes_out / 2**20:.1f} MB out (ratio {ratio:.2f}), "
+            f"{self.duration:.1f} s, {self.throughput_mbps:.1f} MB/s"
+        )
+
+
+def archive_path(folder: str) -> str:
+    folder_name = os.path.basename(folder)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    path = f"{folder}/{folder_name}-{timestamp}.{ARCHIVE_EXTENSION}"
+    # Folders can be archived more than once per second
+    counter = 1
+    while os.path.exists(path):
+        path = f"{folder}/{folder_name}-{timestamp}-{counter}.{ARCHIVE_EXTENSION}"
+        counter += 1
+    return path
+
+
+def write_archive(files: List[str], output_path: str, compression_level: int) -> Dict[str, Tuple[int, float]]:
+    """Streams all files into a single compressed tar, returns the size and mtime archived for each one."""
+    archived: Dict[str, Tuple[int, float]] = {}
+    with tarfile.open(output_path, "w:gz", compresslevel=compression_level) as tar:
+        for file in files:
+            logger.debug(f"Archiving {file}...")
+            # The size is taken when the header is written, data appended later is left out of the archive
+            info = tar.gettarinfo(file, arcname=os.path.basename(file))
+            with open(file, "rb") as f_in:
+                tar.addfile(info, f_in)
+            archived[file] = (info.size, info.mtime)
+    return archived
+
+
+def verify_archive(output_path: str, archived: Dict[str, Tuple[int, float]]) -> None:
+    """Reads the whole archive back, so any corruption fails the gzip CRC check."""
+    expected = {os.path.basename(file): size for file, (size, _mtime) in archived.items()}
+    found: Dict[str, int] = {}
+    with tarfile.open(output_path, "r:gz") as tar:
+        for member in tar:
+            member_file = tar.extractfile(member)
+            if member_file is None:
+                raise ArchiveVerificationError(f"{member.name} is not a regular file.")
+            size = 0
+            while block := member_file.read(COPY_BUFFER_SIZE):
+                size += len(block)
+            found[member.name] = size
+    if found != expected:
+        raise ArchiveVerificationError(f"Archive has {found}, expected {expected}.")
+
+
+def delete_archived_files(archived: Dict[str, Tuple[int, float]]) -> None:
+    for file, (size, mtime) in archived.items():
+        try:
+            stat = os.stat(file)
+            # Files that changed after being archived would lose data
+            if stat.st_size != size or int(stat.st_mtime) != int(mtime):
+                logger.warning(f"Not deleting {file}, it changed while being archived.")
+                continue
+            delete_everything(pathlib.Path(file))
+            logger.debug(f"Deleted file: {file}")
+        except OSError as e:
+            logger.debug(f"Error deleting file: {file} - {e}")
+
+
+def archive_folder(folder: str, files: List[str], compression_level: int) -> ArchiveStats:
+    """Archives the files of a folder, the originals are only deleted after the archive is verified."""
+    start_time = time.monotonic()
+    output_path = archive_path(folder)
+    temporary_path = f"{output_path}.tmp"
+    try:
+        archived = write_archive(files, temporary_path, compression_level)
+        verify_archive(temporary_path, archived)
+        os.replace(temporary_path, output_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    delete_archived_files(archived)
+
+    stats = ArchiveStats(
+        folder=folder,
+        archive=output_path,
+        files=len(archived),
+        bytes_in=sum(size for size, _mtime in archived.values()),
+        bytes_out=os.path.getsize(output_path),
+        duration=time.monotonic() - start_time,
+    )
+    logger.info(f"Created archive {output_path} with {stats.files} files.")
+    return stats
+
+
+class Archiver:
+    """Archives the logs of many folders at the same time, one archive per folder.
+
+    Compression runs in a thread pool, zlib releases the GIL while compressing so the folders are
+    spread across all cores.
+    """
+
+    def __init__(self, compression_level: int = 6, workers: Optional[int] = None) -> None:
+        self.compression_level = compression_level
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix="log-archiver")
+
+    def archive(self, files_by_folder: Dict[str, List[str]]) -> RunStats:
+        stats = RunStats()
+        start_time = time.monotonic()
+        futures = {
+            folder: self.executor.submit(archive_folder, folder, sorted(files), self.compression_level)
+            for folder, files in sorted(files_by_folder.items())
+            if files
+        }
+        for folder, future in futures.items():
+            try:
+                stats.archives.append(future.result())
+            except Exception as error:
+                stats.failures += 1
+                logger.error(f"Failed to archive {folder}, keeping its files: {error}")
+        stats.duration = time.monotonic() - start_time
+        return stats
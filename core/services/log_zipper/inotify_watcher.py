@@ -0,0 +1,87 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+# struct inotify_event: int wd, uint32_t mask, uint32_t cookie, uint32_t len, followed by the name
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+@dataclass
+class InotifyEvent:
+    mask: int
+    # Path of the file or directory, None when the event queue overflowed
+    path: Optional[str]
+
+    @property
+    def is_dir(self) -> bool:
+        return bool(self.mask & IN_ISDIR)
+
+    @property
+    def overflowed(self) -> bool:
+        return bool(self.mask & IN_Q_OVERFLOW)
+
+
+class Inotify:
+    """Minimal wrapper of the Linux inotify API, so file changes are received without polling the filesystem."""
+
+    def __init__(self) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"Failed to initialize inotify: {os.strerror(error)}")
+        # Watched directories by watch descriptor
+        self.watches: Dict[int, str] = {}
+
+    def add_watch(self, path: str, mask: int) -> None:
+        watch_descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if watch_descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.watches[watch_descriptor] = path
+
+    def read_events(self, timeout: float) -> List[InotifyEvent]:
+        """Waits up to "timeout" seconds for events, and returns all the ones available."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        events: List[InotifyEvent] = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                watch_descriptor, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_IGNORED:
+                    # The watched directory was deleted
+                    self.watches.pop(watch_descriptor, None)
+                    continue
+                directory = self.watches.get(watch_descriptor)
+                path = os.path.join(directory, name) if directory is not None and name else directory
+                events.append(InotifyEvent(mask, path))
+
+    def close(self) -> None:
+        os.close(self.fd)
+        self.watches.clear()
@@ -0,0 +1,301 @@
+import fnmatch
+import glob
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+from commonwealth.utils.general import available_disk_space_mb
+from loguru import logger
+
+from archiver import Archiver, RunStats
+from inotify_watcher import (
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_DELETE,
+    IN_DELETE_SELF,
+    IN_MODIFY,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    Inotify,
+    InotifyEvent,
+)
+
+ARCHIVE_SUFFIX = ".gz"
+
+
+@dataclass
+class IndexedFile:
+    path: str
+    size: int
+    mtime: float
+    # Time before which archiving the file is not tried again, set after a failure
+    retry_after: float = 0.0
+
+
+def glob_root(pattern: str) -> str:
+    """Returns the deepest directory of "pattern" without glob characters, '/logs/**/*.log' gives '/logs'."""
+    if not glob.has_magic(pattern) and os.path.isdir(pattern):
+        return pattern
+    root_parts: List[str] = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        root_parts.append(part)
+    return os.sep.join(root_parts) or os.sep
+
+
+def glob_match(path_parts: List[str], pattern_parts: List[str]) -> bool:
+    """Matches a path like glob's recursive mode, wildcards stay in their directory and "**" matches any number
+    of directories."""
+    if not pattern_parts:
+        return not path_parts
+    if pattern_parts[0] == "**":
+        return any(glob_match(path_parts[start:], pattern_parts[1:]) for start in range(len(path_parts) + 1))
+    return (
+        bool(path_parts)
+        and fnmatch.fnmatch(path_parts[0], pattern_parts[0])
+        and glob_match(path_parts[1:], pattern_parts[1:])
+    )
+
+
+@dataclass
+class RotationLimits:
+    # Time, in seconds, since the last change of a log before it is archived
+    max_age: float
+    # Free disk space, in MB, below which the oldest archives are deleted
+    free_disk_limit_mb: float
+    # Maximum size, in MB, of logs and archives of each service directory, 0 for no limit
+    service_budget_mb: float
+
+
+@dataclass
+class ArchiveJob:
+    future: "Future[RunStats]"
+    logs: List[IndexedFile]
+    started_at: float
+
+
+class LogIndex:
+    """In-memory index of the logs matching a glob pattern, and of the archives next to them."""
+
+    def __init__(self, pattern: str) -> None:
+        self.pattern_parts = pattern.split(os.sep)
+        self.root = glob_root(pattern)
+        self.logs: Dict[str, IndexedFile] = {}
+        self.archives: Dict[str, IndexedFile] = {}
+        # Paths changed since the last tick, only these are checked with stat
+        self.dirty: Set[str] = set()
+
+    def clear(self) -> None:
+        self.logs.clear()
+        self.archives.clear()
+        self.dirty.clear()
+
+    def is_log(self, path: str) -> bool:
+        return glob_match(path.split(os.sep), self.pattern_parts)
+
+    @staticmethod
+    def is_archive(path: str) -> bool:
+        return path.endswith(ARCHIVE_SUFFIX)
+
+    def service_directory(self, path: str) -> str:
+        relative_path = os.path.relpath(path, self.root)
+        parts = relative_path.split(os.sep)
+        return os.path.join(self.root, parts[0]) if len(parts) > 1 else self.root
+
+    def update(self, path: str) -> None:
+        index = self.archives if self.is_archive(path) else self.logs if self.is_log(path) else None
+        if index is None:
+            return
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            index.pop(path, None)
+            return
+        retry_after = index[path].retry_after if path in index else 0.0
+        index[path] = IndexedFile(path, stat.st_size, stat.st_mtime, retry_after)
+
+    def update_dirty(self) -> None:
+        for path in self.dirty:
+            self.update(path)
+        self.dirty.clear()
+
+
+class LogRotator:
+    """Archives logs as soon as they are old enough, and evicts the oldest archives to keep the disk usage low.
+
+    The log tree is scanned once, after that an in-memory index of the logs and archives is kept up to date
+    from inotify events. Checking ages, directory budgets and disk pressure only reads the index, so it can
+    run every second without touching the filesystem. Logs are compressed in a worker thread, so events keep
+    being read while a large archive is written.
+    """
+
+    # Time, in seconds, between checks of the index
+    TICK_INTERVAL = 1.0
+    # Time, in seconds, between full rescans, in case the index missed an event
+    RESCAN_INTERVAL = 3600.0
+    # Time, in seconds, between full rescans when inotify is not available
+    FALLBACK_RESCAN_INTERVAL = 60.0
+    # Time, in seconds, before archiving files that failed to be archived again
+    RETRY_INTERVAL = 60.0
+    WATCH_MASK = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF
+
+    def __init__(self, pattern: str, limits: RotationLimits, archiver: Archiver) -> None:
+        self.index = LogIndex(pattern)
+        self.limits = limits
+        self.archiver = archiver
+        self.inotify: Optional[Inotify] = None
+        self.last_scan_time = float("-inf")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-rotator")
+        self.archive_job: Optional[ArchiveJob] = None
+
+    @property
+    def rescan_interval(self) -> float:
+        # Without events, the index is only kept up to date by scanning
+        return self.FALLBACK_RESCAN_INTERVAL if self.inotify is None else self.RESCAN_INTERVAL
+
+    def watch(self, directory: str) -> None:
+        if self.inotify is None:
+            return
+        try:
+            self.inotify.add_watch(directory, self.WATCH_MASK)
+        except OSError as error:
+            logger.warning(f"Failed to watch {directory}: {error}")
+
+    def scan(self) -> None:
+        """Rebuilds the index from the filesystem."""
+        logger.info(f"Scanning {self.index.root} for logs matching {os.sep.join(self.index.pattern_parts)}...")
+        self.index.clear()
+        for directory, _subdirectories, files in os.walk(self.index.root):
+            self.watch(directory)
+            for name in files:
+                self.index.update(os.path.join(directory, name))
+        self.last_scan_time = time.monotonic()
+        logger.info(f"Found {len(self.index.logs)} logs and {len(self.index.archives)} archives.")
+
+    def handle_event(self, event: InotifyEvent) -> None:
+        if event.overflowed:
+            logger.warning("Missed file events, rescanning.")
+            self.last_scan_time = float("-inf")
+            return
+        if event.path is None:
+            return
+        if event.is_dir:
+            if event.mask & (IN_CREATE | IN_MOVED_TO):
+                # Files created before the watch is in place are only found by walking the new directory
+                for directory, _subdirectories, files in os.walk(event.path):
+                    self.watch(directory)
+                    self.index.dirty.update(os.path.join(directory, name) for name in files)
+            elif event.mask & IN_MOVED_FROM:
+                self.last_scan_time = float("-inf")
+            return
+        self.index.dirty.add(event.path)
+
+    def archive_old_logs(self) -> None:
+        """Starts archiving the logs that are old enough in the worker thread, once the previous run finished."""
+        if self.archive_job is not None:
+            if not self.archive_job.future.done():
+                return
+            self.finish_archive_job(self.archive_job)
+            self.archive_job = None
+        now = time.time()
+        old_logs = [
+            log for log in self.index.logs.values() if log.mtime < now - self.limits.max_age and log.retry_after <= now
+        ]
+        if not old_logs:
+            return
+        files_by_folder: Dict[str, List[str]] = {}
+        for log in old_logs:
+            files_by_folder.setdefault(os.path.dirname(log.path), []).append(log.path)
+        self.archive_job = ArchiveJob(self.executor.submit(self.archiver.archive, files_by_folder), old_logs, now)
+
+    def finish_archive_job(self, job: ArchiveJob) -> None:
+        try:
+            stats = job.future.result()
+        except Exception as error:
+            logger.error(f"Failed to archive logs: {error}")
+            stats = RunStats()
+        else:
+            logger.info(f"Archived logs: {stats}")
+        for log in job.logs:
+            self.index.update(log.path)
+            if log.path in self.index.logs:
+                # Not archived or not deleted, it will be tried again later
+                self.index.logs[log.path].retry_after = job.started_at + self.RETRY_INTERVAL
+        for archive in stats.archives:
+            self.index.update(archive.archive)
+
+    def delete_archive(self, archive: IndexedFile, reason: str) -> None:
+        logger.warning(f"Deleting {archive.path} ({archive.size / 2**20:.1f} MB): {reason}")
+        try:
+            os.remove(archive.path)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            logger.error(f"Failed to delete {archive.path}: {error}")
+        self.index.archives.pop(archive.path, None)
+
+    def enforce_service_budgets(self) -> None:
+        service_budget = int(self.limits.service_budget_mb * 2**20)
+        if not service_budget:
+            return
+        usage: Dict[str, int] = {}
+        for indexed_file in [*self.index.logs.values(), *self.index.archives.values()]:
+            service = self.index.service_directory(indexed_file.path)
+            usage[service] = usage.get(service, 0) + indexed_file.size
+        for service, used in usage.items():
+            if used <= service_budget:
+                continue
+            archives = sorted(
+                (
+                    archive
+                    for archive in self.index.archives.values()
+                    if self.index.service_directory(archive.path) == service
+                ),
+                key=lambda archive: archive.mtime,
+            )
+            for archive in archives:
+                if used <= service_budget:
+                    break
+                self.delete_archive(archive, f"{service} is over its budget of {self.limits.service_budget_mb:.0f} MB")
+                used -= archive.size
+
+    def enforce_free_disk_limit(self) -> None:
+        free_disk_space_mb = available_disk_space_mb()
+        if free_disk_space_mb >= self.limits.free_disk_limit_mb:
+            return
+        logger.warning(
+            "Available disk space is lower than our limit: "
+            f"{free_disk_space_mb:.0f}MB < {self.limits.free_disk_limit_mb}MB"
+        )
+        for archive in sorted(self.index.archives.values(), key=lambda archive: archive.mtime):
+            self.delete_archive(archive, "low disk space")
+            if available_disk_space_mb() >= self.limits.free_disk_limit_mb:
+                return
+
+    def tick(self) -> None:
+        if time.monotonic() - self.last_scan_time > self.rescan_interval:
+            self.scan()
+        if self.inotify is not None:
+            for event in self.inotify.read_events(self.TICK_INTERVAL):
+                self.handle_event(event)
+        else:
+            time.sleep(self.TICK_INTERVAL)
+        self.index.update_dirty()
+        self.archive_old_logs()
+        self.enforce_service_budgets()
+        self.enforce_free_disk_limit()
+
+    def run(self) -> None:
+        try:
+            self.inotify = Inotify()
+        except OSError as error:
+            logger.warning(f"{error}, rescanning every {self.rescan_interval} seconds instead.")
+        while True:
+            try:
+                self.tick()
+            except Exception as error:
+                logger.exception(f"Failed to rotate logs: {error}")
+                time.sleep(self.TICK_INTERVAL)
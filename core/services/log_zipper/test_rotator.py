@@ -0,0 +1,124 @@
+import os
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+import rotator
+from archiver import Archiver
+from rotator import LogIndex, LogRotator, RotationLimits, glob_match
+
+KB = 1024
+
+
+def create_file(path: Path, size: int, age: float = 0.0) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"0" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def create_rotator(root: Path, service_budget_mb: float = 0, free_disk_limit_mb: float = 0) -> LogRotator:
+    limits = RotationLimits(max_age=3600, free_disk_limit_mb=free_disk_limit_mb, service_budget_mb=service_budget_mb)
+    log_rotator = LogRotator(str(root / "**" / "*.log"), limits, Archiver())
+    log_rotator.scan()
+    return log_rotator
+
+
+@pytest.fixture(name="tree")
+def fixture_tree(tmp_path: Path) -> Dict[str, Path]:
+    return {
+        "ardupilot_log": create_file(tmp_path / "ardupilot" / "logs" / "current.log", 600 * KB),
+        "ardupilot_oldest": create_file(tmp_path / "ardupilot" / "logs" / "first.gz", 200 * KB, age=300),
+        "ardupilot_older": create_file(tmp_path / "ardupilot" / "second.gz", 200 * KB, age=200),
+        "ardupilot_newest": create_file(tmp_path / "ardupilot" / "third.gz", 200 * KB, age=100),
+        "ardupilot_temporary": create_file(tmp_path / "ardupilot" / "fourth.gz.tmp", 300 * KB, age=400),
+        "commander_log": create_file(tmp_path / "commander" / "current.log", 900 * KB, age=50),
+        "commander_archive": create_file(tmp_path / "commander" / "first.gz", 200 * KB, age=250),
+        "root_archive": create_file(tmp_path / "loose.gz", 100 * KB, age=150),
+    }
+
+
+def remaining(tree: Dict[str, Path]) -> List[str]:
+    return [name for name, path in tree.items() if path.exists()]
+
+
+def test_glob_match() -> None:
+    pattern_parts = "/var/logs/blueos/**/*.log".split(os.sep)
+    for path in [
+        "/var/logs/blueos/a.log",
+        "/var/logs/blueos/ardupilot/a.log",
+        "/var/logs/blueos/ardupilot/logs/2023/a.log",
+    ]:
+        assert glob_match(path.split(os.sep), pattern_parts), path
+    for path in [
+        "/var/logs/blueos",
+        "/var/logs/blueos/a.log.gz",
+        "/var/logs/blueos/ardupilot/a.log.tmp",
+        "/var/logs/blueos/ardupilot/a.txt",
+        "/var/logs/other/a.log",
+        "/var/a.log",
+    ]:
+        assert not glob_match(path.split(os.sep), pattern_parts), path
+
+    # Wildcards other than "**" don't cross directories
+    assert not glob_match("/logs/ardupilot/a.log".split(os.sep), "/logs/*.log".split(os.sep))
+
+
+def test_service_directories(tmp_path: Path, tree: Dict[str, Path]) -> None:
+    index = LogIndex(str(tmp_path / "**" / "*.log"))
+    assert index.root == str(tmp_path)
+    assert index.service_directory(str(tree["ardupilot_log"])) == str(tmp_path / "ardupilot")
+    assert index.service_directory(str(tree["ardupilot_newest"])) == str(tmp_path / "ardupilot")
+    assert index.service_directory(str(tree["root_archive"])) == str(tmp_path)
+
+    log_rotator = create_rotator(tmp_path)
+    assert set(log_rotator.index.logs) == {str(tree["ardupilot_log"]), str(tree["commander_log"])}
+    # Temporary archives are still being written, they are neither logs nor archives
+    assert str(tree["ardupilot_temporary"]) not in log_rotator.index.archives
+    assert len(log_rotator.index.archives) == 5
+
+
+def test_service_budget(tmp_path: Path, tree: Dict[str, Path]) -> None:
+    # Ardupilot uses 1200 KB and gets back under the budget after losing its two oldest archives, commander
+    # uses 1100 KB but only the archive can be deleted
+    log_rotator = create_rotator(tmp_path, service_budget_mb=800 / KB)
+    log_rotator.enforce_service_budgets()
+    assert remaining(tree) == [
+        "ardupilot_log",
+        "ardupilot_newest",
+        "ardupilot_temporary",
+        "commander_log",
+        "root_archive",
+    ]
+    assert set(log_rotator.index.archives) == {str(tree["ardupilot_newest"]), str(tree["root_archive"])}
+
+    # Without a budget, nothing is deleted
+    log_rotator = create_rotator(tmp_path)
+    log_rotator.enforce_service_budgets()
+    assert len(remaining(tree)) == 5
+
+
+def test_free_disk_limit(tmp_path: Path, tree: Dict[str, Path], monkeypatch: pytest.MonkeyPatch) -> None:
+    archives = [path for path in tree.values() if path.name.endswith(".gz")]
+    # Each deleted archive frees 50 MB
+    monkeypatch.setattr(
+        rotator, "available_disk_space_mb", lambda: 100 + 50 * sum(not path.exists() for path in archives)
+    )
+    log_rotator = create_rotator(tmp_path, free_disk_limit_mb=180)
+    log_rotator.enforce_free_disk_limit()
+    # The oldest archives are deleted first, from any service
+    assert remaining(tree) == [
+        "ardupilot_log",
+        "ardupilot_older",
+        "ardupilot_newest",
+        "ardupilot_temporary",
+        "commander_log",
+        "root_archive",
+    ]
+
+    # With enough space, nothing else is deleted
+    log_rotator.enforce_free_disk_limit()
+    assert len(remaining(tree)) == 6
@@ -2,7 +2,7 @@
 
 import asyncio
 from enum import Enum
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 import pynmea2
 from commonwealth.mavlink_comm.MavlinkComm import MavlinkMessenger
@@ -14,6 +14,16 @@ from nmea_injector.exceptions import UnsupportedSocketKind
 from nmea_injector.MavlinkNMEA import MavlinkGpsInput, parse_mavlink_from_sentence
 from nmea_injector.settings import NmeaInjectorSettingsSpecV1, SettingsV1
 
+# Messengers being closed, referenced here so their tasks are not garbage collected before finishing
+closing_messengers: Set["asyncio.Task[None]"] = set()
+
+
+def close_messenger(messenger: MavlinkMessenger) -> None:
+    """Release the pooled mavlink2rest connections of a messenger from a synchronous callback."""
+    task = asyncio.create_task(messenger.close())
+    closing_messengers.add(task)
+    task.add_done_callback(closing_messengers.discard)
+
 
 class SocketKind(str, Enum):
     """Available server sockets"""
@@ -64,6 +74,10 @@ class TcpNmeaProtocol(asyncio.Protocol):
         logger.debug(f"New TCP connection with {transport.get_extra_info('peername')}.")
         self.transport = transport
 
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        """Release the pooled mavlink2rest connections used by this client."""
+        close_messenger(self.mavlink2rest)
+
     def data_received(self, data: bytes) -> None:
         """What happens when data is received from a client socket."""
         message = data.decode()
@@ -83,6 +97,10 @@ class UdpNmeaProtocol(asyncio.DatagramProtocol):
         logger.debug(f"New UDP connection with {transport.get_extra_info('peername')}.")
         self.transport = transport
 
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        """Release the pooled mavlink2rest connections used by this socket."""
+        close_messenger(self.mavlink2rest)
+
     def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
         """What happens when data is received from a client socket."""
         message = data.decode()
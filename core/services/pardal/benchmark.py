@@ -0,0 +1,333 @@
+import asyncio
+import math
+import os
+import struct
+import time
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    cast,
+)
+from uuid import uuid4
+
+import aiohttp
+from loguru import logger
+
+# Random data is generated once and served over and over,
+# so the tests measure the link and not the generation of random numbers
+RANDOM_CHUNK_SIZE = 1024 * 1024
+RANDOM_CHUNK = os.urandom(RANDOM_CHUNK_SIZE)
+
+# Echo packets start with a sequence number and the time they were sent
+ECHO_HEADER = struct.Struct("<Id")
+MAX_UDP_PAYLOAD_SIZE = 65507
+
+
+def generate_random_data(size: int, chunk_size: int = RANDOM_CHUNK_SIZE) -> Generator[bytes, None, None]:
+    # Sliced once, so every full chunk is the same object instead of a new copy
+    chunk = RANDOM_CHUNK[: min(chunk_size, RANDOM_CHUNK_SIZE)]
+    remaining_size = size
+    while remaining_size > len(chunk):
+        yield chunk
+        remaining_size -= len(chunk)
+    if remaining_size > 0:
+        yield chunk[:remaining_size]
+
+
+def echo_packet(sequence: int, size: int) -> bytes:
+    header = ECHO_HEADER.pack(sequence, time.perf_counter())
+    return header + RANDOM_CHUNK[: max(0, size - ECHO_HEADER.size)]
+
+
+class UdpEchoProtocol(asyncio.DatagramProtocol):
+    """Sends back every datagram received, used by the UDP latency benchmark of other pardal instances."""
+
+    def __init__(self) -> None:
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = cast(asyncio.DatagramTransport, transport)
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        if self.transport is not None:
+            self.transport.sendto(data, addr)
+
+
+class BenchmarkKind(str, Enum):
+    Download = "download"
+    Upload = "upload"
+    Bidirectional = "bidirectional"
+    WebsocketLatency = "websocket_latency"
+    UdpLatency = "udp_latency"
+
+
+class BenchmarkState(str, Enum):
+    Running = "running"
+    Finished = "finished"
+    Failed = "failed"
+
+
+@dataclass
+class BenchmarkConfig:
+    kind: BenchmarkKind
+    # Address of the pardal instance at the other end of the link
+    target: str = "127.0.0.1:9120"
+    duration: float = 10.0
+    # Parallel connections used by the throughput benchmarks
+    streams: int = 1
+    # Size of each write for throughput benchmarks, and of each packet for latency benchmarks
+    payload_size: int = 0
+    # Packets per second sent by latency benchmarks
+    rate: float = 20.0
+
+    def __post_init__(self) -> None:
+        self.kind = BenchmarkKind(self.kind)
+        latency = self.kind in [BenchmarkKind.WebsocketLatency, BenchmarkKind.UdpLatency]
+        if not self.payload_size:
+            self.payload_size = 64 if latency else 64 * 1024
+        max_payload_size = MAX_UDP_PAYLOAD_SIZE if self.kind == BenchmarkKind.UdpLatency else RANDOM_CHUNK_SIZE
+        if not 0 < self.duration <= 300:
+            raise ValueError("Duration should be between 0 and 300 seconds.")
+        if not 1 <= self.streams <= 16:
+            raise ValueError("Streams should be between 1 and 16.")
+        if not ECHO_HEADER.size <= self.payload_size <= max_payload_size:
+            raise ValueError(f"Payload size should be between {ECHO_HEADER.size} and {max_payload_size} bytes.")
+        if not 0 < self.rate <= 1000:
+            raise ValueError("Rate should be between 0 and 1000 packets per second.")
+
+
+@dataclass
+class BenchmarkRun:
+    # pylint: disable=too-many-instance-attributes
+    id: str
+    config: BenchmarkConfig
+    started_at: float
+    state: BenchmarkState = BenchmarkState.Running
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    summary: Dict[str, float] = field(default_factory=dict)
+    # Samples are [seconds since the start, values...], as described by series_fields
+    series_fields: List[str] = field(default_factory=list)
+    series: List[List[float]] = field(default_factory=list)
+
+    def as_dict(self, with_series: bool = True) -> Dict[str, Any]:
+        run = asdict(self)
+        if not with_series:
+            run.pop("series")
+        return run
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(rtts: List[float], sent: int) -> Dict[str, float]:
+    summary: Dict[str, float] = {"sent": sent, "received": len(rtts)}
+    summary["loss_percent"] = 100 * (sent - len(rtts)) / sent if sent else 0.0
+    if not rtts:
+        return summary
+    sorted_rtts = sorted(rtts)
+    summary.update(
+        {
+            "min_ms": sorted_rtts[0],
+            "mean_ms": sum(rtts) / len(rtts),
+            "p50_ms": percentile(sorted_rtts, 0.5),
+            "p90_ms": percentile(sorted_rtts, 0.9),
+            "p99_ms": percentile(sorted_rtts, 0.99),
+            "max_ms": sorted_rtts[-1],
+            # Mean variation between consecutive round trips
+            "jitter_ms": sum(abs(b - a) for a, b in zip(rtts, rtts[1:])) / max(1, len(rtts) - 1),
+        }
+    )
+    return summary
+
+
+class Benchmark:
+    """Measures the link to another pardal instance, one benchmark at a time."""
+
+    # Time, in seconds, between throughput samples
+    SAMPLE_INTERVAL = 0.5
+    # Time, in seconds, that late echo packets are still waited for
+    ECHO_GRACE_PERIOD = 1.0
+    # Runs kept with their time series
+    HISTORY_SIZE = 20
+
+    def __init__(self) -> None:
+        self.runs: Dict[str, BenchmarkRun] = {}
+        self.current: Optional[BenchmarkRun] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def start(self, config: BenchmarkConfig) -> BenchmarkRun:
+        if self.current is not None and self.current.state == BenchmarkState.Running:
+            raise RuntimeError(f"Benchmark {self.current.id} is still running.")
+        run = BenchmarkRun(id=uuid4().hex, config=config, started_at=time.time())
+        self.current = run
+        self.runs[run.id] = run
+        # Dicts keep the insertion order, so the oldest runs are the first ones
+        for old_run_id in list(self.runs)[: -self.HISTORY_SIZE]:
+            del self.runs[old_run_id]
+        self._task = asyncio.create_task(self._run(run))
+        return run
+
+    async def _run(self, run: BenchmarkRun) -> None:
+        logger.info(f"Starting benchmark {run.id}: {run.config}")
+        try:
+            if run.config.kind == BenchmarkKind.WebsocketLatency:
+                await self._websocket_latency(run)
+            elif run.config.kind == BenchmarkKind.UdpLatency:
+                await self._udp_latency(run)
+            else:
+                await self._throughput(run)
+            run.state = BenchmarkState.Finished
+        except Exception as error:
+            logger.warning(f"Benchmark {run.id} failed: {error}")
+            run.state = BenchmarkState.Failed
+            run.error = str(error) or type(error).__name__
+        finally:
+            run.finished_at = time.time()
+            logger.info(f"Benchmark {run.id} {run.state.value}: {run.summary}")
+
+    async def _throughput(self, run: BenchmarkRun) -> None:
+        config = run.config
+        url = f"http://{config.target}"
+        transferred = {"download": 0, "upload": 0}
+
+        async def download(session: aiohttp.ClientSession) -> None:
+            # Asks for more data than can be transferred, the request is cancelled at the end of the test
+            async with session.get(f"{url}/get_file", params={"size": str(2**40)}) as response:
+                response.raise_for_status()
+                while True:
+                    chunk = await response.content.readany()
+                    if not chunk:
+                        break
+                    transferred["download"] += len(chunk)
+
+        async def upload_data() -> Any:
+            payload = RANDOM_CHUNK[: config.payload_size]
+            while True:
+                transferred["upload"] += len(payload)
+                yield payload
+
+        async def upload(session: aiohttp.ClientSession) -> None:
+            async with session.post(f"{url}/post_file", data=upload_data()) as response:
+                response.raise_for_status()
+
+        directions = {
+            BenchmarkKind.Download: ["download"],
+            BenchmarkKind.Upload: ["upload"],
+            BenchmarkKind.Bidirectional: ["download", "upload"],
+        }[config.kind]
+        run.series_fields = ["time", *[f"{direction}_mbps" for direction in directions]]
+
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=5)) as session:
+            streams = [
+                asyncio.create_task(download(session) if direction == "download" else upload(session))
+                for direction in directions
+                for _ in range(config.streams)
+            ]
+            try:
+                elapsed = await self._sample_throughput(run, streams, transferred, directions)
+            finally:
+                for stream in streams:
+                    stream.cancel()
+                await asyncio.gather(*streams, return_exceptions=True)
+
+        for direction in directions:
+            run.summary[f"{direction}_bytes"] = transferred[direction]
+            run.summary[f"{direction}_mbps"] = transferred[direction] * 8e-6 / elapsed
+
+    async def _sample_throughput(
+        self, run: BenchmarkRun, streams: List["asyncio.Task[None]"], transferred: Dict[str, int], directions: List[str]
+    ) -> float:
+        """Samples the throughput of the running streams until the end of the test, returning its duration."""
+        start_time = time.perf_counter()
+        last_sample_time, last_transferred = start_time, dict(transferred)
+        while time.perf_counter() - start_time < run.config.duration:
+            for stream in streams:
+                if stream.done():
+                    # Streams only finish early when they fail
+                    stream.result()
+            await asyncio.sleep(self.SAMPLE_INTERVAL)
+            now = time.perf_counter()
+            run.series.append(
+                [
+                    now - start_time,
+                    *[
+                        (transferred[direction] - last_transferred[direction]) * 8e-6 / (now - last_sample_time)
+                        for direction in directions
+                    ],
+                ]
+            )
+            last_sample_time, last_transferred = now, dict(transferred)
+        return time.perf_counter() - start_time
+
+    async def _send_echo_packets(
+        self, run: BenchmarkRun, send: Callable[[bytes], Awaitable[None]], rtts: Dict[int, Tuple[float, float]]
+    ) -> int:
+        """Sends packets at the configured rate, waits for the late answers and returns the number sent."""
+        config = run.config
+        interval = 1 / config.rate
+        start_time = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - start_time < config.duration:
+            await send(echo_packet(sent, config.payload_size))
+            sent += 1
+            next_packet_time = start_time + sent * interval
+            await asyncio.sleep(max(0.0, next_packet_time - time.perf_counter()))
+        await asyncio.sleep(self.ECHO_GRACE_PERIOD)
+
+        run.series_fields = ["time", "sequence", "rtt_ms"]
+        run.series = [[sent_time - start_time, sequence, rtt] for sequence, (sent_time, rtt) in sorted(rtts.items())]
+        run.summary = latency_summary([rtt for _sent_time, rtt in sorted(rtts.values())], sent)
+        return sent
+
+    @staticmethod
+    def _record_echo(data: bytes, rtts: Dict[int, Tuple[float, float]]) -> None:
+        if len(data) < ECHO_HEADER.size:
+            return
+        sequence, sent_time = ECHO_HEADER.unpack_from(data)
+        rtts[sequence] = (sent_time, (time.perf_counter() - sent_time) * 1000)
+
+    async def _websocket_latency(self, run: BenchmarkRun) -> None:
+        rtts: Dict[int, Tuple[float, float]] = {}
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f"http://{run.config.target}/ws") as websocket:
+
+                async def receive() -> None:
+                    async for message in websocket:
+                        if message.type == aiohttp.WSMsgType.BINARY:
+                            self._record_echo(message.data, rtts)
+
+                receiver = asyncio.create_task(receive())
+                try:
+                    await self._send_echo_packets(run, websocket.send_bytes, rtts)
+                finally:
+                    receiver.cancel()
+
+    async def _udp_latency(self, run: BenchmarkRun) -> None:
+        rtts: Dict[int, Tuple[float, float]] = {}
+        host, port = run.config.target.rsplit(":", 1)
+        loop = asyncio.get_running_loop()
+
+        class EchoClientProtocol(asyncio.DatagramProtocol):
+            def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+                Benchmark._record_echo(data, rtts)
+
+        transport, _protocol = await loop.create_datagram_endpoint(EchoClientProtocol, remote_addr=(host, int(port)))
+
+        async def send(packet: bytes) -> None:
+            transport.sendto(packet)
+
+        try:
+            await self._send_echo_packets(run, send, rtts)
+        finally:
+            transport.close()
@@ -1,15 +1,17 @@
 #!/usr/bin/env python
 
 import argparse
+import asyncio
 import logging
-import os
-from typing import Generator
+from typing import AsyncIterator
 
 import aiohttp
 from aiohttp import web
 from commonwealth.utils.logs import InterceptHandler, init_logger
 from loguru import logger
 
+from benchmark import Benchmark, BenchmarkConfig, UdpEchoProtocol, generate_random_data
+
 SERVICE_NAME = "pardal"
 
 parser = argparse.ArgumentParser(description="Pardal, web service to help with speed and latency tests")
@@ -22,12 +24,7 @@ init_logger(SERVICE_NAME)
 
 logger.info("Starting Pardal")
 
-
-def generate_random_data(size: int, chunk_size: int = 1024 * 1024) -> Generator[bytes, None, None]:
-    remaining_size = size
-    while remaining_size > 0:
-        yield os.urandom(min(chunk_size, remaining_size))
-        remaining_size -= chunk_size
+benchmark = Benchmark()
 
 
 async def websocket_echo(request: web.Request) -> web.WebSocketResponse:
@@ -37,6 +34,8 @@ async def websocket_echo(request: web.Request) -> web.WebSocketResponse:
     async for message in websocket:
         if message.type == aiohttp.WSMsgType.TEXT:
             await websocket.send_str(message.data)
+        elif message.type == aiohttp.WSMsgType.BINARY:
+            await websocket.send_bytes(message.data)
 
     return websocket
 
@@ -49,7 +48,7 @@ async def get_file(request: web.Request) -> web.StreamResponse:
     await response.prepare(request)
 
     for data_chunk in generate_random_data(size):
-        await response.write(bytes(data_chunk))
+        await response.write(data_chunk)
 
     await response.write_eof()
     return response
@@ -63,6 +62,38 @@ async def post_file(request: web.Request) -> web.Response:
     return web.Response(status=200)
 
 
+async def start_benchmark(request: web.Request) -> web.Response:
+    try:
+        config = BenchmarkConfig(**await request.json())
+    except (TypeError, ValueError) as error:
+        raise web.HTTPBadRequest(text=str(error)) from error
+    try:
+        run = benchmark.start(config)
+    except RuntimeError as error:
+        raise web.HTTPConflict(text=str(error)) from error
+    return web.json_response(run.as_dict())
+
+
+# pylint: disable=unused-argument
+async def list_benchmarks(request: web.Request) -> web.Response:
+    return web.json_response([run.as_dict(with_series=False) for run in benchmark.runs.values()])
+
+
+async def get_benchmark(request: web.Request) -> web.Response:
+    run = benchmark.runs.get(request.match_info["run_id"])
+    if run is None:
+        raise web.HTTPNotFound(text="Benchmark does not exist.")
+    return web.json_response(run.as_dict())
+
+
+async def udp_echo(_app: web.Application) -> AsyncIterator[None]:
+    # Echo on the same port number as the web server, so other pardal instances only need to know one port
+    loop = asyncio.get_running_loop()
+    transport, _protocol = await loop.create_datagram_endpoint(UdpEchoProtocol, local_addr=("0.0.0.0", args.port))
+    yield
+    transport.close()
+
+
 # pylint: disable=unused-argument
 async def root(request: web.Request) -> web.Response:
     html_content = """
@@ -82,4 +113,8 @@ app.add_routes([web.get("/ws", websocket_echo)])
 app.router.add_get("/", root, name="root")
 app.router.add_get("/get_file", get_file, name="get_file")
 app.router.add_post("/post_file", post_file, name="post_file")
+app.router.add_post("/benchmark", start_benchmark, name="start_benchmark")
+app.router.add_get("/benchmark", list_benchmarks, name="list_benchmarks")
+app.router.add_get("/benchmark/{run_id}", get_benchmark, name="get_benchmark")
+app.cleanup_ctx.append(udp_echo)
 web.run_app(app, path="0.0.0.0", port=args.port)
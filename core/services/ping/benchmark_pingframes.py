@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Compare PING1D_PROFILE decoding throughput of PingFrameDecoder against byte-at-a-time PingParser.
+
+Usage: python benchmark_pingframes.py [--frames N] [--chunk BYTES]
+"""
+import argparse
+import time
+
+from brping import PingParser
+
+from frame_samples import profile_message
+from pingframes import PingFrameDecoder
+
+
+def benchmark_parser(chunks: list[bytes]) -> int:
+    parser = PingParser()
+    frames = 0
+    for chunk in chunks:
+        for byte in chunk:
+            if parser.parse_byte(byte) == PingParser.NEW_MESSAGE:
+                frames += 1
+    return frames
+
+
+def benchmark_decoder(chunks: list[bytes]) -> int:
+    decoder = PingFrameDecoder()
+    frames = 0
+    for chunk in chunks:
+        decoder.feed(chunk)
+        for frame in decoder.frames():
+            frame.distance()
+            frames += 1
+    return frames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=2000, help="Number of PING1D_PROFILE frames decoded.")
+    parser.add_argument("--chunk", type=int, default=512, help="Size of each read, frames are split across reads.")
+    args = parser.parse_args()
+
+    stream = b"".join(profile_message(distance, 100) for distance in range(args.frames))
+    chunks = [stream[position : position + args.chunk] for position in range(0, len(stream), args.chunk)]
+
+    for name, function in [("PingParser", benchmark_parser), ("PingFrameDecoder", benchmark_decoder)]:
+        start_time = time.perf_counter()
+        frames = function(chunks)
+        elapsed = time.perf_counter() - start_time
+        print(f"{name:>16}: {frames} frames in {elapsed:.3f} s ({frames / elapsed:.0f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
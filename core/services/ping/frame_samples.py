@@ -0,0 +1,23 @@
+"""Ping1D frames built with brping, used by the tests and the benchmark of the frame decoder."""
+import random
+
+from brping import PING1D_DISTANCE_SIMPLE, PING1D_PROFILE, PingMessage
+from brping.pingmessage import payload_dict
+
+
+def distance_simple_message(distance: int, confidence: int) -> bytes:
+    message = PingMessage(PING1D_DISTANCE_SIMPLE)
+    message.distance = distance
+    message.confidence = confidence
+    return bytes(message.pack_msg_data())
+
+
+def profile_message(distance: int, confidence: int, profile_length: int = 200) -> bytes:
+    message = PingMessage(PING1D_PROFILE)
+    for field in payload_dict[PING1D_PROFILE]["field_names"]:
+        setattr(message, field, 0)
+    message.src_device_id = 1
+    message.distance = distance
+    message.confidence = confidence
+    message.profile_data = bytearray(random.getrandbits(8) for _ in range(profile_length))
+    return bytes(message.pack_msg_data())
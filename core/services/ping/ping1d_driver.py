@@ -1,25 +1,17 @@
 import asyncio
-from pathlib import Path
 
 from bridges.bridges import Bridge
-from commonwealth.settings.manager import Manager
 from loguru import logger
 
 from ping1d_mavlink import Ping1DMavlinkDriver
 from pingdriver import PingDriver
 from pingutils import PingDeviceDescriptor
-from settings import Ping1dSettingsSpecV1, SettingsV1
-
-SERVICE_NAME = "ping"
-
-USERDATA = Path("/usr/blueos/userdata/")
+from settings import Ping1dSettingsSpecV1
 
 
 class Ping1DDriver(PingDriver):
     def __init__(self, ping: PingDeviceDescriptor, port: int) -> None:
         super().__init__(ping, port)
-        # load settings
-        self.manager = Manager(SERVICE_NAME, SettingsV1, USERDATA / "settings" / SERVICE_NAME)
         # our settings file is a list for each sensor type.
         # check the list to find our current sensor in it
         connection_info = self.ping.get_hw_or_eth_info()
@@ -32,6 +24,7 @@ class Ping1DDriver(PingDriver):
         (our_settings,) = [ping1d for ping1d in self.manager.settings.ping1d_specs if ping1d.port == connection_info]
         self.driver_status.mavlink_driver_enabled = our_settings.mavlink_enabled
         self.mavlink_driver = Ping1DMavlinkDriver(our_settings.mavlink_enabled)
+        self.driver_status.mavlink_driver_stats = self.mavlink_driver.stats
 
     async def start(self) -> None:
         await super().start()
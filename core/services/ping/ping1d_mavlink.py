@@ -5,40 +5,68 @@
 """
 
 import asyncio
-import socket
 import time
-from select import select
-from typing import Any, Dict
-
-from brping import (
-    PING1D_DISTANCE,
-    PING1D_DISTANCE_SIMPLE,
-    PING1D_PROFILE,
-    PING1D_SET_PING_INTERVAL,
-    PingMessage,
-    PingParser,
-)
+from typing import Any, Dict, Optional, Tuple
+
+from brping import PING1D_DISTANCE_SIMPLE, PING1D_SET_PING_INTERVAL, PingMessage
 from commonwealth.mavlink_comm.MavlinkComm import MavlinkMessenger
 from loguru import logger
 
+from pingframes import PingFrameDecoder
+from typedefs import MavlinkDriverStats
+
 ## The minimum interval time for distance updates to the autopilot
 PING_INTERVAL_S = 0.1
 
 
+class Ping1DProtocol(asyncio.DatagramProtocol):
+    """Protocol class used to receive the Ping1D data forwarded by the PingProxy."""
+
+    def __init__(self, driver: "Ping1DMavlinkDriver") -> None:
+        self.driver = driver
+        self.closed: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.driver.data_received(data)
+
+    def error_received(self, exc: Exception) -> None:
+        # PingProxy may not be up yet, requests are retried by the driver timer
+        logger.debug(f"Ping1D socket error: {exc}")
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self.closed.done():
+            return
+        if exc is None:
+            self.closed.set_result(None)
+        else:
+            self.closed.set_exception(exc)
+
+
+# pylint: disable=too-many-instance-attributes
 class Ping1DMavlinkDriver:
     mavlink2rest = MavlinkMessenger()
 
     def __init__(self, should_run: bool) -> None:
         self.should_run = should_run
         self.time_since_boot = time.time()
-        self.ping1d_io = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.ping1d_io.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.ping1d_io.setblocking(False)
-        ## Parser to decode incoming PingMessage
-        self.parser = PingParser()
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        ## Decoder to split incoming data into PingMessage frames
+        self.decoder = PingFrameDecoder()
+        self.stats = MavlinkDriverStats()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._forwarding: Optional["asyncio.Task[None]"] = None
+        self._last_distance_measurement_time = 0.0
+        self._last_distance_sent_time = 0.0
+        self._rate_window_start = time.perf_counter()
+        self._rate_window_measurements = 0
 
     def set_should_run(self, should_run: bool) -> None:
+        """Enable or disable the driver, this may be called from outside the event loop thread."""
         self.should_run = should_run
+        # when disabled, the timer stops on its next tick
+        if should_run and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._schedule_tick)
 
     @staticmethod
     def distance_message(time_boot_ms: int, distance_cm: int, device_id: int, confidence: int) -> Dict[str, Any]:
@@ -68,15 +96,13 @@ class Ping1DMavlinkDriver:
         )
 
     ## Send a request for distance_simple message to ping device
-    async def send_ping1d_request(
-        self,
-    ) -> None:
+    def send_ping1d_request(self) -> None:
         logger.debug("requesting new data")
         data = PingMessage()
         data.request_id = PING1D_DISTANCE_SIMPLE
         data.src_device_id = 0
         data.pack_msg_data()
-        self.ping1d_io.sendall(data.msg_data)
+        self._send(data.msg_data)
 
     def create_interval_message(self) -> PingMessage:
         interval_message = PingMessage()
@@ -86,72 +112,92 @@ class Ping1DMavlinkDriver:
         interval_message.pack_msg_data()
         return interval_message
 
-    async def drive(self, port: int) -> None:
-
-        ## Messages that have the current distance measurement in the payload
-        distance_messages = [PING1D_DISTANCE, PING1D_DISTANCE_SIMPLE, PING1D_PROFILE]
-
-        last_distance_measurement_time = 0.0
-
-        last_ping_request_time = 0.0
+    def _send(self, data: bytes) -> None:
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.sendto(data)
+
+    def _schedule_tick(self) -> None:
+        if self._timer is None and self._loop is not None and self.transport is not None:
+            self._timer = self._loop.call_later(PING_INTERVAL_S, self._tick)
+
+    def _tick(self) -> None:
+        """Request data from the ping device if no other client is making it send measurements."""
+        self._timer = None
+        if not self.should_run:
+            return
+        now = time.perf_counter()
+        if now > self._last_distance_measurement_time + PING_INTERVAL_S * 2.5:
+            self.send_ping1d_request()
+
+            # deal with possibly lost connection
+            if now > self._last_distance_measurement_time + PING_INTERVAL_S * 10:
+                logger.info("attempting reconnection...")
+                # the proxy may have been restarted, so set the ping interval again
+                self._send(self.create_interval_message().msg_data)
+                self._last_distance_measurement_time = now
+        self._schedule_tick()
+
+    def data_received(self, data: bytes) -> None:
+        if not self.should_run:
+            return
+        received_time = time.perf_counter()
+        self.decoder.feed(data)
+        # decode data from ping device, keeping only the most recent distance
+        latest_measurement = None
+        for frame in self.decoder.frames():
+            measurement = frame.distance()
+            if measurement is not None:
+                latest_measurement = (*measurement, frame.src_device_id)
+                self._count_measurement(received_time)
+        self.stats.dropped_frames = self.decoder.checksum_errors
+        if latest_measurement is None:
+            return
+        self._last_distance_measurement_time = received_time
+
+        # forward to autopilot, skipping measurements arriving faster than needed
+        forwarding = self._forwarding is not None and not self._forwarding.done()
+        if forwarding or received_time - self._last_distance_sent_time < PING_INTERVAL_S * 0.5:
+            self.stats.skipped_measurements += 1
+            return
+        self._last_distance_sent_time = received_time
+        self._forwarding = asyncio.create_task(self._forward(latest_measurement, received_time))
+
+    def _count_measurement(self, received_time: float) -> None:
+        self.stats.measurements += 1
+        self._rate_window_measurements += 1
+        elapsed = received_time - self._rate_window_start
+        if elapsed >= 1.0:
+            self.stats.measurements_per_second = self._rate_window_measurements / elapsed
+            self._rate_window_start = received_time
+            self._rate_window_measurements = 0
+
+    async def _forward(self, measurement: Tuple[int, int, int], received_time: float) -> None:
+        distance, confidence, deviceid = measurement
+        try:
+            await self.send_distance_data(distance, deviceid, confidence)
+            self.stats.record_forward((time.perf_counter() - received_time) * 1000)
+        except Exception as error:
+            self.stats.forward_failures += 1
+            logger.warning(error)
 
+    async def drive(self, port: int) -> None:
+        """Receive data from the PingProxy at localhost:port and forward it until the connection is lost."""
+        self._loop = asyncio.get_running_loop()
         pingserver = ("127.0.0.1", port)
-        self.ping1d_io.connect(pingserver)
-
-        # set the ping interval once at startup
-        # the ping interval may change if another client to the pingproxy requests it
-        interval_message = self.create_interval_message()
-        self.ping1d_io.sendall(interval_message.msg_data)
-
-        while True:
-            if not self.should_run:
-                await asyncio.sleep(1)
-                continue
-            await asyncio.sleep(0.1 * PING_INTERVAL_S)
-            now = time.perf_counter()
-
-            # request data from ping device
-            if now > last_distance_measurement_time + PING_INTERVAL_S * 2.5:
-                if now > last_ping_request_time + PING_INTERVAL_S:
-                    last_ping_request_time = time.perf_counter()
-                    await self.send_ping1d_request()
-
-                # deal with possibly lost connection
-                if now > last_distance_measurement_time + PING_INTERVAL_S * 10:
-                    logger.info("attempting reconnection...")
-                    self.ping1d_io.connect(pingserver)
-                    last_distance_measurement_time = time.perf_counter()
-
-            # read data in from ping device
-            data = b""
-            while select([self.ping1d_io], [], [], 0)[0]:
-                data += self.ping1d_io.recv(4096)
-
-            if not data or now - last_distance_measurement_time < PING_INTERVAL_S * 0.5:
-                # skip decoding data to save cpu if it is arriving too fast
-                self.parser.state = self.parser.WAIT_START
-                continue
-            # decode data from ping device, forward to autopilot
-            new_data_available = False
-            distance = 0
-            deviceid = 0
-            confidence = 0
-
-            for byte in data:
-                try:
-                    if (
-                        self.parser.parse_byte(byte) == PingParser.NEW_MESSAGE
-                        and self.parser.rx_msg.message_id in distance_messages
-                    ):
-                        last_distance_measurement_time = time.perf_counter()
-                        new_data_available = True
-                        distance = self.parser.rx_msg.distance
-                        deviceid = self.parser.rx_msg.src_device_id
-                        confidence = self.parser.rx_msg.confidence
-                except Exception as error:
-                    logger.warning(error)
-            if new_data_available:
-                try:
-                    await self.send_distance_data(distance, deviceid, confidence)
-                except Exception as error:
-                    logger.warning(error)
+        transport, protocol = await self._loop.create_datagram_endpoint(
+            lambda: Ping1DProtocol(self), remote_addr=pingserver
+        )
+        self.transport = transport
+        try:
+            # set the ping interval once at startup
+            # the ping interval may change if another client to the pingproxy requests it
+            self._send(self.create_interval_message().msg_data)
+            if self.should_run:
+                self._schedule_tick()
+            await protocol.closed
+        finally:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self.transport = None
+            transport.close()
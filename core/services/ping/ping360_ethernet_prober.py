@@ -1,11 +1,17 @@
 import asyncio
 import socket
-from typing import List, Set
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 import psutil
 from loguru import logger
 
-from pingutils import PingDeviceDescriptor, PingType
+# UDP port used by the Ping360 to answer discovery messages
+DISCOVERY_PORT = 30303
+DISCOVERY_MESSAGE = b"Discovery"
+# Time, in seconds, that answers to a discovery message are waited for
+DISCOVERY_WINDOW = 1.0
 
 
 def list_ips() -> Set[str]:
@@ -41,53 +47,125 @@ def remove_zeros(ip: str) -> str:
     return new_ip
 
 
-async def find_ping360_ethernet() -> List[PingDeviceDescriptor]:
+@dataclass
+class DiscoveryAnswer:
+    """Answer of a device to the discovery message."""
+
+    # First line of the answer, like "SONAR PING360"
+    device_type: str
+    # ip:port string used to connect to the device
+    discovery_info: str
+
+    @property
+    def is_ping360(self) -> bool:
+        return "PING360" in self.device_type
+
+
+def parse_discovery_response(data: bytes) -> Optional[DiscoveryAnswer]:
     """
-    Return a list of Ping360 devices found in the connected ethernet interfaces
+    Parses the answer of a device to the discovery message, returns None if it is not a valid answer
     """
-    found = []
+    try:
+        decoded_message = data.decode("utf8")
+        device_type, _, _, ip_address, *extras = decoded_message.split("\n")
+        formatted_ip = remove_zeros(ip_address.replace("IP Address:-", "").strip())
+    except ValueError:
+        return None
+    port = "12345"
+    for line in extras:
+        if line.startswith("Port:-"):
+            port = line[6:].strip()
+
+    return DiscoveryAnswer(device_type=device_type, discovery_info=f"{formatted_ip}:{port}")
+
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+    """Collects every answer to the discovery message received on an interface."""
+
+    def __init__(self, ip: str, found: Dict[str, DiscoveryAnswer]) -> None:
+        self.ip = ip
+        self.found = found
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        answer = parse_discovery_response(data)
+        if answer is None:
+            logger.debug(f"Ignoring unexpected discovery data from {addr} at ip {self.ip}: {data!r}")
+            return
+        logger.info(f"Data received: {data.decode('utf8')}")
+        self.found[answer.discovery_info] = answer
+
+    def error_received(self, exc: Exception) -> None:
+        logger.error(f"Error while probing for ping360 at ip {self.ip}: {exc}")
+
+
+async def open_discovery_endpoint(ip: str, found: Dict[str, DiscoveryAnswer]) -> Optional[asyncio.DatagramTransport]:
     loop = asyncio.get_running_loop()
-    for ip in list_ips():
-        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        server.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        # Set a timeout so the socket does not block
-        # indefinitely when trying to receive data.
-        server.settimeout(0.2)
-        try:
-            server.bind((ip, 30303))
-        except OSError:
-            continue
-        message = b"Discovery"
-
-        server.sendto(message, ("255.255.255.255", 30303))
-        await asyncio.sleep(1)
-        try:
-            data = await loop.sock_recv(server, 2048)
-            decoded_message = data.decode("utf8")
-            logger.info(f"Data received: {decoded_message}")
-            device_type, _, _, ip_address, *extras = decoded_message.split("\n")
-            formatted_ip = remove_zeros(ip_address.replace("IP Address:-", "").strip())
-            port = "12345"
-            for line in extras:
-                if line.startswith("Port:-"):
-                    port = line[6:].strip()
-
-            found.append(
-                PingDeviceDescriptor(
-                    ping_type=PingType.PING360 if "PING360" in device_type else PingType.UNKNOWN,
-                    device_id=0,
-                    device_model=0,
-                    device_revision=0,
-                    firmware_version_major=0,
-                    firmware_version_minor=0,
-                    firmware_version_patch=0,
-                    ethernet_discovery_info=f"{formatted_ip}:{port}",
-                    port=None,
-                    driver=None,
-                )
-            )
-        except socket.timeout:
-            logger.debug(f"timed out waiting for ping360 at ip {ip}")
-        except Exception as e:
-            logger.error(f"Error while probing for ping360 at ip {ip}: {e}")
-    return found
+    try:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: DiscoveryProtocol(ip, found), local_addr=(ip, DISCOVERY_PORT), allow_broadcast=True
+        )
+    except OSError as error:
+        logger.debug(f"Unable to listen for ping360 at ip {ip}: {error}")
+        return None
+    return transport
+
+
+async def find_ping360_ethernet(window: float = DISCOVERY_WINDOW) -> List[DiscoveryAnswer]:
+    """
+    Return a list of Ping360 devices found in the connected ethernet interfaces.
+    The discovery message is broadcast on all interfaces at once, and every answer received
+    during "window" seconds is collected.
+    """
+    found: Dict[str, DiscoveryAnswer] = {}
+    endpoints = await asyncio.gather(*(open_discovery_endpoint(ip, found) for ip in list_ips()))
+    transports = [transport for transport in endpoints if transport is not None]
+    try:
+        for transport in transports:
+            transport.sendto(DISCOVERY_MESSAGE, ("255.255.255.255", DISCOVERY_PORT))
+        if transports:
+            await asyncio.sleep(window)
+    finally:
+        for transport in transports:
+            transport.close()
+    return list(found.values())
+
+
+class Ping360EthernetDiscoverer:
+    """
+    Keeps a table of the Ping360 devices found in the ethernet interfaces.
+
+    Devices are removed from the table when they don't answer for DEVICE_TTL seconds.
+    The interval between scans doubles while the devices found are stable, and goes back
+    to the minimum when a device appears or misses an answer.
+    """
+
+    # Time, in seconds, since the last answer of a device before it is considered lost
+    DEVICE_TTL = 20.0
+    MIN_SCAN_INTERVAL = 1.0
+    MAX_SCAN_INTERVAL = 8.0
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.devices: Dict[str, DiscoveryAnswer] = {}
+        self.last_seen: Dict[str, float] = {}
+        self.scan_interval = self.MIN_SCAN_INTERVAL
+
+    async def scan(self) -> Dict[str, DiscoveryAnswer]:
+        """Scan the network once, returning the devices that are currently known, by their discovery info."""
+        found = {answer.discovery_info: answer for answer in await find_ping360_ethernet()}
+        now = self.clock()
+        stable = set(found) == set(self.devices)
+        self.devices.update(found)
+        self.last_seen.update({discovery_info: now for discovery_info in found})
+
+        for discovery_info, last_seen in list(self.last_seen.items()):
+            if now - last_seen > self.DEVICE_TTL:
+                logger.info(f"Ping360 at {discovery_info} did not answer for {self.DEVICE_TTL} seconds.")
+                del self.devices[discovery_info]
+                del self.last_seen[discovery_info]
+
+        if stable:
+            self.scan_interval = min(self.scan_interval * 2, self.MAX_SCAN_INTERVAL)
+        else:
+            self.scan_interval = self.MIN_SCAN_INTERVAL
+        return dict(self.devices)
@@ -1,15 +1,32 @@
+import asyncio
+import time
+from pathlib import Path
 from typing import Any, Dict, Optional
 
 from bridges.bridges import Bridge
 from bridges.serialhelper import Baudrate, set_low_latency
 from brping import PingDevice
 from brping.definitions import COMMON_DEVICE_INFORMATION
+from commonwealth.settings.manager import Manager
 from loguru import logger
 
 from exceptions import InvalidDeviceDescriptor, NoUDPPortAssignedToPingDriver
-from pingutils import PingDeviceDescriptor
+from pingutils import PingDeviceDescriptor, port_identity
+from settings import BaudrateSpecV2, SettingsV2
 from typedefs import DriverStatus
 
+SERVICE_NAME = "ping"
+
+USERDATA = Path("/usr/blueos/userdata/")
+
+# Ping1D hangs with a baudrate bigger than 3M
+MAX_BAUDRATE = Baudrate.b3000000
+# Requests sent to check a baudrate while searching, and how many of them may fail
+SEARCH_ATTEMPTS = 10
+SEARCH_MAX_FAILURES = 1
+# A baudrate that already worked for the device is checked with fewer requests, and none may fail
+KNOWN_BAUD_ATTEMPTS = 3
+
 
 class PingDriver:
     def __init__(self, ping: PingDeviceDescriptor, port: Optional[int]) -> None:
@@ -19,38 +36,68 @@ class PingDriver:
         self.ping.driver = self
         self.baud: Optional[Baudrate] = None
         self.driver_status = DriverStatus(udp_port=port, mavlink_driver_enabled=False)
+        # load settings
+        self.manager = Manager(SERVICE_NAME, SettingsV2, USERDATA / "settings" / SERVICE_NAME)
 
-    def detect_highest_baud(self) -> Baudrate:
-        """Tries to communicate in increasingly high baudrates up to 4M
-        returns the highest one with at least 90% success rate.
-        """
-        failure_threshold = 0.1  # allow up to 10% failure rate
-        attempts = 10  # try up to 10 times per baudrate
-        max_failures = attempts * failure_threshold
-        last_valid_baud = Baudrate.b115200
+    def load_known_baud(self) -> Optional[Baudrate]:
+        if self.ping.port is None:
+            return None
+        self.manager.load()  # re-load as other sensors could have changed it
+        hwid = port_identity(self.ping.port)
+        for spec in self.manager.settings.known_baudrates:
+            if spec.hwid == hwid and spec.baudrate in list(Baudrate):
+                return Baudrate(spec.baudrate)
+        return None
 
+    def save_known_baud(self, baud: Baudrate) -> None:
         if self.ping.port is None:
-            raise InvalidDeviceDescriptor("PingDeviceDescriptor has no usable port")
+            return
+        self.manager.load()  # re-load as other sensors could have changed it
+        hwid = port_identity(self.ping.port)
+        known_baudrates = [spec for spec in self.manager.settings.known_baudrates if spec.hwid != hwid]
+        self.manager.settings.known_baudrates = [*known_baudrates, BaudrateSpecV2.new(hwid, int(baud))]
+        self.manager.save()
 
-        for baud in Baudrate:
-            # Ping1D hangs with a baudrate bigger than 3M, going to ignore it for now
-            if baud > 3000000:
-                continue
-            logger.debug(f"Trying baud {baud}...")
-            failures = 0
-            ping = PingDevice()
-            ping.connect_serial(self.ping.port.device, baud)
+    def baud_is_valid(self, baud: Baudrate, attempts: int, max_failures: int) -> bool:
+        """Checks if the device answers at least attempts - max_failures requests at this baudrate."""
+        assert self.ping.port is not None
+        logger.debug(f"Trying baud {baud}...")
+        failures = 0
+        ping = PingDevice()
+        # Connecting sends the sequence used by the device to detect the baudrate
+        ping.connect_serial(self.ping.port.device, baud)
+        try:
             for _ in range(attempts):
                 device_info = ping.request(COMMON_DEVICE_INFORMATION, timeout=0.1)
                 if device_info is None:
                     failures += 1
                     if failures > max_failures:
                         break  # there's no pointing in testing again if we already failed.
-            if failures <= max_failures:
-                last_valid_baud = baud
-            logger.debug(f"Baudrate {baud} is {'valid' if baud==last_valid_baud else 'invalid'}")
-        logger.info(f"Highest baudrate detected: {last_valid_baud}")
-        return last_valid_baud
+        finally:
+            ping.iodev.close()
+        logger.debug(f"Baudrate {baud} is {'valid' if failures <= max_failures else 'invalid'}")
+        return failures <= max_failures
+
+    def detect_highest_baud(self) -> Baudrate:
+        """Tries the last baudrate known to work with the device first, otherwise tries decreasingly
+        high baudrates from 3M and returns the first one with at least 90% success rate.
+        """
+        if self.ping.port is None:
+            raise InvalidDeviceDescriptor("PingDeviceDescriptor has no usable port")
+
+        known_baud = self.load_known_baud()
+        if known_baud is not None and self.baud_is_valid(known_baud, KNOWN_BAUD_ATTEMPTS, 0):
+            logger.info(f"Known baudrate is still valid: {known_baud}")
+            return known_baud
+
+        # Going from the highest baudrate down, the search can stop at the first valid one
+        for baud in sorted((baud for baud in Baudrate if baud <= MAX_BAUDRATE), reverse=True):
+            if self.baud_is_valid(baud, SEARCH_ATTEMPTS, SEARCH_MAX_FAILURES):
+                logger.info(f"Highest baudrate detected: {baud}")
+                self.save_known_baud(baud)
+                return baud
+        logger.info(f"No valid baudrate detected, using {Baudrate.b115200}")
+        return Baudrate.b115200
 
     async def start(self) -> None:
         """Starts the driver"""
@@ -60,7 +107,13 @@ class PingDriver:
         if self.port is None:
             raise NoUDPPortAssignedToPingDriver("PingDriver attempted to stash with no UDP port.")
 
-        self.baud = self.detect_highest_baud()
+        # Detection talks to the serial port, so it is done outside of the event loop
+        start_time = time.perf_counter()
+        baud = await asyncio.get_running_loop().run_in_executor(None, self.detect_highest_baud)
+        self.baud = baud
+        self.driver_status.baudrate = int(baud)
+        self.driver_status.baud_detection_time_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(f"Baudrate {baud} found in {self.driver_status.baud_detection_time_ms:.0f} ms.")
         # Do a ping connection to set the baudrate
         PingDevice().connect_serial(self.ping.port.device, self.baud)
         set_low_latency(self.ping.port)
@@ -0,0 +1,117 @@
+import struct
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+from brping import PING1D_DISTANCE, PING1D_DISTANCE_SIMPLE, PING1D_PROFILE, PingMessage
+
+SYNC = b"BR"
+HEADER_LENGTH = PingMessage.headerLength
+CHECKSUM_LENGTH = PingMessage.checksumLength
+# Header fields after the sync bytes: payload_length, message_id, src_device_id, dst_device_id
+HEADER_FIELDS = struct.Struct("<HHBB")
+CHECKSUM = struct.Struct("<H")
+
+# Every Ping1D distance message starts with the distance (u32) and its confidence,
+# which is an u8 for PING1D_DISTANCE_SIMPLE and an u16 for the others
+DISTANCE_SIMPLE_FIELDS = struct.Struct("<IB")
+DISTANCE_FIELDS = struct.Struct("<IH")
+DISTANCE_MESSAGES = {PING1D_DISTANCE_SIMPLE, PING1D_DISTANCE, PING1D_PROFILE}
+
+
+@dataclass
+class PingFrame:
+    message_id: int
+    src_device_id: int
+    dst_device_id: int
+    # View over the decoder buffer, only valid until more data is added to the decoder
+    payload: memoryview
+
+    def distance(self) -> Optional[Tuple[int, int]]:
+        """Return (distance, confidence) if this is one of the Ping1D distance messages."""
+        if self.message_id not in DISTANCE_MESSAGES:
+            return None
+        fields = DISTANCE_SIMPLE_FIELDS if self.message_id == PING1D_DISTANCE_SIMPLE else DISTANCE_FIELDS
+        if len(self.payload) < fields.size:
+            return None
+        distance, confidence = fields.unpack_from(self.payload)
+        return distance, confidence
+
+
+class PingFrameDecoder:
+    """Splits a stream of Ping protocol bytes into complete, checksum-validated frames.
+
+    Data is kept in a preallocated buffer, which is compacted only when there is no room left at its end,
+    so partial frames are kept between calls to feed. The sync header is searched and the checksum computed with
+    bulk operations over the buffer, instead of going through a parser byte by byte.
+    """
+
+    def __init__(self, capacity: int = 65536) -> None:
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.frames_decoded = 0
+        self.dropped_bytes = 0
+        self.checksum_errors = 0
+
+    @property
+    def pending(self) -> int:
+        return self._end - self._start
+
+    def _make_room(self, size: int) -> None:
+        capacity = len(self._buffer)
+        if self._end + size <= capacity:
+            return
+        pending = self._end - self._start
+        if pending + size > capacity:
+            # Not enough room even after compacting, older bytes are dropped
+            drop = min(pending, pending + size - capacity)
+            self._start += drop
+            self.dropped_bytes += drop
+            pending -= drop
+        self._buffer[0:pending] = self._buffer[self._start : self._end]
+        self._start = 0
+        self._end = pending
+
+    def feed(self, data: bytes) -> None:
+        if len(data) > len(self._buffer):
+            self.dropped_bytes += len(data) - len(self._buffer)
+            data = data[-len(self._buffer) :]
+        self._make_room(len(data))
+        self._view[self._end : self._end + len(data)] = data
+        self._end += len(data)
+
+    def frames(self) -> Iterator[PingFrame]:
+        buffer = self._buffer
+        while True:
+            sync = buffer.find(SYNC, self._start, self._end)
+            if sync < 0:
+                # A trailing "B" may be the start of the next header
+                keep = 1 if self._end > self._start and buffer[self._end - 1] == SYNC[0] else 0
+                self.dropped_bytes += self._end - keep - self._start
+                self._start = self._end - keep
+                return
+            self.dropped_bytes += sync - self._start
+            self._start = sync
+            if self._end - sync < HEADER_LENGTH:
+                return
+
+            payload_length, message_id, src_device_id, dst_device_id = HEADER_FIELDS.unpack_from(buffer, sync + 2)
+            payload_end = sync + HEADER_LENGTH + payload_length
+            frame_end = payload_end + CHECKSUM_LENGTH
+            if frame_end - sync > len(buffer):
+                # Can't be a valid frame, search for the next header
+                self._start = sync + 1
+                continue
+            if frame_end > self._end:
+                return
+
+            (checksum,) = CHECKSUM.unpack_from(buffer, payload_end)
+            if sum(self._view[sync:payload_end]) & 0xFFFF != checksum:
+                self.checksum_errors += 1
+                self._start = sync + 1
+                continue
+
+            self._start = frame_end
+            self.frames_decoded += 1
+            yield PingFrame(message_id, src_device_id, dst_device_id, self._view[sync + HEADER_LENGTH : payload_end])
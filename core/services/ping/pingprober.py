@@ -1,35 +1,74 @@
-from typing import Any, Callable, Coroutine, Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Any, Callable, Coroutine, Dict, Optional
 
 from brping import PingDevice
 from brping.definitions import COMMON_DEVICE_INFORMATION, PING1D_FIRMWARE_VERSION
 from loguru import logger
 from serial.tools.list_ports_linux import SysFS
 
-from pingutils import PingDeviceDescriptor, PingType
+from pingutils import PingDeviceDescriptor, PingType, port_identity
+
+# Maximum time, in seconds, that the detection of a single port can take
+PROBE_TIMEOUT = 10.0
+# Maximum time, in seconds, that a single read or write can block the worker detecting a port
+SERIAL_TIMEOUT = 1.0
 
 
 class PingProber:
     """PingProber is responsible for identifying Ping-enabled devices on serial ports."""
 
+    def __init__(self, max_workers: int = 4) -> None:
+        # Serial communication is blocking, so it is done in worker threads to keep the event loop free
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ping-prober")
+        # Devices already identified, by port identity, so re-plugged devices don't need to be detected again
+        self.known_devices: Dict[str, PingDeviceDescriptor] = {}
+        # Serial connections of the detections in progress, by port path, so they can be aborted
+        self.connections: Dict[str, PingDevice] = {}
+
     async def probe(self, port: SysFS) -> Optional[PingDeviceDescriptor]:
         """Attempts to communicate via Ping Protocol at port "port".
         Calls on_ping_found callback when a ping device is found."""
         logger.info(f"Probing {port}")
-        detected_device = self.detect_device(port)
+        identity = port_identity(port)
+        known_device = self.known_devices.get(identity)
+        if known_device is not None:
+            logger.info(f"Device {port.hwid} was already identified as {known_device.ping_type}.")
+            detected_device: Optional[PingDeviceDescriptor] = replace(known_device, port=port, driver=None)
+        else:
+            detected_device = await self.detect_device_in_worker(port)
         if detected_device:
+            self.known_devices[identity] = detected_device
             await self.ping_found_callback(detected_device)
         return detected_device
 
+    async def detect_device_in_worker(self, port: SysFS) -> Optional[PingDeviceDescriptor]:
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self.detect_device, port), timeout=PROBE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out after {PROBE_TIMEOUT} seconds while probing {port.hwid}.")
+            self.abort_detection(port)
+            return None
+
+    def abort_detection(self, port: SysFS) -> None:
+        """Unblock the worker detecting the port, which then closes it and becomes free for other ports."""
+        ping = self.connections.get(port.device)
+        if ping is not None:
+            ping.iodev.cancel_read()
+            ping.iodev.cancel_write()
+
     def on_ping_found(self, callback: Callable[[PingDeviceDescriptor], Coroutine[Any, Any, None]]) -> None:
         self.ping_found_callback = callback
 
     @staticmethod
-    def legacy_detect_ping1d(port: SysFS) -> Optional[PingDeviceDescriptor]:
+    def legacy_detect_ping1d(ping: PingDevice, port: SysFS) -> Optional[PingDeviceDescriptor]:
         """
         Detects Ping1D devices without DEVICE_INFORMATION implemented
         """
-        ping = PingDevice()
-        ping.connect_serial(port.device, 115200)
         firmware_version = ping.request(PING1D_FIRMWARE_VERSION)
         if firmware_version is None:
             return None
@@ -59,6 +98,8 @@ class PingProber:
         try:
             ping = PingDevice()
             ping.connect_serial(port.device, 115200)
+            ping.iodev.timeout = SERIAL_TIMEOUT
+            ping.iodev.write_timeout = SERIAL_TIMEOUT
 
         except Exception as exception:
             if exception.args[0] and "Errno 16" in exception.args[0]:
@@ -72,12 +113,23 @@ class PingProber:
             )
             return None
 
+        self.connections[port.device] = ping
+        try:
+            return self.identify_device(ping, port)
+        except Exception as exception:
+            logger.info(f"Failed to identify the device at {port.hwid}: {exception}")
+            return None
+        finally:
+            del self.connections[port.device]
+            ping.iodev.close()
+
+    def identify_device(self, ping: PingDevice, port: SysFS) -> Optional[PingDeviceDescriptor]:
         if not ping.initialize():
             return None
 
         device_info = ping.request(COMMON_DEVICE_INFORMATION)
         if not device_info:
-            return self.legacy_detect_ping1d(port)
+            return self.legacy_detect_ping1d(ping, port)
 
         if device_info.device_type not in [PingType.PING1D, PingType.PING360]:
             logger.warning(
@@ -64,6 +64,13 @@ FW: v{self.firmware_version_major}.{self.firmware_version_minor}.{self.firmware_
 port: {self.get_hw_or_eth_info()}"""
 
 
+def port_identity(port: SysFS) -> str:
+    """Identifies the device at a serial port in a way that is kept when it is re-plugged elsewhere."""
+    if port.serial_number:
+        return f"{port.vid}:{port.pid}:{port.serial_number}"
+    return str(port.hwid)
+
+
 def udp_port_is_in_use(port: int) -> bool:
     return any(
         conn.laddr.port == port and conn.type == socket.SocketKind.SOCK_DGRAM for conn in psutil.net_connections()
@@ -6,12 +6,28 @@ import serial.tools.list_ports
 from loguru import logger
 from serial.tools.list_ports_linux import SysFS
 
-from ping360_ethernet_prober import find_ping360_ethernet
-from pingutils import PingDeviceDescriptor
+from ping360_ethernet_prober import DiscoveryAnswer, Ping360EthernetDiscoverer
+from pingutils import PingDeviceDescriptor, PingType, port_identity
 
 MAX_ATTEMPTS = 3
 
 
+def ethernet_ping_descriptor(answer: DiscoveryAnswer) -> PingDeviceDescriptor:
+    return PingDeviceDescriptor(
+        ping_type=PingType.PING360 if answer.is_ping360 else PingType.UNKNOWN,
+        device_id=0,
+        device_model=0,
+        device_revision=0,
+        firmware_version_major=0,
+        firmware_version_minor=0,
+        firmware_version_patch=0,
+        ethernet_discovery_info=answer.discovery_info,
+        port=None,
+        driver=None,
+    )
+
+
+# pylint: disable=too-many-instance-attributes
 class PortWatcher:
     """Watches the Serial ports on the system.
     Calls set_prober when a port is found, and port_post_callback when a port is no longer present."""
@@ -30,7 +46,10 @@ class PortWatcher:
             [Any], Coroutine[Any, SysFS, Optional[PingDeviceDescriptor]]
         ] = found_callback
         self.port_lost_callback: Optional[Callable[[SysFS], None]] = None
-        self.probe_attempts_counter: Dict[SysFS, int] = {}
+        # Attempts are counted by port identity, so devices that are not pings are not probed again when re-plugged
+        self.probe_attempts_counter: Dict[str, int] = {}
+        self.probing_tasks: Dict[SysFS, "asyncio.Task[None]"] = {}
+        self.ping360_discoverer = Ping360EthernetDiscoverer()
 
     def set_port_post_callback(self, callback: Callable[[SysFS], None]) -> None:
         self.port_lost_callback = callback
@@ -39,9 +58,9 @@ class PortWatcher:
         """A port should be probed if there hasn't been MAX_ATTEMPTS to probe it yet
         and it is caught by our filters
         """
-        if port in self.known_ports:
+        if port in self.known_ports or port in self.probing_tasks:
             return False
-        if self.probe_attempts_counter.get(port, 0) >= MAX_ATTEMPTS:
+        if self.probe_attempts_counter.get(port_identity(port), 0) >= MAX_ATTEMPTS:
             return False
         return True
 
@@ -51,19 +70,21 @@ class PortWatcher:
         if port in self.known_ports:
             warn(f"Developer error: Port is already known, but being probed again: {port}")
             return
-        attempts = self.probe_attempts_counter.get(port, 0)
+        identity = port_identity(port)
+        attempts = self.probe_attempts_counter.get(identity, 0)
         good_port = await self.probe_callback(port)
         if good_port:
             self.known_ports.add(port)
+            # Only failed attempts count, so known devices are found again when re-plugged
+            self.probe_attempts_counter.pop(identity, None)
+            return
         attempts += 1
-        self.probe_attempts_counter[port] = attempts
+        self.probe_attempts_counter[identity] = attempts
         if attempts == MAX_ATTEMPTS:
             logger.info(f"Max number of probing attempts reached for {port}. Giving up.")
 
     async def add_ping360(self) -> None:
-        devices_list = await find_ping360_ethernet()
-        # find_ping360_ethernet sets the discovery info, but cast it so mypy doesn't complain
-        ip_devices = {str(device.ethernet_discovery_info): device for device in devices_list}
+        ip_devices = await self.ping360_discoverer.scan()
         ips = set(ip_devices)
         lost_ips = self.known_ips - ips
         new_ips = ips - self.known_ips
@@ -73,10 +94,21 @@ class PortWatcher:
             self.known_ips.remove(ip)
         for ip in new_ips:
             self.known_ips.add(ip)
-            await self.ethernet_ping_found_callback(ip_devices[ip])
+            await self.ethernet_ping_found_callback(ethernet_ping_descriptor(ip_devices[ip]))
+
+    async def watch_ping360(self) -> None:
+        """Watch for Ping360 devices in the ethernet interfaces, at the discoverer's own pace."""
+        while True:
+            try:
+                await self.add_ping360()
+            except Exception as error:
+                logger.error(f"Error while looking for ethernet Ping360 devices: {error}")
+            await asyncio.sleep(self.ping360_discoverer.scan_interval)
 
     async def start_watching(self) -> None:
         """Start watching for plugged/unplugged serial devices in the system."""
+        # Ethernet discovery runs separately, so the serial ports are checked every second
+        self.ping360_watcher = asyncio.create_task(self.watch_ping360())
         # TODO: try https://pypi.org/project/inotify/
         while True:
             ports = serial.tools.list_ports.comports()
@@ -85,7 +117,11 @@ class PortWatcher:
             found_ports = set()
             for port in ports:
                 if self.port_should_be_probed(port):
-                    await self.probe_port(port)
+                    # Probes run in the background, so a slow port does not hold the others
+                    self.probing_tasks[port] = asyncio.create_task(self.probe_port(port))
+                    self.probing_tasks[port].add_done_callback(
+                        lambda _task, port=port: self.probing_tasks.pop(port, None)  # type: ignore
+                    )
                 found_ports.add(port)
 
             missing = self.known_ports - found_ports
@@ -94,5 +130,4 @@ class PortWatcher:
                 self.known_ports.remove(port)
                 if self.port_lost_callback is not None:
                     self.port_lost_callback(port)
-            await self.add_ping360()
             await asyncio.sleep(1)
@@ -34,3 +34,36 @@ class SettingsV1(settings.BaseSettings):
             super().migrate(data)
 
         data["VERSION"] = SettingsV1.VERSION
+
+
+class BaudrateSpecV2(pykson.JsonObject):
+    hwid = pykson.StringField()
+    baudrate = pykson.IntegerField()
+
+    def __str__(self) -> str:
+        return f"{self.hwid} - {self.baudrate}"
+
+    @staticmethod
+    def new(hwid: str, baudrate: int) -> "BaudrateSpecV2":
+        return BaudrateSpecV2(hwid=hwid, baudrate=baudrate)
+
+
+class SettingsV2(SettingsV1):
+    VERSION = 2
+    # last baudrate that worked for each serial device, so the search can be skipped
+    known_baudrates = pykson.ObjectListField(BaudrateSpecV2)
+
+    def __init__(self, *args: str, **kwargs: int) -> None:
+        super().__init__(*args, **kwargs)
+
+        self.VERSION = SettingsV2.VERSION
+
+    def migrate(self, data: Dict[str, Any]) -> None:
+        if data["VERSION"] == SettingsV2.VERSION:
+            return
+
+        if data["VERSION"] < SettingsV2.VERSION:
+            super().migrate(data)
+
+        data["VERSION"] = SettingsV2.VERSION
+        data["known_baudrates"] = []
@@ -0,0 +1,56 @@
+from typing import List
+
+import pytest
+
+import ping360_ethernet_prober
+from ping360_ethernet_prober import (
+    DiscoveryAnswer,
+    Ping360EthernetDiscoverer,
+    parse_discovery_response,
+)
+
+DISCOVERY_RESPONSE = b"SONAR PING360\nBlue Robotics\nMAC Address:- 54-10-EC-79-7D-D1\nIP Address:- 192.168.002.002\n"
+
+
+def test_parse_discovery_response() -> None:
+    device = parse_discovery_response(DISCOVERY_RESPONSE)
+    assert device is not None
+    assert device.is_ping360
+    assert device.discovery_info == "192.168.2.2:12345"
+
+    device = parse_discovery_response(DISCOVERY_RESPONSE + b"Port:- 9092\n")
+    assert device is not None
+    assert device.discovery_info == "192.168.2.2:9092"
+
+    assert parse_discovery_response(b"Discovery") is None
+    assert parse_discovery_response(b"\xff\xfe") is None
+
+
+@pytest.mark.asyncio
+async def test_discoverer_expires_devices_and_backs_off(monkeypatch: pytest.MonkeyPatch) -> None:
+    device = parse_discovery_response(DISCOVERY_RESPONSE)
+    assert device is not None
+    answers: List[List[DiscoveryAnswer]] = []
+    now = [0.0]
+
+    async def fake_find() -> List[DiscoveryAnswer]:
+        return answers.pop(0)
+
+    monkeypatch.setattr(ping360_ethernet_prober, "find_ping360_ethernet", fake_find)
+
+    discoverer = Ping360EthernetDiscoverer(clock=lambda: now[0])
+    answers = [[device], [device], [device], [device], [device]]
+    assert list(await discoverer.scan()) == ["192.168.2.2:12345"]
+    assert discoverer.scan_interval == discoverer.MIN_SCAN_INTERVAL
+    for _ in range(4):
+        await discoverer.scan()
+    assert discoverer.scan_interval == discoverer.MAX_SCAN_INTERVAL
+
+    # A missed answer is not enough to lose the device, but scans get frequent again
+    now[0] += 1
+    answers = [[], []]
+    assert list(await discoverer.scan()) == ["192.168.2.2:12345"]
+    assert discoverer.scan_interval == discoverer.MIN_SCAN_INTERVAL
+
+    now[0] += discoverer.DEVICE_TTL
+    assert not await discoverer.scan()
@@ -0,0 +1,57 @@
+import random
+from typing import List
+
+from brping import PingParser
+
+from frame_samples import distance_simple_message, profile_message
+from pingframes import PingFrameDecoder
+
+
+def decode(decoder: PingFrameDecoder) -> List[int]:
+    distances = []
+    for frame in decoder.frames():
+        measurement = frame.distance()
+        if measurement is not None:
+            distances.append(measurement[0])
+    return distances
+
+
+def test_frames_split_across_reads() -> None:
+    random.seed(42)
+    messages = [profile_message(distance, 100) for distance in range(50)]
+    messages += [distance_simple_message(distance, 50) for distance in range(50, 100)]
+    stream = b"garbage BR".join(messages)
+
+    decoder = PingFrameDecoder(capacity=1024)
+    distances = []
+    position = 0
+    while position < len(stream):
+        chunk_size = random.randint(1, 300)
+        decoder.feed(stream[position : position + chunk_size])
+        distances += decode(decoder)
+        position += chunk_size
+
+    assert distances == list(range(100))
+    assert decoder.checksum_errors == 0
+    assert decoder.pending == 0
+
+
+def test_corrupted_frame_is_skipped() -> None:
+    corrupted = bytearray(distance_simple_message(1, 10))
+    corrupted[10] ^= 0xFF
+    decoder = PingFrameDecoder()
+    decoder.feed(bytes(corrupted) + distance_simple_message(2, 10))
+    assert decode(decoder) == [2]
+    assert decoder.checksum_errors == 1
+
+
+def test_matches_ping_parser() -> None:
+    random.seed(0)
+    stream = b"".join(profile_message(distance, 100) for distance in range(10))
+
+    parser = PingParser()
+    parsed = [parser.rx_msg.distance for byte in stream if parser.parse_byte(byte) == PingParser.NEW_MESSAGE]
+
+    decoder = PingFrameDecoder()
+    decoder.feed(stream)
+    assert decode(decoder) == parsed
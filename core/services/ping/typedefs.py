@@ -5,9 +5,32 @@ from pydantic import BaseModel
 from pingutils import PingDeviceDescriptor
 
 
+class MavlinkDriverStats(BaseModel):
+    measurements: int = 0
+    measurements_per_second: float = 0.0
+    # Distance measurements not forwarded as they arrived faster than the forwarding rate
+    skipped_measurements: int = 0
+    # Frames discarded due to an invalid checksum
+    dropped_frames: int = 0
+    forwarded: int = 0
+    forward_failures: int = 0
+    # Time from the sonar reply arrival to the DISTANCE_SENSOR message being sent
+    last_forward_latency_ms: float = 0.0
+    average_forward_latency_ms: float = 0.0
+
+    def record_forward(self, latency_ms: float) -> None:
+        self.forwarded += 1
+        self.last_forward_latency_ms = latency_ms
+        self.average_forward_latency_ms += (latency_ms - self.average_forward_latency_ms) / self.forwarded
+
+
 class DriverStatus(BaseModel):
     udp_port: Optional[int]
     mavlink_driver_enabled: bool
+    mavlink_driver_stats: Optional[MavlinkDriverStats] = None
+    baudrate: Optional[int] = None
+    # Time spent finding the baudrate when the driver was started
+    baud_detection_time_ms: Optional[float] = None
 
     @staticmethod
     def unknown() -> "DriverStatus":